@@ -0,0 +1,3 @@
+"""
+Benchmarks for the HAR replay and assertion hot path.
+"""
@@ -0,0 +1,383 @@
+"""
+Benchmark parsing, sending and asserting synthetic HAR files.
+
+Run against a mocked `requests` backend and the bundled `test_har_drf` Django
+ReST Framework app::
+
+  $ python -m benchmarks.har_bench --output results.json
+  $ python -m benchmarks.har_bench --compare results.json
+
+Results are written as JSON so that runs may be compared to catch
+regressions.
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import datetime
+import platform
+import tempfile
+import itertools
+import timeit
+import tracemalloc
+import unittest
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "test_har_drf.settings")
+
+import test_har  # noqa
+
+
+def make_content(body_size, depth):
+    """
+    Return a JSON value nested to the depth with `body_size` leaf items.
+    """
+    content = [
+        dict(id=idx, name='item-{0}'.format(idx), active=bool(idx % 2))
+        for idx in range(body_size)]
+    for level in range(depth - 1):
+        content = dict(level=level, items=content)
+    return dict(count=body_size, results=content)
+
+
+def make_har(entries, headers, body_size, depth):
+    """
+    Return a synthetic HAR of GET entries with JSON response bodies.
+    """
+    har_entries = []
+    for idx in range(entries):
+        response_headers = [
+            dict(name='X-Bench-{0}'.format(header), value=str(header))
+            for header in range(headers)]
+        har_entries.append(dict(
+            request=dict(
+                method='GET',
+                url='mock://bench.example.com/items/{0}/'.format(idx),
+                headers=[dict(name='Accept', value='application/json')]),
+            response=dict(
+                status=200, statusText='OK', headers=response_headers,
+                content=dict(
+                    mimeType='application/json',
+                    text=make_content(body_size, depth)))))
+    return dict(log=dict(version='1.2', entries=har_entries))
+
+
+class HARBenchmark(object):
+    """
+    Measure one scenario as a test so that backend fixtures are set up.
+    """
+
+    scenario = None
+    har_path = None
+    result = None
+
+    def setUpBenchmark(self):
+        """
+        Backend specific setup before the HAR is sent.
+        """
+
+    def runTest(self):
+        """
+        Parse, compile, send and assert the scenario HAR, timing each step.
+        """
+        self.setUpBenchmark()
+        cache = test_har.HARCache()
+
+        start = timeit.default_timer()
+        cache.load(self.har_path)
+        parsed = timeit.default_timer()
+        plan = cache.compile(self.har_path, self.JSON_MIME_TYPE_RE)
+        compiled = timeit.default_timer()
+        cache.load(self.har_path)
+        hit = timeit.default_timer() - compiled
+
+        request_time = assert_time = 0
+        for entry_plan in plan:
+            sent = timeit.default_timer()
+            response = self.request_har(**entry_plan.request_kwargs())
+            checked = timeit.default_timer()
+            failures = self.check_har_entry(entry_plan, response)
+            request_time += checked - sent
+            assert_time += timeit.default_timer() - checked
+            if failures:
+                raise test_har.HAREntryAssertionError(response, failures)
+
+        type(self).result = dict(
+            parse=parsed - start, hit=hit, compile=compiled - parsed,
+            request=request_time, check=assert_time,
+            total=timeit.default_timer() - start)
+
+
+def run_case(case_class, memory=False):
+    """
+    Run the benchmark test case and return its measurements.
+    """
+    if memory:
+        tracemalloc.start()
+    try:
+        with open(os.devnull, 'w') as devnull:
+            result = unittest.TextTestRunner(
+                stream=devnull, verbosity=0).run(case_class())
+        if memory:
+            peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        if memory:
+            tracemalloc.stop()
+    if not result.wasSuccessful():
+        for _, error in result.errors + result.failures:
+            sys.stderr.write(error)
+        raise RuntimeError('Benchmark scenario failed')
+    if memory:
+        return peak
+    return case_class.result
+
+
+def requests_case(scenario, har_path, har):
+    """
+    Return a benchmark case for the requests backend using `requests_mock`.
+    """
+    import requests_mock
+    from test_har import requests_har
+
+    class RequestsBenchmark(HARBenchmark, requests_har.HARTestCase):
+
+        def setUpBenchmark(self):
+            mocker = requests_mock.Mocker()
+            mocker.start()
+            self.addCleanup(mocker.stop)
+            for entry in har["log"]["entries"]:
+                response = entry["response"]
+                headers = test_har.array_to_dict(response["headers"])
+                headers['Content-Type'] = response["content"]["mimeType"]
+                mocker.get(
+                    entry["request"]["url"], status_code=response["status"],
+                    reason=response["statusText"], headers=headers,
+                    text=json.dumps(response["content"]["text"]))
+
+    RequestsBenchmark.scenario = scenario
+    RequestsBenchmark.har_path = har_path
+    return RequestsBenchmark
+
+
+def drf_case(scenario, har_path, har):
+    """
+    Return a benchmark case for the DRF backend using `test_har_drf`.
+    """
+    from django.contrib.auth import models
+    from test_har import django_rest_har
+
+    class DRFBenchmark(HARBenchmark, django_rest_har.HARTestCase):
+
+        def setUpBenchmark(self):
+            # Create the users in the order the view lists them
+            joined = datetime.datetime(
+                2017, 1, 1, tzinfo=datetime.timezone.utc)
+            users = har["log"]["entries"][0]["response"]["content"]["text"]
+            for user in users:
+                models.User.objects.create(date_joined=joined, **user)
+                joined -= datetime.timedelta(seconds=1)
+
+    DRFBenchmark.scenario = scenario
+    DRFBenchmark.har_path = har_path
+    return DRFBenchmark
+
+
+def make_drf_har(entries, headers, body_size, depth):
+    """
+    Return a HAR listing `body_size` users from the `test_har_drf` app.
+
+    Depth is not applicable as the user serializer is flat.
+    """
+    users = [
+        dict(username='user-{0}'.format(idx),
+             email='user-{0}@example.com'.format(idx))
+        for idx in range(body_size)]
+    return dict(log=dict(version='1.2', entries=[
+        dict(
+            request=dict(
+                method='GET', url='/users/',
+                headers=[dict(name='Accept', value='application/json')] + [
+                    dict(name='X-Bench-{0}'.format(header),
+                         value=str(header))
+                    for header in range(headers)]),
+            response=dict(
+                status=200, statusText='OK',
+                headers=[dict(name='Allow', value='GET, POST, HEAD, OPTIONS')],
+                content=dict(mimeType='application/json', text=users)))
+        for _ in range(entries)]))
+
+
+BACKENDS = dict(
+    requests=(make_har, requests_case),
+    drf=(make_drf_har, drf_case),
+)
+
+
+def run(args):
+    """
+    Run all the scenarios and return the results.
+    """
+    results = []
+    tmp = tempfile.mkdtemp()
+    try:
+        for backend, entries, headers, body_size, depth in itertools.product(
+                args.backends, args.entries, args.headers, args.body_sizes,
+                args.depths):
+            if backend == 'drf' and depth != args.depths[0]:
+                continue
+            scenario = dict(
+                backend=backend, entries=entries, headers=headers,
+                body_size=body_size, depth=depth)
+            make, make_case = BACKENDS[backend]
+            har = make(entries, headers, body_size, depth)
+            har_path = os.path.join(tmp, 'bench.har.json')
+            with open(har_path, 'w') as har_file:
+                json.dump(har, har_file)
+            case_class = make_case(scenario, har_path, har)
+
+            timings = [run_case(case_class) for _ in range(args.repeat)]
+            best = {
+                key: min(timing[key] for timing in timings)
+                for key in timings[0]}
+            result = dict(
+                scenario, har_bytes=os.path.getsize(har_path),
+                parse_ms=best['parse'] * 1000,
+                hit_ms=best['hit'] * 1000,
+                compile_ms=best['compile'] * 1000,
+                request_ms_per_entry=best['request'] * 1000 / entries,
+                check_ms_per_entry=best['check'] * 1000 / entries,
+                total_ms=best['total'] * 1000,
+                peak_bytes=run_case(case_class, memory=True))
+            results.append(result)
+            sys.stdout.write(format_result(result) + '\n')
+            sys.stdout.flush()
+    finally:
+        shutil.rmtree(tmp)
+    return results
+
+
+def scenario_key(result):
+    """
+    Return the key used to match results between runs.
+    """
+    return tuple(result[key] for key in (
+        'backend', 'entries', 'headers', 'body_size', 'depth'))
+
+
+def format_result(result):
+    """
+    Format one result as a line of text.
+    """
+    return (
+        '{backend:>8} entries={entries:<5} headers={headers:<4} '
+        'body={body_size:<6} depth={depth:<2} parse={parse_ms:9.3f}ms '
+        'hit={hit_ms:9.3f}ms '
+        'request={request_ms_per_entry:8.4f}ms/entry '
+        'check={check_ms_per_entry:8.4f}ms/entry '
+        'peak={peak_bytes:>11,}B').format(**result)
+
+
+def compare(results, baseline, threshold):
+    """
+    Print the ratio of each timing to the baseline, return the regressions.
+    """
+    baseline = {
+        scenario_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        previous = baseline.get(scenario_key(result))
+        if previous is None:
+            continue
+        ratios = {
+            key: result[key] / previous[key]
+            for key in (
+                'parse_ms', 'hit_ms', 'request_ms_per_entry',
+                'check_ms_per_entry', 'peak_bytes')
+            if previous.get(key)}
+        sys.stdout.write('{0} {1}\n'.format(
+            ' '.join(str(value) for value in scenario_key(result)),
+            ' '.join(
+                '{0}={1:.2f}x'.format(key, ratio)
+                for key, ratio in sorted(ratios.items()))))
+        if any(ratio > threshold for ratio in ratios.values()):
+            regressions.append(result)
+    return regressions
+
+
+def int_list(value):
+    """
+    Parse a comma separated list of integers.
+    """
+    return [int(item) for item in value.split(',')]
+
+
+parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+parser.add_argument(
+    '--backends', type=lambda value: value.split(','),
+    default=sorted(BACKENDS), help='Comma separated backends to run')
+parser.add_argument(
+    '--entries', type=int_list, default=[10, 100],
+    help='Comma separated numbers of entries per HAR')
+parser.add_argument(
+    '--headers', type=int_list, default=[2, 20],
+    help='Comma separated numbers of headers per entry')
+parser.add_argument(
+    '--body-sizes', type=int_list, default=[10, 1000],
+    help='Comma separated numbers of items in each JSON body')
+parser.add_argument(
+    '--depths', type=int_list, default=[1, 8],
+    help='Comma separated JSON body nesting depths')
+parser.add_argument(
+    '--repeat', type=int, default=3,
+    help='Number of times to run each scenario, the best is reported')
+parser.add_argument(
+    '--json-codec', choices=list(test_har.JSON_CODECS),
+    default=test_har.json_codec.name,
+    help='The JSON implementation used to load HARs and decode responses')
+parser.add_argument(
+    '--output', help='Write the machine readable results to this file')
+parser.add_argument(
+    '--compare', help='Compare the results to those in this file')
+parser.add_argument(
+    '--threshold', type=float, default=1.25,
+    help='Exit non-zero if any ratio to the compared results exceeds this')
+
+
+def main(args=None):
+    """
+    Set up the Django test environment and run the benchmarks.
+    """
+    args = parser.parse_args(args)
+    test_har.set_json_codec(args.json_codec)
+
+    import django
+    from django.test import utils
+    django.setup()
+    utils.setup_test_environment()
+    databases = utils.setup_databases(verbosity=0, interactive=False)
+    try:
+        results = run(args)
+    finally:
+        utils.teardown_databases(databases, verbosity=0)
+        utils.teardown_test_environment()
+
+    output = dict(
+        meta=dict(
+            json_codec=args.json_codec,
+            python=platform.python_version(),
+            platform=platform.platform(),
+            date=datetime.datetime.now(datetime.timezone.utc).isoformat()),
+        results=results)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(output, output_file, indent=2)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            if compare(results, json.load(baseline_file), args.threshold):
+                return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,7 +4,8 @@ from setuptools import setup, find_packages
 
 version = '0.3'
 
-tests_require = ['requests-mock', 'django-setuptest', 'djangorestframework']
+tests_require = [
+    'requests-mock', 'django-setuptest', 'djangorestframework', 'httpx']
 
 setup(name='test-har',
       version=version,
@@ -12,14 +13,23 @@ setup(name='test-har',
       long_description=open(os.path.join(
           os.path.dirname(__file__), 'README.rst')).read(),
       # Get strings from http://pypi.python.org/pypi?%3Aaction=list_classifiers
-      classifiers=[],
+      classifiers=[
+          'Programming Language :: Python :: 3',
+          'Programming Language :: Python :: 3 :: Only',
+          'Programming Language :: Python :: 3.9',
+          'Programming Language :: Python :: 3.10',
+          'Programming Language :: Python :: 3.11',
+          'Programming Language :: Python :: 3.12',
+      ],
       keywords='testing test har',
       author='Ross Patterson',
       author_email='me@rpatterson.net',
       url='https://github.com/rpatterson/test-har',
       license='GPL',
-      packages=find_packages(exclude=['ez_setup', 'examples', 'tests']),
+      packages=find_packages(
+          exclude=['ez_setup', 'examples', 'tests', 'benchmarks']),
       include_package_data=True,
+      python_requires='>=3.9',
       zip_safe=False,
       install_requires=[
           # -*- Extra requirements: -*-
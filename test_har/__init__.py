@@ -1,9 +1,29 @@
 import os
+import io
 import re
+import mmap
+import marshal
+import mimetypes
+import base64
+import hashlib
+import math
+import time
+import cProfile
+import pstats
+import tracemalloc
+import contextlib
+import heapq
+import itertools
 import collections
 import json
 import inspect
+import datetime
+import random
+import timeit
+import threading
 import unittest
+from unittest import util as unittest_util
+from concurrent import futures
 
 try:
     import collections.abc as collections_abc
@@ -11,32 +31,1469 @@ except ImportError:  # pragma: no cover
     # BBB Python 2 compat
     import collections as collections_abc  # noqa
 
+try:
+    from urllib import parse as urllib_parse
+except ImportError:  # pragma: no cover
+    # BBB Python 2 compat
+    import urlparse as urllib_parse  # noqa
+
+
+JSON_MIME_TYPE_RE = re.compile(r'application/([^/+]+\+)?json')
+
+# Set to record actual responses into the HAR files instead of asserting them
+RECORD_ENV = 'TEST_HAR_RECORD'
+
+# Set to a directory to write a profile of each entry's request to
+PROFILE_ENV = 'TEST_HAR_PROFILE'
+
+# Only one profiler may be enabled at a time and memory tracing is global
+PROFILE_LOCK = threading.Lock()
+
+# Request methods that don't change the backend's state
+SAFE_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'TRACE'))
+
+
+class JSONCodec(object):
+    """
+    Encode and decode JSON using a given implementation.
+
+    Accelerated implementations don't support everything the standard
+    library does, such as arbitrarily large integers, so fall back to the
+    standard library when they fail.
+    """
+
+    def __init__(self, name, loads, dumps):
+        """
+        Wrap the implementation's functions.
+        """
+        self.name = name
+        self._loads = loads
+        self._dumps = dumps
+
+    def __repr__(self):
+        return '<{0} {1!r}>'.format(type(self).__name__, self.name)
+
+    def loads(self, text):
+        """
+        Decode JSON from text or UTF-8 bytes.
+        """
+        try:
+            return self._loads(text)
+        except ValueError:
+            if self._loads is json.loads:
+                raise
+            return json.loads(text)
+
+    def dumps(self, value):
+        """
+        Encode the value as JSON text.
+        """
+        try:
+            return self._dumps(value)
+        except (TypeError, ValueError):
+            if self._dumps is json.dumps:
+                raise
+            return json.dumps(value)
+
+
+JSON_CODECS = collections.OrderedDict()
+
+# The installed codec selected by default, fastest first
+JSON_CODEC_PREFERENCE = ('orjson', 'ujson', 'json')
+
+
+def register_json_codec(codec):
+    """
+    Make a JSON codec available to `set_json_codec()`.
+    """
+    JSON_CODECS[codec.name] = codec
+    return codec
+
+
+register_json_codec(JSONCodec('json', json.loads, json.dumps))
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+else:
+    register_json_codec(JSONCodec(
+        'orjson', orjson.loads,
+        lambda value: orjson.dumps(value).decode('utf-8')))
+
+try:
+    import ujson
+except ImportError:  # pragma: no cover
+    ujson = None
+else:  # pragma: no cover
+    register_json_codec(JSONCodec('ujson', ujson.loads, ujson.dumps))
+
+
+def set_json_codec(name=None):
+    """
+    Select the JSON codec by name.
+
+    Defaults to the first installed codec in `JSON_CODEC_PREFERENCE`.
+    Returns the previously selected codec.
+    """
+    global json_codec
+    previous = globals().get('json_codec')
+    if name is None:
+        name = next(
+            preferred for preferred in JSON_CODEC_PREFERENCE
+            if preferred in JSON_CODECS)
+    json_codec = JSON_CODECS[name]
+    return previous
+
+
+set_json_codec()
+
+
+def benchmark_json_codecs(value, number=10):
+    """
+    Time decoding and encoding the value with each installed JSON codec.
+
+    Returns the best times in seconds for each codec by name.
+    """
+    text = json.dumps(value)
+    results = collections.OrderedDict()
+    for name, codec in JSON_CODECS.items():
+        results[name] = dict(
+            loads=min(timeit.repeat(
+                lambda: codec.loads(text), number=1, repeat=number)),
+            dumps=min(timeit.repeat(
+                lambda: codec.dumps(value), number=1, repeat=number)))
+    return results
+
+
+def array_to_dict(array, key='name', value='value'):
+    """
+    Convert an array of name/value objects to a dict.
+    """
+    return {item[key]: item[value] for item in array}
+
+
+class HARCache(object):
+    """
+    Cache parsed HAR files by resolved path, modification time and size.
+
+    Least recently used HAR files are evicted when either the number of
+    cached files or their total size on disk exceeds the limits.  Parsed
+    HARs are cached serialized with `marshal`, which loads much faster than
+    even the fastest JSON codec parses, so that each load cheaply returns an
+    isolated copy that tests may freely modify.
+    """
+
+    def __init__(self, max_entries=32, max_bytes=256 * 1024 * 1024):
+        """
+        Set the cache limits and initialize the hit/miss counters.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self._cache = collections.OrderedDict()
+        self._digests = {}
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """
+        Return the number of cached HAR files.
+        """
+        return len(self._cache)
+
+    def clear(self):
+        """
+        Drop all cached HAR files and reset the counters.
+        """
+        with self._lock:
+            self._cache.clear()
+            self._digests.clear()
+            self._indexes.clear()
+            self.size = self.hits = self.misses = 0
+
+    def lookup(self, path):
+        """
+        Return the cache record for the HAR file, parsing it on a miss.
+
+        The record is a list of the cache key, the `marshal` serialized
+        parsed HAR and a dict of compiled plans which callers must not
+        modify.
+        """
+        path = os.path.realpath(path)
+        stat = os.stat(path)
+        key = (stat.st_mtime, stat.st_size)
+
+        with self._lock:
+            record = self._cache.pop(path, None)
+            if record is not None:
+                if record[0] == key:
+                    self.hits += 1
+                    # Re-insert as the most recently used
+                    self._cache[path] = record
+                    return record
+                self.size -= record[0][1]
+            self.misses += 1
+
+        with open(path, 'rb') as har_file:
+            record = [
+                key, marshal.dumps(json_codec.loads(har_file.read())), {}]
+
+        if stat.st_size <= self.max_bytes:
+            with self._lock:
+                self._cache[path] = record
+                self.size += stat.st_size
+                while (
+                        len(self._cache) > self.max_entries or
+                        self.size > self.max_bytes):
+                    evicted = self._cache.popitem(last=False)[1]
+                    self.size -= evicted[0][1]
+        return record
+
+    def load(self, path):
+        """
+        Return an isolated copy of the parsed HAR file at the path.
+        """
+        return marshal.loads(self.lookup(path)[1])
+
+    def digest(self, path):
+        """
+        Return the cached size and SHA-256 hex digest of an external body file.
+        """
+        stat = os.stat(path)
+        key = (os.path.realpath(path), stat.st_mtime, stat.st_size)
+        with self._lock:
+            digest = self._digests.get(key)
+        if digest is None:
+            digest = file_digest(path)
+            with self._lock:
+                self._digests[key] = digest
+        return digest
+
+    def index(self, path, sidecar=False):
+        """
+        Return the cached `HARIndex` of the HAR file at the path.
+
+        The index is not evicted along with the parsed HAR since it is small
+        and selecting through it never parses the whole file.
+        """
+        stat = os.stat(path)
+        key = (os.path.realpath(path), stat.st_mtime, stat.st_size)
+        with self._lock:
+            index = self._indexes.get(key)
+        if index is None:
+            index = HARIndex.load(path, sidecar=sidecar)
+            with self._lock:
+                self._indexes[key] = index
+        return index
+
+    def compile(self, path, json_mime_type_re=JSON_MIME_TYPE_RE):
+        """
+        Return the cached compiled plan for the HAR file at the path.
+        """
+        record = self.lookup(path)
+        plan = record[2].get(json_mime_type_re)
+        if plan is None:
+            plan = record[2][json_mime_type_re] = compile_har(
+                marshal.loads(record[1]), json_mime_type_re,
+                os.path.dirname(path))
+        return plan
+
+
+har_cache = HARCache()
+
+
+def file_digest(path):
+    """
+    Return the size and SHA-256 hex digest of a file read through `mmap`.
+
+    The file is paged in by the OS as it is hashed rather than read into
+    memory.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as body_file:
+        size = os.fstat(body_file.fileno()).st_size
+        # Empty files can't be mapped
+        if size:
+            mapped = mmap.mmap(
+                body_file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                digest.update(mapped)
+            finally:
+                mapped.close()
+    return size, digest.hexdigest()
+
+
+def is_binary_content(content):
+    """
+    Return whether HAR content is asserted by size and digest.
+
+    True for base64 encoded bodies and for those with either the `_sha256`
+    digest or `_file` external body HAR extension fields.
+    """
+    return (
+        content.get('encoding') == 'base64' or
+        '_sha256' in content or '_file' in content)
+
+
+def encode_har_data(data, content_type=None,
+                    json_mime_type_re=JSON_MIME_TYPE_RE):
+    """
+    Return the bytes to send for HAR request data, `None` for no data.
+
+    JSON values are encoded with the JSON codec for JSON content types and
+    other mappings are form encoded.
+    """
+    if data is None or isinstance(data, bytes):
+        return data
+    if isinstance(data, str):
+        return data.encode('utf-8')
+    if content_type and json_mime_type_re.match(content_type) is not None:
+        return json_codec.dumps(data).encode('utf-8')
+    return urllib_parse.urlencode(data).encode('utf-8')
+
+
+class HARStreamDecoder(object):
+    """
+    Incrementally decode the JSON values in a HAR file.
+
+    Only as much of the file is read as is needed to decode the next value so
+    that the size of a single value, not the whole file, bounds memory use.
+    """
+
+    WHITESPACE = ' \t\n\r'
+    # Characters that may continue a number decoded up to a chunk boundary
+    NUMBER_CHARS = '0123456789.eE+-'
+
+    def __init__(self, har_file, chunk_size=64 * 1024, offsets=False):
+        """
+        Read from the file in chunks of the given size.
+
+        If `offsets` is true, track the UTF-8 byte offset in the file so that
+        entries are iterated along with their byte offsets.
+        """
+        self.file = har_file
+        self.chunk_size = chunk_size
+        self.offsets = offsets
+        self.buffer = ''
+        self.pos = 0
+        # The byte offset in the file of `mark` in the buffer
+        self.offset = 0
+        self.mark = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def tell(self):
+        """
+        Return the UTF-8 byte offset in the file of the current position.
+
+        Each character is only encoded once to count its bytes.
+        """
+        self.offset += len(self.buffer[self.mark:self.pos].encode('utf-8'))
+        self.mark = self.pos
+        return self.offset
+
+    def read(self):
+        """
+        Drop the consumed buffer and read more of the file.
+
+        Read at least as much as is already buffered so that decoding a very
+        large value only needs to be retried a logarithmic number of times.
+        """
+        chunk = self.file.read(max(
+            self.chunk_size, len(self.buffer) - self.pos))
+        if self.offsets:
+            self.tell()
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = self.mark = 0
+        if not chunk:
+            self.eof = True
+        return bool(chunk)
+
+    def peek(self):
+        """
+        Skip whitespace and return the next character, empty at the end.
+        """
+        while True:
+            while (
+                    self.pos < len(self.buffer) and
+                    self.buffer[self.pos] in self.WHITESPACE):
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self.read():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, chars):
+        """
+        Consume the next character which must be one of the given characters.
+        """
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(
+                'Expected one of {0!r} in HAR, got {1!r}'.format(chars, char))
+        self.pos += 1
+        return char
+
+    def decode(self):
+        """
+        Decode the next complete JSON value.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if not self.read():
+                    raise
+                continue
+            if (
+                    isinstance(value, (int, float)) and not self.eof and (
+                        end == len(self.buffer) or
+                        self.buffer[end] in self.NUMBER_CHARS)):
+                # The number may continue in the next chunk
+                self.read()
+                continue
+            self.pos = end
+            return value
+
+    def iter_keys(self):
+        """
+        Iterate over the keys of an object, the caller must consume values.
+        """
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.decode()
+            self.expect(':')
+            yield key
+            if self.expect(',}') == '}':
+                return
+
+    def iter_entries(self):
+        """
+        Iterate over the `log/entries` of the HAR, skipping everything else.
+
+        If tracking offsets, iterate over `(start, end, entry)` with the byte
+        offsets of each entry.
+        """
+        for key in self.iter_keys():
+            if key != 'log':
+                self.decode()
+                continue
+            for log_key in self.iter_keys():
+                if log_key != 'entries':
+                    self.decode()
+                    continue
+                self.expect('[')
+                if self.peek() == ']':
+                    self.pos += 1
+                    continue
+                while True:
+                    if self.offsets:
+                        self.peek()
+                        start = self.tell()
+                        entry = self.decode()
+                        yield start, self.tell(), entry
+                    else:
+                        yield self.decode()
+                    if self.expect(',]') == ']':
+                        break
+
+
+def iter_har_entries(path, chunk_size=64 * 1024):
+    """
+    Iterate over the entries in a HAR file without parsing the whole file.
+    """
+    with io.open(path, encoding='utf-8', newline='') as har_file:
+        for entry in HARStreamDecoder(har_file, chunk_size).iter_entries():
+            yield entry
+
+
+def har_entry_keys(entry):
+    """
+    Return the values of each `HARIndex.KEYS` key for a HAR entry.
+    """
+    request = entry["request"]
+    comment = entry.get("comment")
+    return dict(
+        method=[request["method"]],
+        url=[request["url"]],
+        path=[urllib_parse.urlsplit(request["url"]).path],
+        comment=[] if comment is None else [comment],
+        tag=list(entry.get("_tags", ())))
+
+
+def match_har_key(criterion, value):
+    """
+    Return whether a selector criterion, string or regular expression, matches.
+    """
+    if hasattr(criterion, 'search'):
+        return criterion.search(value) is not None
+    return criterion == value
+
+
+class HARIndex(object):
+    """
+    The byte offsets of the entries in a HAR file keyed by what selects them.
+
+    Entries are keyed by request `method`, `url` and URL `path`, by entry
+    `comment` and by each `tag` in the `_tags` HAR extension field.  Building
+    the index streams through the HAR file once, after which selected entries
+    are read and parsed from their offsets without reading anything else.
+    Iterating over the index reads every entry in HAR order.
+    """
+
+    KEYS = ('method', 'url', 'path', 'comment', 'tag')
+
+    # Appended to the HAR file path for the index sidecar file
+    SIDECAR_SUFFIX = '.index.json'
+
+    def __init__(self, path, offsets, keys):
+        """
+        Index the HAR file with the `(start, end)` offsets of each entry and
+        the entry positions for each value of each key.
+        """
+        self.path = path
+        self.offsets = offsets
+        self.keys = keys
+
+    def __len__(self):
+        """
+        Return the number of entries in the HAR file.
+        """
+        return len(self.offsets)
+
+    def __iter__(self):
+        """
+        Read every entry in HAR order.
+        """
+        return self.read(range(len(self.offsets)))
+
+    @classmethod
+    def build(cls, path, chunk_size=64 * 1024):
+        """
+        Stream through the HAR file and index its entries.
+        """
+        offsets = []
+        keys = {key: {} for key in cls.KEYS}
+        with io.open(path, encoding='utf-8', newline='') as har_file:
+            for start, end, entry in HARStreamDecoder(
+                    har_file, chunk_size, offsets=True).iter_entries():
+                for key, values in har_entry_keys(entry).items():
+                    for value in values:
+                        keys[key].setdefault(value, []).append(len(offsets))
+                offsets.append((start, end))
+        return cls(path, offsets, keys)
+
+    @classmethod
+    def load(cls, path, sidecar=False):
+        """
+        Build the index for the HAR file, reusing a current sidecar file.
+
+        If `sidecar` is true, the index is read from the sidecar file next to
+        the HAR file if it was written for the current HAR file modification
+        time and size.  Otherwise the index is built and written to it.
+        """
+        stat = os.stat(path)
+        sidecar_path = path + cls.SIDECAR_SUFFIX
+        if sidecar and os.path.exists(sidecar_path):
+            with open(sidecar_path, 'rb') as sidecar_file:
+                data = json_codec.loads(sidecar_file.read())
+            if (data["mtime"], data["size"]) == (
+                    stat.st_mtime, stat.st_size):
+                return cls(path, data["offsets"], data["keys"])
+
+        index = cls.build(path)
+        if sidecar:
+            with open(sidecar_path, 'w') as sidecar_file:
+                json.dump(dict(
+                    mtime=stat.st_mtime, size=stat.st_size,
+                    offsets=index.offsets, keys=index.keys), sidecar_file)
+        return index
+
+    def select(self, criteria):
+        """
+        Return the positions in HAR order of the entries matching all criteria.
+
+        String criteria are looked up directly.  Regular expressions are
+        searched for in the distinct values of the key, not in each entry.
+        """
+        positions = None
+        for key, criterion in criteria.items():
+            keyed = self.keys[key]
+            if hasattr(criterion, 'search'):
+                matched = set()
+                for value, value_positions in keyed.items():
+                    if match_har_key(criterion, value):
+                        matched.update(value_positions)
+            else:
+                matched = set(keyed.get(criterion, ()))
+            positions = matched if positions is None else positions & matched
+        if positions is None:
+            return list(range(len(self.offsets)))
+        return sorted(positions)
+
+    def read(self, positions):
+        """
+        Read and parse only the entries at the given positions.
+        """
+        with open(self.path, 'rb') as har_file:
+            for position in positions:
+                start, end = self.offsets[position]
+                har_file.seek(start)
+                yield json_codec.loads(har_file.read(end - start))
+
+
+class HARSelector(object):
+    """
+    Select HAR entries by `HARIndex.KEYS`, all given criteria must match.
+
+    Each criterion is either a string matched exactly or a compiled regular
+    expression searched for, such as `re.compile('^/users/')`.
+    """
+
+    def __init__(self, **criteria):
+        """
+        Validate the criteria keys.
+        """
+        for key in criteria:
+            if key not in HARIndex.KEYS:
+                raise TypeError(
+                    'Unknown HAR selector key {0!r}, must be one of {1!r}'
+                    .format(key, HARIndex.KEYS))
+        self.criteria = criteria
+
+    def __repr__(self):
+        """
+        Include the criteria.
+        """
+        return '<{0} {1!r}>'.format(type(self).__name__, self.criteria)
+
+    def match(self, entry):
+        """
+        Return whether a HAR entry matches all the criteria.
+        """
+        keys = har_entry_keys(entry)
+        return all(
+            any(match_har_key(criterion, value) for value in keys[key])
+            for key, criterion in self.criteria.items())
+
+    def select(self, har):
+        """
+        Return only the matching entries of a HAR.
+
+        A `HARIndex` reads only the selected entries from the HAR file.  The
+        entries of a parsed HAR, a compiled plan or an iterable are each
+        matched in turn.
+        """
+        if isinstance(har, HARIndex):
+            return har.read(har.select(self.criteria))
+        if isinstance(har, HARPlan):
+            return HARPlan(plan for plan in har if self.match(plan.entry))
+        return (entry for entry in har_entries(har) if self.match(entry))
+
+
+def select_har(har, select=None):
+    """
+    Apply a `HARSelector` or a dict of its criteria to a HAR if given.
+    """
+    if select is None:
+        return har
+    if not isinstance(select, HARSelector):
+        select = HARSelector(**select)
+    return select.select(har)
+
+
+def har_entries(har):
+    """
+    Return the entries of a parsed HAR or an iterable of entries as is.
+    """
+    if isinstance(har, collections_abc.Mapping):
+        return har["log"]["entries"]
+    return har
+
+
+def har_url_slug(url):
+    """
+    Return the URL path with runs of non-word characters replaced by `_`.
+    """
+    return re.sub(
+        r'\W+', '_', urllib_parse.urlsplit(url).path).strip('_')
+
+
+def scrub_har_value(value, patterns):
+    """
+    Return a copy of a JSON value with the patterns substituted in strings.
+
+    The patterns are `(regex, replacement)` pairs as accepted by `re.sub()`
+    and are applied to all strings in nested objects and arrays but not to
+    object keys.
+    """
+    if isinstance(value, str):
+        for pattern, replacement in patterns:
+            value = re.sub(pattern, replacement, value)
+        return value
+    if isinstance(value, collections_abc.Mapping):
+        return collections.OrderedDict(
+            (key, scrub_har_value(item, patterns))
+            for key, item in value.items())
+    if isinstance(value, list):
+        return [scrub_har_value(item, patterns) for item in value]
+    return value
+
+
+def json_container(value):
+    """
+    Return the abstract type if the value is a JSON object or array.
+    """
+    if isinstance(value, collections_abc.Mapping):
+        return collections_abc.Mapping
+    elif isinstance(value, list):
+        return list
+    return None
+
+
+def escape_json_pointer(key):
+    """
+    Escape an object key or array index as a JSON pointer reference token.
+    """
+    return '{0}'.format(key).replace('~', '~0').replace('/', '~1')
+
+
+class JSONDifference(object):
+    """
+    One difference between actual and expected JSON.
+
+    The `kind` is one of `missing` if an object is missing the expected
+    `key`, `length` if arrays differ in length, or `value` otherwise.
+    """
+
+    __slots__ = ('pointer', 'kind', 'actual', 'expected', 'key')
+
+    def __init__(self, pointer, kind, actual, expected, key=None):
+        """
+        Record the difference at the JSON pointer.
+        """
+        self.pointer = pointer
+        self.kind = kind
+        self.actual = actual
+        self.expected = expected
+        self.key = key
+
+    def __repr__(self):
+        return '<{0} {1} at {2!r}>'.format(
+            type(self).__name__, self.kind, self.pointer)
+
+
+def diff_json(actual, expected, pointer='', limit=None):
+    """
+    Iterate over the differences of actual JSON from the expected JSON.
+
+    Nested objects match partially, keys in the actual objects that are not
+    in the expected objects are ignored.  Arrays must be the same length and
+    their items are compared pairwise.  Values are compared iteratively in
+    document order, each only once, and iteration stops once the `limit`
+    number of differences is reached.  For a `missing` difference, the
+    `actual` is the object missing the key.
+    """
+    count = 0
+    stack = [(pointer, actual, expected, False, None)]
+    while stack and (limit is None or count < limit):
+        pointer, actual, expected, missing, key = stack.pop()
+        if missing:
+            count += 1
+            yield JSONDifference(pointer, 'missing', actual, expected, key)
+            continue
+
+        container = json_container(expected)
+        if container is None or not isinstance(actual, container):
+            if actual != expected:
+                count += 1
+                yield JSONDifference(pointer, 'value', actual, expected)
+            continue
+
+        if container is list:
+            if len(actual) != len(expected):
+                count += 1
+                yield JSONDifference(pointer, 'length', actual, expected)
+            children = [
+                ('{0}/{1}'.format(pointer, index), actual_item,
+                 expected_item, False, index)
+                for index, (actual_item, expected_item) in enumerate(
+                    zip(actual, expected))]
+        else:
+            children = [
+                ('{0}/{1}'.format(pointer, escape_json_pointer(child_key)),
+                 actual[child_key] if child_key in actual else actual,
+                 value, child_key not in actual, child_key)
+                for child_key, value in expected.items()]
+        stack.extend(reversed(children))
+
+
+class HARImmutable(object):
+    """
+    Immutable objects whose attributes are set once from the `__slots__`.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, *args, **kwargs):
+        """
+        Set the attributes from positional or keyword arguments.
+        """
+        values = dict(zip(self.__slots__, args), **kwargs)
+        for name in self.__slots__:
+            object.__setattr__(self, name, values.get(name))
+
+    def __setattr__(self, name, value):
+        """
+        Disallow changing attributes.
+        """
+        raise AttributeError(
+            '{0!r} objects are immutable'.format(type(self).__name__))
+
+    __delattr__ = __setattr__
+
+    def __repr__(self):
+        """
+        Include the attributes in the representation.
+        """
+        return '<{0} {1}>'.format(type(self).__name__, ' '.join(
+            '{0}={1!r}'.format(name, getattr(self, name))
+            for name in self.__slots__[:2]))
+
+
+class HARCheck(HARImmutable):
+    """
+    One assertion on a response compiled from a HAR entry.
+
+    The `assertion` is the name of the test case method that makes the
+    assertion and records any failures under the `path`.
+    """
+
+    __slots__ = (
+        'path', 'assertion', 'name', 'expected', 'json', 'container')
+
+
+class HAREntryPlan(HARImmutable):
+    """
+    The prepared request and flat list of checks compiled from a HAR entry.
+
+    The URL, header values and data may be `HARTemplate`s using the
+    variables in `consumes`, and the `captures` set the variables in
+    `produces` from the response.
+    """
+
+    __slots__ = (
+        'index', 'entry', 'method', 'url', 'headers', 'data', 'has_data',
+        'stream', 'checks', 'captures', 'produces', 'consumes')
+
+    def request_kwargs(self, variables=None):
+        """
+        Return new keyword arguments for `request_har()`.
+
+        Any templates are rendered with the variables.
+        """
+        request = dict(
+            method=self.method, url=render_har_template(self.url, variables),
+            headers={
+                name: render_har_template(value, variables)
+                for name, value in self.headers})
+        if self.has_data:
+            request['data'] = render_har_template(self.data, variables)
+        if self.stream:
+            request['stream'] = True
+        return request
+
+
+class HARPlan(tuple):
+    """
+    The immutable sequence of entry plans compiled from a HAR.
+    """
+
+    __slots__ = ()
+
+
+TEMPLATE_RE = re.compile(r'{{\s*([^{}\s]+)\s*}}')
+
+
+def lookup_har_variable(variables, name):
+    """
+    Return the value of a HAR template variable.
+    """
+    try:
+        return variables[name]
+    except KeyError:
+        raise ValueError(
+            'The HAR template variable {0!r} has not been set'.format(name))
+
+
+class HARTemplate(HARImmutable):
+    """
+    A value with `{{name}}` variables compiled to be rendered cheaply.
+
+    The `parts` of a `string` template alternate between literal text and
+    variable names.  The `parts` of an `object` or `array` template are its
+    keys or indexes and items, only those using variables being templates.
+    A JSON string that is only one `variable` renders to the variable's value
+    as is, such as a number.  The original `value` is kept to replay as is
+    while no variables are in use.
+    """
+
+    __slots__ = ('kind', 'parts', 'names', 'value')
+
+    def render(self, variables):
+        """
+        Return the value with the variables substituted.
+
+        Until any variables are set, by `har_variables` or by a capture, the
+        original value is returned so that HARs that don't use variables
+        replay any literal `{{...}}` text unchanged.
+        """
+        if not variables:
+            return self.value
+        if self.kind == 'variable':
+            return lookup_har_variable(variables, self.parts)
+        if self.kind == 'string':
+            rendered = list(self.parts)
+            for idx in range(1, len(rendered), 2):
+                rendered[idx] = '{0}'.format(
+                    lookup_har_variable(variables, rendered[idx]))
+            return ''.join(rendered)
+        items = (
+            (key, render_har_template(item, variables))
+            for key, item in self.parts)
+        if self.kind == 'object':
+            return collections.OrderedDict(items)
+        return [item for _, item in items]
+
+
+def compile_har_template(value, json=False):
+    """
+    Return a `HARTemplate` if the value uses variables, otherwise the value.
+
+    Only strings are templates unless `json` is true, in which case strings
+    in nested objects and arrays are too.
+    """
+    if isinstance(value, str):
+        parts = TEMPLATE_RE.split(value)
+        if len(parts) == 1:
+            return value
+        names = frozenset(parts[1::2])
+        if json and len(parts) == 3 and not parts[0] and not parts[2]:
+            return HARTemplate('variable', parts[1], names, value)
+        return HARTemplate('string', tuple(parts), names, value)
+    if json and isinstance(value, collections_abc.Mapping):
+        kind, items = 'object', value.items()
+    elif json and isinstance(value, list):
+        kind, items = 'array', enumerate(value)
+    else:
+        return value
+    parts = tuple(
+        (key, compile_har_template(item, json)) for key, item in items)
+    names = frozenset().union(*(
+        item.names for _, item in parts if isinstance(item, HARTemplate)))
+    if not names:
+        return value
+    return HARTemplate(kind, parts, names, value)
+
+
+def render_har_template(value, variables=None):
+    """
+    Render the value if it is a `HARTemplate`, otherwise return it as is.
+    """
+    if isinstance(value, HARTemplate):
+        return value.render(variables or {})
+    return value
+
+
+JSON_PATH_RE = re.compile(
+    r'\.([^.[\]]+)|\[(\d+)\]|\[\s*(?:\'([^\']*)\'|"([^"]*)")\s*\]')
+
+
+class HARCapture(HARImmutable):
+    """
+    Set a variable to a value in the response JSON.
+
+    The expression is a JSON pointer, such as `/results/0/id`, or a simple
+    JSONPath of names and indexes, such as `$.results[0].id`.
+    """
+
+    __slots__ = ('name', 'expression', 'keys')
+
+    def extract(self, value):
+        """
+        Return the value at the expression.
+        """
+        for key in self.keys:
+            if isinstance(value, list):
+                key = int(key)
+            value = value[key]
+        return value
+
+
+def compile_har_capture(name, expression):
+    """
+    Parse the JSON pointer or JSONPath of a capture.
+    """
+    if expression.startswith('$'):
+        keys = []
+        pos = 1
+        while pos < len(expression):
+            match = JSON_PATH_RE.match(expression, pos)
+            if match is None:
+                raise ValueError(
+                    'Unsupported JSONPath {0!r} for HAR capture {1!r}'.format(
+                        expression, name))
+            dotted, index, single, double = match.groups()
+            keys.append(
+                int(index) if index is not None else
+                next(key for key in (dotted, single, double)
+                     if key is not None))
+            pos = match.end()
+    elif not expression:
+        keys = []
+    elif expression.startswith('/'):
+        keys = [
+            key.replace('~1', '/').replace('~0', '~')
+            for key in expression.split('/')[1:]]
+    else:
+        raise ValueError(
+            'Invalid JSON pointer {0!r} for HAR capture {1!r}'.format(
+                expression, name))
+    return HARCapture(name, expression, tuple(keys))
+
+
+def compile_har_response(
+        response, json_mime_type_re=JSON_MIME_TYPE_RE, base_dir=None):
+    """
+    Return the checks for a HAR response and whether to stream its body.
+
+    A relative `_file` body path is resolved against `base_dir`, the
+    directory of the HAR file, if given.
+    """
+    checks = [
+        HARCheck('status', 'check_har_status', expected=response["status"]),
+        HARCheck(
+            'statusText', 'check_har_status_text',
+            expected=response["statusText"]),
+    ]
+    content_type = response["content"].get("mimeType")
+    if content_type:
+        checks.append(HARCheck(
+            'content/mimeType', 'check_har_mime_type',
+            expected=content_type))
+    for header in response.get("headers", []):
+        checks.append(HARCheck(
+            'headers/{0}'.format(header['name']), 'check_har_header',
+            name=header['name'], expected=header['value']))
+    stream = is_binary_content(response["content"])
+    if stream:
+        content = response["content"]
+        if base_dir is not None and content.get("_file"):
+            # Resolve now, relative paths are later resolved from the test
+            content = dict(content, _file=os.path.abspath(
+                os.path.join(base_dir, content["_file"])))
+        checks.append(HARCheck(
+            'content/text', 'check_har_body', name=content_type,
+            expected=content))
+    else:
+        expected_content = response["content"]["text"]
+        checks.append(HARCheck(
+            'content/text', 'check_har_content', name=content_type,
+            expected=expected_content,
+            json=json_mime_type_re.match(content_type or '') is not None,
+            container=json_container(expected_content)))
+    return checks, stream
+
+
+def compile_har_entry(entry, index=None, json_mime_type_re=JSON_MIME_TYPE_RE,
+                      base_dir=None):
+    """
+    Compile a HAR entry into a plan of the request and assertions.
+
+    An entry without a response, such as one to be recorded, only sends the
+    request.  `{{name}}` variables in the URL, header values and `postData`
+    are compiled into templates and the `_captures` HAR extension field maps
+    variable names to the JSON pointer or JSONPath of their values in the
+    response JSON.  Relative `_file` body paths are resolved against
+    `base_dir`, the directory of the HAR file.  The plan shares values with
+    the entry so neither may be modified.
+    """
+    request = entry["request"]
+    headers = array_to_dict(request.get("headers", []))
+    post = request.get('postData')
+    if post is not None:
+        headers['Content-Type'] = post["mimeType"]
+    url = compile_har_template(request["url"])
+    headers = tuple(
+        (name, compile_har_template(value)) for name, value in headers.items())
+    data = post and compile_har_template(post["text"], json=True)
+    consumes = frozenset().union(*(
+        value.names for value in (url, data) + tuple(
+            value for _, value in headers)
+        if isinstance(value, HARTemplate)))
+    captures = tuple(
+        compile_har_capture(name, expression)
+        for name, expression in entry.get("_captures", {}).items())
+
+    checks = []
+    stream = False
+    if "response" in entry:
+        checks, stream = compile_har_response(
+            entry["response"], json_mime_type_re, base_dir)
+    if entry.get("time") is not None or entry.get("_maxTime") is not None:
+        checks.append(HARCheck(
+            'timings', 'check_har_timings',
+            expected=(entry.get("time"), entry.get("_maxTime"))))
+    if entry.get("_maxQueries") is not None:
+        checks.append(HARCheck(
+            '_maxQueries', 'check_har_queries',
+            expected=entry["_maxQueries"]))
+    if entry.get("_maxDbTime") is not None:
+        checks.append(HARCheck(
+            '_maxDbTime', 'check_har_db_time', expected=entry["_maxDbTime"]))
+
+    return HAREntryPlan(
+        index=index, entry=entry,
+        method=request["method"], url=url, headers=headers,
+        data=data, has_data=post is not None,
+        stream=stream, checks=tuple(checks), captures=captures,
+        produces=frozenset(capture.name for capture in captures),
+        consumes=consumes)
+
+
+def compile_har(har, json_mime_type_re=JSON_MIME_TYPE_RE, base_dir=None):
+    """
+    Compile a HAR into an immutable plan that may be asserted many times.
+    """
+    return HARPlan(
+        compile_har_entry(entry, index, json_mime_type_re, base_dir)
+        for index, entry in enumerate(har_entries(har)))
+
+
+def iter_har_plans(har, json_mime_type_re=JSON_MIME_TYPE_RE, base_dir=None):
+    """
+    Iterate over the plans in a compiled HAR or compile each entry in turn.
+    """
+    if isinstance(har, HARPlan):
+        return iter(har)
+    return (
+        compile_har_entry(entry, index, json_mime_type_re, base_dir)
+        for index, entry in enumerate(har_entries(har)))
+
+
+def har_plan_links(plans, done=()):
+    """
+    Return the positions of the earlier entries each entry plan is linked to.
+
+    An entry is linked to the entries whose `_id` HAR extension field values
+    are in its `_dependsOn` HAR extension field, to the previous entry in its
+    `pageref` page, and to the entries capturing the variables its templates
+    use.  The `_id` values in `done` are of entries before the plans that
+    have already passed.
+    """
+    links = []
+    ids = {}
+    pages = {}
+    producers = {}
+    for position, plan in enumerate(plans):
+        entry = plan.entry
+        linked = set()
+        depends_on = entry.get('_dependsOn', [])
+        if not isinstance(depends_on, list):
+            depends_on = [depends_on]
+        for entry_id in depends_on:
+            if entry_id in ids:
+                linked.add(ids[entry_id])
+            elif entry_id not in done:
+                raise ValueError(
+                    'HAR entry {0} depends on {1!r} which is not the '
+                    '`_id` of an earlier entry'.format(position, entry_id))
+
+        pageref = entry.get('pageref')
+        if pageref is not None:
+            if pageref in pages:
+                linked.add(pages[pageref])
+            pages[pageref] = position
+        linked.update(
+            producers[name] for name in plan.consumes if name in producers)
+
+        for name in plan.produces:
+            producers[name] = position
+        if '_id' in entry:
+            ids[entry['_id']] = position
+        links.append(linked)
+    return links
+
+
+class HARFailure(AssertionError):
+    """
+    A lightweight record of one failed HAR assertion.
+
+    The failure message is only formatted when the failure is rendered by
+    calling the assertion again, so recording many failures with large
+    values is cheap while the rendered messages match the assertion's.
+    """
+
+    def __init__(self, path, kind, expected, actual, assertion, *args):
+        """
+        Record the failure and how to format its message.
+        """
+        super(HARFailure, self).__init__()
+        self.path = path
+        self.kind = kind
+        self.expected = expected
+        self.actual = actual
+        self.assertion = assertion
+        self.assertion_args = args
+        self._args = None
+
+    @property
+    def args(self):
+        """
+        Format the failure message on first access.
+        """
+        if self._args is None:
+            try:
+                self.assertion(*self.assertion_args)
+            except AssertionError as exc:
+                self._args = exc.args
+            else:
+                self._args = ('{0!r} != {1!r}'.format(
+                    self.actual, self.expected), )
+        return self._args
+
+    @args.setter
+    def args(self, value):
+        self._args = tuple(value)
+
+    def __str__(self):
+        return '\n'.join('{0}'.format(arg) for arg in self.args)
+
+    def __repr__(self):
+        return '<{0} {1} at {2!r}>'.format(
+            type(self).__name__, self.kind, self.path)
+
+
+class HAREntryAssertionError(AssertionError):
+    """
+    Collect multiple failures for a single entries response.
+
+    The failure messages are only rendered when the error's `args` are
+    first accessed, such as when it is converted to a string, and are
+    truncated to keep rendering large failures fast.  The rendered messages
+    are the first of the `args` followed by any other arguments.
+    """
+
+    # Render at most this many failures
+    max_failures = 20
+    # Truncate each rendered failure message to this many characters
+    max_message_length = 4096
+
+    def __init__(self, response, failures, *args):
+        """
+        Record the response corresponding to the failures.
+        """
+        super(HAREntryAssertionError, self).__init__()
+        self.response = response
+        self.failures = failures
+        self.extra_args = args
+        self._args = None
+
+    @property
+    def args(self):
+        """
+        Render the failure messages on first access.
+        """
+        if self._args is None:
+            self._args = (self.render_failures(), ) + self.extra_args
+        return self._args
+
+    @args.setter
+    def args(self, value):
+        self._args = tuple(value)
+
+    def render_failures(self):
+        """
+        Render the failure messages, truncated to the limits.
+        """
+        rendered = []
+        for idx, (path, exc) in enumerate(self.failures.items()):
+            if idx >= self.max_failures:
+                rendered.append('... and {0} more HAR failures'.format(
+                    len(self.failures) - idx))
+                break
+            msg = '{0}'.format(exc)
+            if len(msg) > self.max_message_length:
+                msg = '{0}... [{1} characters truncated]'.format(
+                    msg[:self.max_message_length],
+                    len(msg) - self.max_message_length)
+            rendered.append('HAR failure at {0!r}:\n\n{1}'.format(path, msg))
+        return '\n\n\n'.join(rendered)
+
+    def __str__(self):
+        """
+        Render the failure messages and any other arguments.
+        """
+        return '\n\n\n'.join('{0}'.format(arg) for arg in self.args)
+
+
+class HARWriter(object):
+    """
+    Stream HAR 1.2 entries to a file as they are written.
+
+    Only one entry at a time is held in memory.  The HAR document is
+    completed when the writer is closed.
+    """
+
+    CREATOR = dict(name='test-har', version='0.3')
+
+    def __init__(self, output, creator=None, log=None):
+        """
+        Open the output path, or use an open text file, and start the HAR.
+
+        The fields of a source HAR `log` other than its `entries`, such as
+        `pages`, `comment` or its `creator`, are written before the entries.
+        """
+        if isinstance(output, str):
+            self.file = io.open(output, 'w', encoding='utf-8')
+            self.close_file = True
+        else:
+            self.file = output
+            self.close_file = False
+        self.count = 0
+        self._lock = threading.Lock()
+        fields = collections.OrderedDict([
+            ("version", "1.2"), ("creator", creator or self.CREATOR)])
+        fields.update(
+            (key, value) for key, value in (log or {}).items()
+            if key != 'entries')
+        # Leave the log object open for the entries
+        self.file.write('{{"log": {0}, "entries": [\n'.format(
+            json_codec.dumps(fields)[:-1]))
+
+    def write_entry(self, entry):
+        """
+        Write one entry to the HAR file.
+        """
+        text = json_codec.dumps(entry)
+        with self._lock:
+            if self.count:
+                self.file.write(',\n')
+            self.file.write(text)
+            self.count += 1
+
+    def close(self):
+        """
+        Complete the HAR document and close the file if opened here.
+        """
+        self.file.write('\n]}}\n')
+        if self.close_file:
+            self.file.close()
+        else:
+            self.file.flush()
+
+    def __enter__(self):
+        return self
 
-JSON_MIME_TYPE_RE = re.compile(r'application/([^/+]+\+)?json')
+    def __exit__(self, *exc_info):
+        self.close()
 
 
-def array_to_dict(array, key='name', value='value'):
+def percentile(ordered, percent):
     """
-    Convert an array of name/value objects to a dict.
+    Return the nearest-rank percentile of already sorted values.
     """
-    return {item[key]: item[value] for item in array}
+    if not ordered:
+        return None
+    rank = int(math.ceil(percent / 100.0 * len(ordered))) - 1
+    return ordered[min(max(rank, 0), len(ordered) - 1)]
 
 
-class HAREntryAssertionError(AssertionError):
+class HARLoadReport(object):
     """
-    Collect multiple failures for a single entries response.
+    Throughput and latency of replaying a HAR as a load test.
     """
 
-    def __init__(self, response, failures, *args):
+    PERCENTILES = (50, 95, 99)
+
+    def __init__(self):
         """
-        Record the response corresponding to the failures.
+        Start with no measurements.
         """
-        self.response = response
-        self.failures = failures
-        msg = '\n\n\n'.join(
-            'HAR failure at {0!r}:\n\n{1}'.format(path, exc)
-            for path, exc in failures.items())
-        super(HAREntryAssertionError, self).__init__(msg, *args)
+        self.latencies = collections.OrderedDict()
+        self.failures = []
+        self.elapsed = 0
+        self._lock = threading.Lock()
+
+    def add(self, latencies, failures):
+        """
+        Merge the latencies and failures measured by one worker.
+        """
+        with self._lock:
+            for key, values in latencies.items():
+                self.latencies.setdefault(key, []).extend(values)
+            self.failures.extend(failures)
+
+    @property
+    def requests(self):
+        """
+        The total number of requests sent.
+        """
+        return sum(len(values) for values in self.latencies.values())
+
+    @property
+    def requests_per_second(self):
+        """
+        The overall throughput.
+        """
+        if not self.elapsed:
+            return None
+        return self.requests / self.elapsed
+
+    def stats(self):
+        """
+        Return the latency statistics in milliseconds for each entry URL.
+        """
+        stats = collections.OrderedDict()
+        for key, values in self.latencies.items():
+            ordered = sorted(values)
+            entry_stats = stats[key] = collections.OrderedDict(
+                count=len(ordered),
+                mean=sum(ordered) * 1000 / len(ordered),
+                min=ordered[0] * 1000, max=ordered[-1] * 1000)
+            for percent in self.PERCENTILES:
+                entry_stats['p{0}'.format(percent)] = percentile(
+                    ordered, percent) * 1000
+        return stats
+
+    def as_dict(self):
+        """
+        Return the report as JSON compatible data.
+        """
+        return collections.OrderedDict(
+            requests=self.requests, elapsed=self.elapsed,
+            requests_per_second=self.requests_per_second,
+            failures=len(self.failures), entries=self.stats())
+
+    def __str__(self):
+        """
+        Render the report as a table.
+        """
+        lines = [
+            '{0} requests in {1:.3f}s, {2:.1f} requests/sec, '
+            '{3} failures'.format(
+                self.requests, self.elapsed, self.requests_per_second or 0,
+                len(self.failures))]
+        for key, entry_stats in self.stats().items():
+            lines.append(
+                '{0}: count={count} p50={p50:.3f}ms p95={p95:.3f}ms '
+                'p99={p99:.3f}ms max={max:.3f}ms'.format(key, **entry_stats))
+        return '\n'.join(lines)
 
 
 class HARTestCase(unittest.TestCase):
@@ -46,13 +1503,81 @@ class HARTestCase(unittest.TestCase):
 
     JSON_MIME_TYPE_RE = JSON_MIME_TYPE_RE
 
+    # Shared across all tests in the process, set to a new `HARCache` to
+    # isolate or reconfigure
+    har_cache = har_cache
+
     example_har = None
 
+    # Whether `request_har` may be called from multiple threads at once
+    har_thread_safe = True
+
+    # Fail entries slower than their recorded HAR `time` times this factor
+    har_time_factor = None
+
+    # Path to write a HAR of the actual requests and responses
+    har_output = None
+
+    # Stop comparing JSON content after this many differences
+    har_max_content_failures = 50
+    # Strings longer than this are not diffed in failure messages
+    har_diff_threshold = 1024
+
+    # Initial values of the `{{name}}` variables in HAR entry templates
+    har_variables = None
+
+    # Set to a number of threads to send independent entries concurrently,
+    # see `get_har_dependencies()`
+    har_workers = None
+    # Entries read and scheduled at a time when sending concurrently so that
+    # memory use stays bounded for streamed HARs
+    har_schedule_window = 1000
+    # Order entries around those with unsafe methods instead of sending
+    # unmarked entries in HAR order when sending concurrently
+    har_unsafe_barriers = False
+
+    # Bytes read at a time when hashing streamed binary response bodies
+    har_chunk_size = 64 * 1024
+
+    # Directory that relative `_file` body paths are in for HARs not compiled
+    # from a file, see `get_har_base_dir()`
+    har_base_dir = None
+
+    # Write and reuse `HARIndex` sidecar files next to indexed HAR files
+    har_index_sidecar = False
+
+    # Record actual responses into the HAR instead of asserting them, `None`
+    # to record only when the `TEST_HAR_RECORD` environment variable is set
+    har_record = None
+    # Path to record to instead of the `example_har` file
+    har_record_output = None
+    # Recorded request and response header values replaced with
+    # `har_scrub_replacement`
+    har_scrub_headers = ('Authorization', 'Cookie', 'Proxy-Authorization')
+    har_scrub_replacement = 'SCRUBBED'
+    # `(regex, replacement)` pairs substituted in all recorded strings
+    har_scrub_patterns = ()
+    # Response headers that vary between responses and aren't recorded
+    har_record_ignore_headers = (
+        'Connection', 'Content-Encoding', 'Content-Length', 'Content-Type',
+        'Date', 'Keep-Alive', 'Server', 'Set-Cookie', 'Transfer-Encoding')
+    # Recorded bodies larger than this many bytes are written to `_file`s
+    har_record_inline_max = 64 * 1024
+
+    # Directory to write CPU profiles and memory snapshots of each entry's
+    # request to, `None` to profile only when the `TEST_HAR_PROFILE`
+    # environment variable is set to a directory
+    har_profile_dir = None
+    # Profile CPU time with `cProfile` and allocations with `tracemalloc`
+    har_profile_cpu = True
+    har_profile_memory = True
+
     def setUp(self):
         """
         Load an example HAR file.
         """
         super(HARTestCase, self).setUp()
+        self.har_profiles = []
 
         if self.example_har is not None:
             self.setUpHAR(self.example_har)
@@ -60,16 +1585,194 @@ class HARTestCase(unittest.TestCase):
     def setUpHAR(self, example_har):
         """
         Load an example HAR file.
+
+        The parsed HAR is cached for the whole process and each test gets its
+        own copy to modify.
         """
-        with open(os.path.join(
-                os.path.dirname(inspect.getfile(type(self))),
-                example_har)
-        ) as example_file:
-            self.example = json.load(example_file)
+        self.example = self.har_cache.load(self.har_path(example_har))
         self.entry = self.example["log"]["entries"][0]
-        self.headers = array_to_dict(
-            self.entry["response"].get("headers", []))
-        self.content = self.entry["response"]["content"]["text"]
+        # Entries to be recorded may not have a response yet
+        response = self.entry.get("response", {})
+        self.headers = array_to_dict(response.get("headers", []))
+        self.content = response.get("content", {}).get("text")
+
+    def har_path(self, example_har):
+        """
+        Resolve a HAR file path relative to the test case module.
+        """
+        return os.path.join(
+            os.path.dirname(inspect.getfile(type(self))), example_har)
+
+    def get_har_base_dir(self):
+        """
+        Return the directory of the HAR that relative `_file` paths are in.
+
+        Used for HARs not compiled from a file by `compileHAR()`.  Defaults
+        to the directory of `example_har` or of the test case module.
+        """
+        if self.har_base_dir is not None:
+            return self.har_base_dir
+        if self.example_har is None:
+            return os.path.dirname(inspect.getfile(type(self)))
+        return os.path.dirname(self.har_path(self.example_har))
+
+    def iterHAR(self, example_har, chunk_size=64 * 1024):
+        """
+        Iterate over the entries in a HAR file without parsing the whole file.
+
+        Use with `assertHAR(..., keep_responses=False)` for very large HAR
+        files.
+        """
+        return iter_har_entries(self.har_path(example_har), chunk_size)
+
+    def indexHAR(self, example_har):
+        """
+        Return the cached index of a HAR file for selecting entries.
+
+        Pass the index to `assertHAR(..., select=...)` to only read and parse
+        the selected entries of a very large HAR file.
+        """
+        return self.har_cache.index(
+            self.har_path(example_har), sidecar=self.har_index_sidecar)
+
+    @classmethod
+    def make_har_entries_test(cls, plan):
+        """
+        Return a test method asserting the entries in the plan in order.
+
+        Used by `har_entry_tests()`, override for backends whose `assertHAR()`
+        must be called differently.
+        """
+        def test(self):
+            self.assertHAR(plan)
+
+        return test
+
+    def get_ordering_group(self, entry):
+        """
+        Return the group of entries whose requests must be sent in HAR order.
+
+        Used by backends that send entries concurrently.  Entries marked with
+        a true `_independent` HAR extension field are each in their own group.
+        Otherwise, entries are grouped by the `_orderingGroup` HAR extension
+        field and unmarked entries are all in the same group.  Override to
+        define other groups.
+        """
+        if entry.get('_independent'):
+            return object()
+        return entry.get('_orderingGroup')
+
+    def get_har_dependencies(self, plans, done=()):
+        """
+        Return the positions of the earlier entries each entry depends on.
+
+        An entry depends on the entries it is linked to, see
+        `har_plan_links()` which is also passed the `done` entry ids, and on
+        the previous entry in its ordering group, see `get_ordering_group()`.
+        With `har_unsafe_barriers`, entries with methods other than
+        `SAFE_METHODS` are barriers instead of unmarked entries being in one
+        ordering group: they depend on all earlier entries and all later
+        entries depend on them, except those marked `_independent`.
+        """
+        dependencies = []
+        previous = {}
+        barrier = None
+        since_barrier = []
+        for position, (plan, depends) in enumerate(
+                zip(plans, har_plan_links(plans, done))):
+            entry = plan.entry
+            group = self.get_ordering_group(entry)
+            if group is not None or not self.har_unsafe_barriers:
+                if group in previous:
+                    depends.add(previous[group])
+                previous[group] = position
+
+            if self.har_unsafe_barriers and not entry.get('_independent'):
+                if barrier is not None:
+                    depends.add(barrier)
+                if plan.method.upper() in SAFE_METHODS:
+                    since_barrier.append(position)
+                else:
+                    depends.update(since_barrier)
+                    barrier = position
+                    since_barrier = []
+            dependencies.append(frozenset(depends))
+        return dependencies
+
+    def schedule_har_plans(self, plans, assert_entry):
+        """
+        Assert the entry plans concurrently as their dependencies are met.
+
+        Calls `assert_entry(plan)` on `har_workers` threads for each plan once
+        all the plans it depends on, see `get_har_dependencies()`, have
+        passed.  Of the plans ready to run, those with the longest path of
+        dependent plans, weighted by their HAR `time`, run first so that the
+        total time approaches that of the critical path.  The dependents of a
+        failing plan are not run.
+
+        The plans are read and scheduled `har_schedule_window` at a time, each
+        window once all plans in the previous one have passed, so that memory
+        use stays bounded for streamed HARs.  No later windows are run once a
+        plan has failed.  Returns the responses other than `None` and the
+        assertion errors by plan position.
+        """
+        plans = iter(plans)
+        responses = {}
+        errors = {}
+        done = set()
+        offset = 0
+        with futures.ThreadPoolExecutor(self.har_workers) as executor:
+            while not errors:
+                window = list(itertools.islice(
+                    plans, self.har_schedule_window))
+                if not window:
+                    break
+                dependencies = self.get_har_dependencies(window, done)
+                dependents = [[] for _ in window]
+                for position, depends in enumerate(dependencies):
+                    for other in depends:
+                        dependents[other].append(position)
+                ranks = [0] * len(window)
+                for position in reversed(range(len(window))):
+                    ranks[position] = (
+                        window[position].entry.get('time') or 1) + max(
+                            [ranks[other] for other in dependents[position]]
+                            or [0])
+
+                waiting = [len(depends) for depends in dependencies]
+                ready = [
+                    (-ranks[position], position)
+                    for position in range(len(window))
+                    if not waiting[position]]
+                heapq.heapify(ready)
+                running = {}
+                while ready or running:
+                    while ready and len(running) < self.har_workers:
+                        _, position = heapq.heappop(ready)
+                        running[executor.submit(
+                            assert_entry, window[position])] = position
+                    done_futures, _ = futures.wait(
+                        running, return_when=futures.FIRST_COMPLETED)
+                    for future in done_futures:
+                        position = running.pop(future)
+                        try:
+                            response = future.result()
+                        except HAREntryAssertionError as exc:
+                            responses[offset + position] = exc.response
+                            errors[offset + position] = exc
+                            continue
+                        if response is not None:
+                            responses[offset + position] = response
+                        for other in dependents[position]:
+                            waiting[other] -= 1
+                            if not waiting[other]:
+                                heapq.heappush(ready, (-ranks[other], other))
+
+                done.update(
+                    plan.entry['_id'] for plan in window
+                    if '_id' in plan.entry)
+                offset += len(window)
+        return responses, errors
 
     def get_reason(self, response):
         """
@@ -92,128 +1795,932 @@ class HARTestCase(unittest.TestCase):
         raise NotImplementedError(  # pragma: no cover
             'Subclasses must override `get_text`')
 
-    def assertHAR(self, har):
+    def iter_content(self, response):
+        """
+        Iterate over the implementation-specific response body bytes.
+
+        Called for binary entries whose request was sent with `stream=True`
+        so that the body is not held in memory.
+        """
+        raise NotImplementedError(  # pragma: no cover
+            'Subclasses must override `iter_content`')
+
+    def get_json(self, response):
+        """
+        Decode the response body JSON using the selected JSON codec.
+        """
+        return json_codec.loads(self.get_text(response))
+
+    def get_request_headers(self, response, request):
+        """
+        Lookup the headers actually sent for the response's request.
+
+        Defaults to the headers passed to `request_har()`.
+        """
+        return request["headers"]
+
+    def compileHAR(self, example_har):
+        """
+        Return the cached compiled plan for a HAR file.
+
+        Pass the plan to `assertHAR()` to skip re-compiling the HAR
+        assertions for every test that replays the same HAR file.
+        """
+        return self.har_cache.compile(
+            self.har_path(example_har), self.JSON_MIME_TYPE_RE)
+
+    def assertHAR(self, har, keep_responses=True, output=None, select=None):
         """
         Send requests in the HAR and make assertions on the HAR responses.
+
+        The HAR may be a parsed HAR, a plan from `compileHAR()` or
+        `compile_har()`, an index from `indexHAR()`, or an iterable of
+        entries, such as from `iter_har_entries()`, in which case each entry
+        is dropped once its response has been asserted.  Pass
+        `keep_responses=False` to also drop each response and return an empty
+        list so that memory use is bounded by the largest single entry.
+
+        Pass a `HARSelector`, or a dict of its criteria, as `select` to only
+        replay the matching entries, such as `select=dict(method='POST')`.
+
+        Variables captured from responses, starting with `har_variables`, are
+        substituted into the templates of later entries.
+
+        If `har_workers` is set, entries are sent concurrently as scheduled
+        by `schedule_har_plans()`, reading `har_schedule_window` entries at a
+        time.  The responses are returned in HAR order and the failure for
+        the first failing entry in HAR order is raised once all entries are
+        done.  Entries are written to any output HAR in the order their
+        responses are received.
+
+        If an `output` path, or `har_output`, is given, the actual requests
+        and responses are streamed to it as a HAR, including any failing
+        entry.
+
+        When recording, see `is_har_recording()`, the responses are recorded
+        by `recordHAR()` instead of asserted.
         """
-        responses = []
-        for entry in har["log"]["entries"]:
-            headers = array_to_dict(entry["request"].get("headers", []))
-            request = dict(
-                method=entry["request"]["method"],
-                url=entry["request"]["url"],
-                headers=headers)
-
-            post = entry["request"].get('postData')
-            if post is not None:
-                headers['Content-Type'] = post["mimeType"]
-                request['data'] = post["text"]
+        if self.is_har_recording():
+            if select is not None:
+                raise ValueError('Cannot select entries when recording')
+            return self.recordHAR(
+                har, keep_responses=keep_responses, output=output)
 
-            response = self.request_har(**request)
-            responses.append(response)
-            failures = collections.OrderedDict()
+        if self.har_workers and not self.har_thread_safe:
+            raise ValueError(
+                '{0} does not support concurrent requests'.format(
+                    type(self).__name__))
 
-            reason = self.get_reason(response)
-            response_headers = self.get_headers(response)
-            text = self.get_text(response)
+        writer = self.open_har_output(output)
+        variables = dict(self.har_variables or {})
+        plans = iter_har_plans(select_har(har, select), self.JSON_MIME_TYPE_RE)
+        try:
+            if self.har_workers:
+                def assert_entry(plan):
+                    response = self.assertHAREntry(
+                        plan, writer=writer, variables=variables)
+                    if keep_responses:
+                        return response
 
-            response_status = response.status_code
-            expected_status = entry["response"]["status"]
-            try:
-                self.assertEqual(
-                    response_status, expected_status,
-                    'Wrong response status code')
-            except AssertionError as exc:
-                failures['status'] = exc
+                responses, errors = self.schedule_har_plans(
+                    plans, assert_entry)
+                if errors:
+                    raise errors[min(errors)]
+                if not keep_responses:
+                    return []
+                return [responses[index] for index in sorted(responses)]
+
+            responses = []
+            for plan in plans:
+                response = self.assertHAREntry(
+                    plan, writer=writer, variables=variables)
+                if keep_responses:
+                    responses.append(response)
+            return responses
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def assertHAREntry(self, plan, writer=None, variables=None):
+        """
+        Send the request in one HAR entry and make assertions on the response.
+
+        The entry may also be an already compiled entry plan.  If given a
+        `HARWriter`, the actual request and response are written to it.  The
+        entry's templates are rendered with the variables, `har_variables`
+        by default, and its captures are set in them.
+        """
+        if not isinstance(plan, HAREntryPlan):
+            plan = compile_har_entry(
+                plan, json_mime_type_re=self.JSON_MIME_TYPE_RE)
+        if variables is None:
+            variables = dict(self.har_variables or {})
 
-            # BBB Python 2.7 str vs unicode compat
-            expected_reason = type(reason)(entry["response"]["statusText"])
+        response = self.send_har_entry(plan, variables)
+        if writer is not None:
+            writer.write_entry(self.get_har_entry(plan, response))
+        failures = self.check_har_entry(plan, response)
+        if not failures:
+            self.capture_har_values(plan, response, variables, failures)
+        if failures:
+            raise HAREntryAssertionError(response, failures)
+
+        return response
+
+    def capture_har_values(self, plan, response, variables, failures):
+        """
+        Set the variables captured from the response JSON by the entry plan.
+        """
+        if not plan.captures:
+            return
+        try:
+            value = self.get_json(response)
+        except ValueError:
+            value = None
+        for capture in plan.captures:
             try:
-                self.assertEqual(
-                    reason,
-                    expected_reason,
-                    'Wrong response status reason')
-            except AssertionError as exc:
-                failures['statusText'] = exc
+                variables[capture.name] = capture.extract(value)
+            except (LookupError, TypeError, ValueError) as exc:
+                path = '_captures/{0}'.format(capture.name)
+                failures[path] = self.har_failure(
+                    path, 'missing', capture.expression, None, self.fail,
+                    'Could not capture {0!r} from the response JSON at '
+                    '{1!r}: {2!r}'.format(
+                        capture.name, capture.expression, exc))
 
-            content_type = entry["response"]["content"].get("mimeType")
-            if content_type:
-                try:
-                    self.assertIn(
-                        'Content-Type', response_headers,
-                        'Missing response content type')
-                except AssertionError as exc:
-                    failures['content/mimeType'] = exc
-                else:
-                    expected_content_type = type(
-                        response_headers['Content-Type'])(
-                            entry["response"]["content"]["mimeType"])
-                    try:
-                        self.assertEqual(
-                            response_headers['Content-Type'],
-                            # BBB Python 2.7 str vs unicode compat
-                            expected_content_type,
-                            'Wrong response MIME type')
-                    except AssertionError as exc:
-                        failures['content/mimeType'] = exc
-
-            for header in entry["response"].get("headers", []):
-                header_name = header['name']
-                # BBB Python 2.7 str vs unicode compat
-                try:
-                    self.assertIn(
-                        header_name, response_headers,
-                        'Missing response header')
-                except AssertionError as exc:
-                    failures['headers/{0}'.format(header_name)] = exc
-                else:
-                    expected_header_value = type(
-                        response_headers[header_name])(header['value'])
-                    try:
-                        self.assertEqual(
-                            response_headers[header_name],
-                            expected_header_value,
-                            'Wrong response header {0!r} value'.format(
-                                header_name))
-                    except AssertionError as exc:
-                        failures['headers/{0}'.format(header_name)] = exc
-
-            expected_content = entry["response"]["content"]["text"]
-            if self.JSON_MIME_TYPE_RE.match(
-                    response_headers.get('Content-Type', '')) is not None:
-                # Support including JSON in the HAR content text
-                content = response.json()
-                if (
-                        isinstance(content, collections_abc.Mapping) and
-                        isinstance(expected_content, collections_abc.Mapping)):
-                    for key, value in expected_content.items():
-                        try:
-                            self.assertIn(key, content, 'Missing content key')
-                        except AssertionError as exc:
-                            failures['content/{0}'.format(key)] = exc
-                        else:
-                            try:
-                                self.assertEqual(
-                                    content[key], value,
-                                    'Wrong content {0!r} value'.format(key))
-                            except AssertionError as exc:
-                                failures['content/{0}'.format(key)] = exc
-                else:
-                    try:
-                        self.assertEqual(
-                            content, expected_content,
-                            'Response content does not match expected')
-                    except AssertionError as exc:
-                        failures['content/text'] = exc
+    def is_har_recording(self):
+        """
+        Return whether to record responses instead of asserting them.
+
+        Uses `har_record` if set, otherwise whether the `TEST_HAR_RECORD`
+        environment variable is set to anything other than empty, `0`,
+        `false` or `no`.
+        """
+        if self.har_record is not None:
+            return self.har_record
+        return os.environ.get(RECORD_ENV, '').strip().lower() not in (
+            '', '0', 'false', 'no')
+
+    def recordHAR(self, har, keep_responses=True, output=None):
+        """
+        Send the requests in the HAR and record the actual responses into it.
+
+        The HAR is written to the `output` path, `har_record_output` or the
+        `example_har` file, replacing it only once all entries are recorded.
+        Each entry keeps its original request and extension fields, such as
+        `comment`, with the response, time and timings replaced by the actual
+        ones.  Sensitive values are scrubbed as configured by
+        `har_scrub_headers` and `har_scrub_patterns`.  Response bodies up to
+        `har_record_inline_max` bytes are recorded inline, JSON as parsed
+        JSON, text as is and anything else base64 encoded.  Larger bodies are
+        written to `_file`s in a `*.bodies` directory next to the HAR file
+        and recorded with their `size` and `_sha256` digest.  The other fields
+        of a parsed HAR's `log`, such as `pages` and `_fixtures`, are kept.
+        """
+        path = output or self.har_record_output
+        if path is None:
+            if self.example_har is None:
+                raise ValueError(
+                    'Recording requires `output`, `har_record_output` or '
+                    '`example_har`')
+            path = self.har_path(self.example_har)
+        bodies = re.sub(r'(\.har)?(\.json)?$', '', path) + '.bodies'
+
+        log = None
+        if isinstance(har, collections_abc.Mapping):
+            log = har["log"]
+        responses = []
+        variables = dict(self.har_variables or {})
+        tmp_path = path + '.tmp'
+        try:
+            with HARWriter(tmp_path, log=log) as writer:
+                for plan in iter_har_plans(har, self.JSON_MIME_TYPE_RE):
+                    # Stream all bodies so large ones aren't held in memory
+                    response = self.send_har_entry(
+                        plan, variables, stream=not plan.captures)
+                    writer.write_entry(self.get_har_record_entry(
+                        plan, response, bodies))
+                    failures = collections.OrderedDict()
+                    self.capture_har_values(
+                        plan, response, variables, failures)
+                    if failures:
+                        raise HAREntryAssertionError(response, failures)
+                    if keep_responses:
+                        responses.append(response)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, path)
+        return responses
+
+    def get_har_record_entry(self, plan, response, bodies):
+        """
+        Return the entry to record for the actual response, scrubbed.
+        """
+        actual = self.get_har_entry(
+            plan, response,
+            content=self.get_har_record_content(plan, response, bodies))
+        entry = collections.OrderedDict(plan.entry)
+        request = plan.entry["request"]
+        entry["request"] = dict(
+            request, headers=self.scrub_har_headers(
+                request.get("headers", [])))
+        for key in ("startedDateTime", "time", "cache", "timings"):
+            entry[key] = actual[key]
+        ignored = {name.lower() for name in self.har_record_ignore_headers}
+        entry["response"] = actual["response"]
+        entry["response"]["headers"] = self.scrub_har_headers(
+            header for header in actual["response"]["headers"]
+            if header["name"].lower() not in ignored)
+        return scrub_har_value(entry, self.har_scrub_patterns)
+
+    def scrub_har_headers(self, headers):
+        """
+        Return the HAR headers with the values in `har_scrub_headers` replaced.
+        """
+        scrubbed = {name.lower() for name in self.har_scrub_headers}
+        return [
+            dict(header, value=self.har_scrub_replacement)
+            if header["name"].lower() in scrubbed else header
+            for header in headers]
+
+    def get_har_record_content(self, plan, response, bodies):
+        """
+        Return the HAR content to record for a streamed response body.
+
+        The body is hashed as it is read and is written to a file in the
+        `bodies` directory once larger than `har_record_inline_max`.
+        """
+        mime_type = self.get_headers(response).get('Content-Type', 'x-unknown')
+        # Name the file from the rendered URL, the plan's may be a template
+        body_name = '{0:04d}-{1}-{2}{3}'.format(
+            plan.index, plan.method,
+            har_url_slug(response.har_request["url"]),
+            mimetypes.guess_extension(
+                mime_type.split(';')[0].strip()) or '.bin')
+        digest = hashlib.sha256()
+        size = 0
+        chunks = []
+        body_path = body_file = None
+        try:
+            for chunk in self.iter_content(response):
+                digest.update(chunk)
+                size += len(chunk)
+                if body_file is not None:
+                    body_file.write(chunk)
+                    continue
+                chunks.append(chunk)
+                if size > self.har_record_inline_max:
+                    if not os.path.isdir(bodies):
+                        os.makedirs(bodies)
+                    body_path = os.path.join(bodies, body_name)
+                    body_file = io.open(body_path, 'wb')
+                    body_file.writelines(chunks)
+                    chunks = None
+        finally:
+            if body_file is not None:
+                body_file.close()
+
+        content = collections.OrderedDict([
+            ("size", size), ("mimeType", mime_type)])
+        if body_path is not None:
+            content["_sha256"] = digest.hexdigest()
+            content["_file"] = os.path.relpath(
+                body_path, os.path.dirname(os.path.abspath(bodies)))
+            return content
+
+        body = b''.join(chunks)
+        if body and self.JSON_MIME_TYPE_RE.match(mime_type):
+            try:
+                content["text"] = json_codec.loads(body)
+            except ValueError:
+                pass
             else:
+                return content
+        try:
+            content["text"] = body.decode('utf-8')
+        except UnicodeDecodeError:
+            content["text"] = base64.b64encode(body).decode('ascii')
+            content["encoding"] = "base64"
+        return content
+
+    def open_har_output(self, output=None):
+        """
+        Return a writer for the output path or `har_output` if either is set.
+        """
+        output = output or self.har_output
+        if output is None:
+            return None
+        return HARWriter(output)
+
+    def get_har_entry(self, plan, response, content=None):
+        """
+        Return a HAR 1.2 entry for the actual request and response.
+
+        The response content is taken from the response unless given.
+        """
+        request = response.har_request
+        har_request = collections.OrderedDict([
+            ("method", request["method"]),
+            ("url", request["url"]),
+            ("httpVersion", "HTTP/1.1"),
+            ("cookies", []),
+            ("headers", [
+                dict(name=name, value=value) for name, value in
+                self.get_request_headers(response, request).items()]),
+            ("queryString", [
+                dict(name=name, value=value) for name, value in
+                urllib_parse.parse_qsl(
+                    urllib_parse.urlsplit(request["url"]).query)]),
+            ("headersSize", -1),
+            ("bodySize", -1),
+        ])
+        if plan.has_data:
+            data = request["data"]
+            if not isinstance(data, str):
+                data = json_codec.dumps(data)
+            har_request["postData"] = dict(
+                mimeType=request["headers"]["Content-Type"], text=data)
+
+        response_headers = self.get_headers(response)
+        mime_type = response_headers.get('Content-Type', 'x-unknown')
+        if content is not None:
+            pass
+        elif plan.stream:
+            # Leave streamed bodies to be consumed by the assertions
+            content = dict(
+                size=-1, mimeType=mime_type,
+                comment='Streamed body not recorded')
+        else:
+            text = self.get_text(response)
+            content = dict(
+                size=len(text.encode('utf-8')), text=text,
+                mimeType=mime_type)
+        return collections.OrderedDict([
+            ("startedDateTime", response.har_started.isoformat()),
+            ("time", response.har_time),
+            ("request", har_request),
+            ("response", collections.OrderedDict([
+                ("status", response.status_code),
+                ("statusText", self.get_reason(response)),
+                ("httpVersion", "HTTP/1.1"),
+                ("cookies", []),
+                ("headers", [
+                    dict(name=name, value=value)
+                    for name, value in response_headers.items()]),
+                ("content", content),
+                ("redirectURL", response_headers.get('Location', '')),
+                ("headersSize", -1),
+                ("bodySize", -1),
+            ])),
+            ("cache", {}),
+            ("timings", collections.OrderedDict([
+                ("blocked", -1), ("dns", -1), ("connect", -1),
+                ("send", 0), ("wait", response.har_time), ("receive", 0),
+            ])),
+        ] + self.get_har_query_fields(response))
+
+    def get_har_query_fields(self, response):
+        """
+        Return the `_queries` and `_dbTime` fields of an output entry.
+
+        The fields are only included for backends that capture the database
+        queries made for the request, see `check_har_queries()`.
+        """
+        queries = getattr(response, 'har_queries', None)
+        if queries is None:
+            return []
+        return [("_queries", len(queries)), ("_dbTime", response.har_db_time)]
+
+    def send_har_entry(self, plan, variables=None, **kwargs):
+        """
+        Send the request for an entry plan and time it.
+
+        The plan's templates are rendered with the variables and any keyword
+        arguments override those of the request.  The request sent is set as
+        `har_request` on the response, the time taken in milliseconds as
+        `har_time` and the UTC start time as `har_started`.
+        """
+        request = plan.request_kwargs(variables)
+        request.update(kwargs)
+        profile_dir = self.get_har_profile_dir()
+        started = datetime.datetime.now(datetime.timezone.utc)
+        start = timeit.default_timer()
+        if profile_dir is None:
+            response = self.request_har(**request)
+        else:
+            with self.profile_har_request(plan, request, profile_dir):
+                response = self.request_har(**request)
+        response.har_time = (timeit.default_timer() - start) * 1000
+        response.har_started = started
+        response.har_request = request
+        return response
+
+    def get_har_profile_dir(self):
+        """
+        Return the directory for this test's profiles or `None` to not profile.
+
+        Uses `har_profile_dir` if set, otherwise the `TEST_HAR_PROFILE`
+        environment variable.  Each test writes to a sub-directory named by
+        its test id.
+        """
+        profile_dir = self.har_profile_dir or os.environ.get(PROFILE_ENV)
+        if not profile_dir:
+            return None
+        return os.path.join(profile_dir, self.id())
+
+    @contextlib.contextmanager
+    def profile_har_request(self, plan, request, profile_dir):
+        """
+        Profile sending one request and write the profiles to the directory.
+
+        The CPU profile of the sending thread is written for `pstats` to
+        `{index}-{METHOD}-{slug}.prof` and the memory allocated while
+        sending to a `tracemalloc` snapshot in `.tracemalloc`.  The index
+        counts the requests profiled by the test.  Profiled requests are
+        sent one at a time and the profiler overhead is included in the
+        response's `har_time`.  A `summary.json` ranking the requests by CPU
+        time and allocated bytes is written when the test finishes.
+        """
+        with PROFILE_LOCK:
+            if not self.har_profiles:
+                if not os.path.isdir(profile_dir):
+                    os.makedirs(profile_dir)
+                self.addCleanup(self.write_har_profile_summary, profile_dir)
+            stem = '{0:04d}-{1}-{2}'.format(
+                len(self.har_profiles), request["method"].upper(),
+                har_url_slug(request["url"]))
+            profile = collections.OrderedDict([
+                ("index", len(self.har_profiles)), ("entry", plan.index),
+                ("method", request["method"]), ("url", request["url"]),
+                ("cpuTime", None), ("allocated", None),
+                ("profile", None), ("snapshot", None),
+            ])
+            self.har_profiles.append(profile)
+
+            profiler = None
+            if self.har_profile_cpu:
+                profiler = cProfile.Profile(time.thread_time)
+            tracing = False
+            if self.har_profile_memory:
+                tracing = not tracemalloc.is_tracing()
+                if tracing:
+                    tracemalloc.start()
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+            try:
+                if profiler is not None:
+                    profiler.enable()
                 try:
-                    self.assertEqual(
-                        text, expected_content,
-                        'Wrong response content text')
-                except AssertionError as exc:
-                    failures['content/text'] = exc
+                    yield profile
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+                if self.har_profile_memory:
+                    profile["allocated"] = (
+                        tracemalloc.get_traced_memory()[1] - baseline)
+                    profile["snapshot"] = stem + '.tracemalloc'
+                    tracemalloc.take_snapshot().dump(
+                        os.path.join(profile_dir, profile["snapshot"]))
+            finally:
+                if tracing:
+                    tracemalloc.stop()
+            if profiler is not None:
+                profile["cpuTime"] = pstats.Stats(profiler).total_tt * 1000
+                profile["profile"] = stem + '.prof'
+                profiler.dump_stats(
+                    os.path.join(profile_dir, profile["profile"]))
+
+    def write_har_profile_summary(self, profile_dir):
+        """
+        Write the test's profiled requests ranked by CPU time and allocations.
+        """
+        summary = collections.OrderedDict(
+            (key, sorted(
+                (profile for profile in self.har_profiles
+                 if profile[key] is not None),
+                key=lambda profile: profile[key], reverse=True))
+            for key in ("cpuTime", "allocated"))
+        summary_path = os.path.join(profile_dir, 'summary.json')
+        with open(summary_path, 'w') as summary_file:
+            json.dump(summary, summary_file, indent=2)
 
-            if failures:
-                raise HAREntryAssertionError(response, failures)
+    def check_har_entry(self, plan, response):
+        """
+        Make the assertions in the entry plan and return any failures.
+        """
+        failures = collections.OrderedDict()
+        response_headers = self.get_headers(response)
+        for check in plan.checks:
+            getattr(self, check.assertion)(
+                check, response, response_headers, failures)
+        return failures
 
-        return responses
+    def har_failure(self, path, kind, expected, actual, assertion, *args):
+        """
+        Record a failure whose message is formatted by the assertion lazily.
+        """
+        return HARFailure(path, kind, expected, actual, assertion, *args)
+
+    def check_har_status(self, check, response, response_headers, failures):
+        """
+        Assert the response status code.
+        """
+        status = response.status_code
+        if status != check.expected:
+            failures[check.path] = self.har_failure(
+                check.path, 'value', check.expected, status,
+                self.assertEqual, status, check.expected,
+                'Wrong response status code')
+
+    def check_har_status_text(
+            self, check, response, response_headers, failures):
+        """
+        Assert the response status reason.
+        """
+        reason = self.get_reason(response)
+        # BBB Python 2.7 str vs unicode compat
+        expected = type(reason)(check.expected)
+        if reason != expected:
+            failures[check.path] = self.har_failure(
+                check.path, 'value', expected, reason,
+                self.assertEqual, reason, expected,
+                'Wrong response status reason')
+
+    def check_har_mime_type(
+            self, check, response, response_headers, failures):
+        """
+        Assert the response content type.
+        """
+        if 'Content-Type' not in response_headers:
+            failures[check.path] = self.har_failure(
+                check.path, 'missing', check.expected, None,
+                self.assertIn, 'Content-Type', response_headers,
+                'Missing response content type')
+            return
+        content_type = response_headers['Content-Type']
+        # BBB Python 2.7 str vs unicode compat
+        expected = type(content_type)(check.expected)
+        if content_type != expected:
+            failures[check.path] = self.har_failure(
+                check.path, 'value', expected, content_type,
+                self.assertEqual, content_type, expected,
+                'Wrong response MIME type')
+
+    def check_har_header(self, check, response, response_headers, failures):
+        """
+        Assert a response header value.
+        """
+        if check.name not in response_headers:
+            failures[check.path] = self.har_failure(
+                check.path, 'missing', check.expected, None,
+                self.assertIn, check.name, response_headers,
+                'Missing response header')
+            return
+        value = response_headers[check.name]
+        # BBB Python 2.7 str vs unicode compat
+        expected = type(value)(check.expected)
+        if value != expected:
+            failures[check.path] = self.har_failure(
+                check.path, 'value', expected, value,
+                self.assertEqual, value, expected,
+                'Wrong response header {0!r} value'.format(check.name))
+
+    def check_har_timings(self, check, response, response_headers, failures):
+        """
+        Assert the time taken is within the entry's latency budgets.
+
+        The budgets are the absolute `_maxTime` HAR extension field and the
+        recorded HAR `time` times `har_time_factor`, both in milliseconds.
+        """
+        recorded, max_time = check.expected
+        budgets = []
+        if max_time is not None:
+            budgets.append((max_time, '_maxTime'))
+        if self.har_time_factor and recorded is not None and recorded >= 0:
+            budgets.append((
+                recorded * self.har_time_factor,
+                'time * {0!r}'.format(self.har_time_factor)))
+        for budget, description in budgets:
+            if response.har_time > budget:
+                failures[check.path] = self.har_failure(
+                    check.path, 'timing', budget, response.har_time,
+                    self.assertLessEqual, response.har_time, budget,
+                    'Response slower than {0} in milliseconds'.format(
+                        description))
+                return
+
+    def check_har_queries(self, check, response, response_headers, failures):
+        """
+        Assert the number of database queries is within the `_maxQueries`.
+
+        Backends that capture the queries made for a request set them on the
+        response as `har_queries`, a list of `(sql, time)` tuples, and their
+        total time in milliseconds as `har_db_time`.  The query budgets are
+        ignored for other backends.
+        """
+        queries = getattr(response, 'har_queries', None)
+        if queries is None or len(queries) <= check.expected:
+            return
+        sql, count = collections.Counter(
+            sql for sql, _ in queries).most_common(1)[0]
+        failures[check.path] = self.har_failure(
+            check.path, 'queries', check.expected, len(queries),
+            self.assertLessEqual, len(queries), check.expected,
+            'Response made more database queries than _maxQueries, '
+            'repeated {0} times: {1}'.format(count, sql))
+
+    def check_har_db_time(self, check, response, response_headers, failures):
+        """
+        Assert the database time is within the `_maxDbTime` in milliseconds.
+        """
+        db_time = getattr(response, 'har_db_time', None)
+        if db_time is None or db_time <= check.expected:
+            return
+        failures[check.path] = self.har_failure(
+            check.path, 'timing', check.expected, db_time,
+            self.assertLessEqual, db_time, check.expected,
+            'Response database queries slower than _maxDbTime '
+            'in milliseconds')
+
+    def check_har_content(self, check, response, response_headers, failures):
+        """
+        Assert the response body content.
+
+        If the response is JSON, assert against the parsed JSON.  If both are
+        objects or arrays, compare them with `diff_json()` so that only the
+        keys in the HAR, at any depth, are asserted and each difference is a
+        separate failure at its JSON pointer path under `content`.
+        """
+        content_type = response_headers.get('Content-Type', '')
+        if content_type == check.name:
+            is_json = check.json
+        else:
+            is_json = self.JSON_MIME_TYPE_RE.match(content_type) is not None
+
+        if not is_json:
+            text = self.get_text(response)
+            if text != check.expected:
+                failures[check.path] = self.har_failure(
+                    check.path, 'value', check.expected, text,
+                    self.assertEqual, text, check.expected,
+                    'Wrong response content text')
+            return
+
+        # Support including JSON in the HAR content text
+        content = self.get_json(response)
+        if check.container is not None and isinstance(
+                content, check.container):
+            for difference in diff_json(
+                    content, check.expected,
+                    limit=self.har_max_content_failures):
+                path = 'content' + difference.pointer
+                failures[path] = self.har_failure(
+                    path, difference.kind, difference.expected,
+                    difference.actual, self.fail_json_difference, difference)
+        elif content != check.expected:
+            failures[check.path] = self.har_failure(
+                check.path, 'value', check.expected, content,
+                self.assertEqual, content, check.expected,
+                'Response content does not match expected')
+
+    def check_har_body(self, check, response, response_headers, failures):
+        """
+        Assert the size and SHA-256 digest of a binary or external body.
+
+        The response body is hashed in `har_chunk_size` chunks as it is
+        streamed so that it is never held in memory.
+        """
+        expected_size, expected_digest = self.get_har_body_digest(
+            check.expected)
+        size, actual_digest = self.get_body_digest(response)
+
+        if expected_size is not None and size != expected_size:
+            failures['content/size'] = self.har_failure(
+                'content/size', 'value', expected_size, size,
+                self.assertEqual, size, expected_size,
+                'Wrong response content size')
+        if actual_digest != expected_digest:
+            failures['content/_sha256'] = self.har_failure(
+                'content/_sha256', 'value', expected_digest, actual_digest,
+                self.assertEqual, actual_digest, expected_digest,
+                'Wrong response content SHA-256 digest')
+
+    def get_body_digest(self, response):
+        """
+        Return the size and SHA-256 hex digest of the streamed response body.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        for chunk in self.iter_content(response):
+            digest.update(chunk)
+            size += len(chunk)
+        return size, digest.hexdigest()
+
+    def get_har_body_digest(self, content):
+        """
+        Return the expected size and SHA-256 hex digest of HAR content.
+
+        The digest is taken from the `_sha256` HAR extension field if given.
+        Otherwise it is computed from the `_file` HAR extension field path,
+        relative to the HAR file, see `get_har_base_dir()`, and read through
+        `mmap`, or from the base64 decoded `text`.  The HAR `size` is the
+        uncompressed size and takes precedence, the `compression` field is
+        ignored since responses are decompressed as they are streamed.
+        """
+        if '_sha256' in content:
+            size, digest = None, content['_sha256'].lower()
+        elif '_file' in content:
+            size, digest = self.har_cache.digest(os.path.join(
+                self.get_har_base_dir(), content['_file']))
+        else:
+            body = base64.b64decode(content.get('text', ''))
+            size, digest = len(body), hashlib.sha256(body).hexdigest()
+        if content.get('size', -1) >= 0:
+            size = content['size']
+        return size, digest
+
+    def fail_json_difference(self, difference):
+        """
+        Fail with the message for a JSON content difference.
+
+        Large values and mismatched types are formatted with truncated
+        representations to skip slow rendering of large diffs.
+        """
+        # Relative to the content root
+        pointer = difference.pointer[1:]
+        actual = difference.actual
+        expected = difference.expected
+        if difference.kind == 'missing':
+            self.assertIn(difference.key, actual, 'Missing content key')
+        elif difference.kind == 'length':
+            self.assertEqual(
+                len(actual), len(expected),
+                'Wrong content {0!r} length'.format(pointer))
+        elif (
+                json_container(actual) is None and
+                json_container(expected) is None and not (
+                    isinstance(actual, str) and isinstance(expected, str) and
+                    max(len(actual), len(expected)) >
+                    self.har_diff_threshold)):
+            self.assertEqual(
+                actual, expected, 'Wrong content {0!r} value'.format(pointer))
+        raise self.failureException(self._formatMessage(
+            'Wrong content {0!r} value'.format(pointer),
+            '{0} != {1}'.format(
+                unittest_util.safe_repr(actual, short=True),
+                unittest_util.safe_repr(expected, short=True))))
+
+    def loadHAR(
+            self, har, iterations=None, duration=None, concurrency=1,
+            assert_sample=0):
+        """
+        Replay the HAR as a load test and report throughput and latency.
+
+        Each worker replays all the entries in the HAR until either the
+        total number of `iterations` through the HAR have been started or
+        the `duration` in seconds has passed, defaulting to one iteration.
+        Assertions are made on the given random sample fraction of responses
+        and any failures are collected in the report instead of being
+        raised.
+        """
+        if iterations is None and duration is None:
+            iterations = 1
+        if concurrency > 1 and not self.har_thread_safe:
+            raise ValueError(
+                '{0} does not support concurrent requests'.format(
+                    type(self).__name__))
+        if not isinstance(har, HARPlan):
+            har = compile_har(har, self.JSON_MIME_TYPE_RE)
+
+        report = HARLoadReport()
+        lock = threading.Lock()
+        remaining = [iterations]
+        start = timeit.default_timer()
+        deadline = duration and start + duration
+
+        def replay():
+            sample = random.Random()
+            latencies = collections.OrderedDict()
+            failures = []
+            while True:
+                with lock:
+                    if iterations is not None:
+                        if remaining[0] <= 0:
+                            break
+                        remaining[0] -= 1
+                if deadline and timeit.default_timer() >= deadline:
+                    break
+                variables = dict(self.har_variables or {})
+                for plan in har:
+                    response = self.send_har_entry(plan, variables)
+                    latencies.setdefault('{0} {1}'.format(
+                        plan.method, plan.entry["request"]["url"]), []).append(
+                            response.har_time / 1000)
+                    if assert_sample and sample.random() < assert_sample:
+                        entry_failures = self.check_har_entry(plan, response)
+                        if entry_failures:
+                            failures.append(HAREntryAssertionError(
+                                response, entry_failures))
+                    capture_failures = collections.OrderedDict()
+                    self.capture_har_values(
+                        plan, response, variables, capture_failures)
+                    if capture_failures:
+                        # Later entries can't be sent without the variables
+                        failures.append(HAREntryAssertionError(
+                            response, capture_failures))
+                        break
+            report.add(latencies, failures)
+
+        if concurrency > 1:
+            with futures.ThreadPoolExecutor(concurrency) as executor:
+                # Consume the results to re-raise any exceptions
+                list(executor.map(
+                    lambda worker: replay(), range(concurrency)))
+        else:
+            replay()
+
+        report.elapsed = timeit.default_timer() - start
+        return report
+
+
+def har_entry_group(entry):
+    """
+    Return the `_orderingGroup` HAR extension field of an entry.
+
+    Entries without one are each in their own group unless linked to others.
+    """
+    return entry.get('_orderingGroup')
+
+
+def har_entries_test_doc(plan):
+    """
+    Return the docstring of a generated test for the entries in the plan.
+    """
+    request = plan[0].entry["request"]
+    doc = plan[0].entry.get('comment') or '{0} {1}'.format(
+        request["method"], request["url"])
+    if len(plan) > 1:
+        doc += ' and {0} more HAR entries'.format(len(plan) - 1)
+    return doc
+
+
+def har_entry_tests(example_har, group=har_entry_group):
+    """
+    Class decorator generating one test method per HAR entry or entry group.
+
+    The HAR file is resolved relative to the test case module and parsed and
+    compiled once, through the class's `har_cache`, when the class is
+    decorated.  Entries linked to each other, such as by captured variables,
+    see `har_plan_links()`, and entries for which `group(entry)` returns the
+    same value other than `None` are asserted in order by one test.  Test
+    names start with the zero padded index of the first entry so that they
+    run in HAR order, for example `test_har_0_POST_users`::
+
+        @test_har.har_entry_tests('example.har.json')
+        class ExampleTests(test_har.HARTestCase):
+            ...
+
+    Each entry then passes or fails separately and parallel test runners may
+    distribute the tests across processes.
+    """
+    def decorate(cls):
+        plan = cls.har_cache.compile(
+            os.path.join(os.path.dirname(inspect.getfile(cls)), example_har),
+            cls.JSON_MIME_TYPE_RE)
+        # Join linked entries and grouped entries into one group of entries
+        roots = []
+        first = {}
+
+        def find(position):
+            while roots[position] != position:
+                position = roots[position]
+            return position
+
+        for position, (entry_plan, linked) in enumerate(
+                zip(plan, har_plan_links(plan))):
+            roots.append(position)
+            key = group(entry_plan.entry)
+            if key is not None:
+                linked.add(first.setdefault(key, position))
+            for other in linked:
+                root, other_root = sorted((find(position), find(other)))
+                roots[other_root] = root
+        groups = collections.OrderedDict()
+        for position, entry_plan in enumerate(plan):
+            groups.setdefault(find(position), []).append(entry_plan)
+
+        width = len(str(len(plan) - 1))
+        for plans in groups.values():
+            request = plans[0].entry["request"]
+            name = 'test_har_{0:0{1}d}_{2}_{3}'.format(
+                plans[0].index, width, request["method"],
+                har_url_slug(request["url"]))
+            plan = HARPlan(plans)
+            test = cls.make_har_entries_test(plan)
+            test.__doc__ = har_entries_test_doc(plan)
+            setattr(cls, name, test)
+        return cls
+
+    return decorate
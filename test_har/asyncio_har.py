@@ -0,0 +1,286 @@
+import asyncio
+import collections
+import datetime
+import hashlib
+import random
+import timeit
+import unittest
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    # Only needed by `HARHTTPXTestCase`
+    httpx = None
+
+import test_har
+from test_har import *  # noqa
+
+
+class HARAsyncTestCase(
+        unittest.IsolatedAsyncioTestCase, test_har.HARTestCase):
+    """
+    Run tests using HTTP Archive (HAR) files from an asyncio event loop.
+
+    `assertHAR()` and `assertHAREntry()` are coroutines to be awaited from
+    async test methods.  Subclasses implement `request_har()` as a coroutine
+    and, for streamed binary bodies, hash the body as it is received into a
+    `(size, hexdigest)` tuple set as `har_body_digest` on the response.
+    """
+
+    # Maximum number of requests in flight at once, independent entries are
+    # sent concurrently, see `get_har_dependencies`
+    har_concurrency = 1
+
+    # Requests are sent from the test's event loop
+    har_thread_safe = False
+
+    @classmethod
+    def make_har_entries_test(cls, plan):
+        """
+        Return a coroutine test method awaiting the entries in the plan.
+        """
+        async def test(self):
+            await self.assertHAR(plan)
+
+        return test
+
+    async def assertHAR(
+            self, har, keep_responses=True, output=None, select=None):
+        """
+        Send requests in the HAR and make assertions on the HAR responses.
+
+        Each entry is sent once the entries it depends on have passed, see
+        `get_har_dependencies()`, with at most `har_concurrency` requests in
+        flight.  The dependents of a failing entry are not sent.  The
+        responses are returned in HAR order and the failure for the first
+        failing entry in HAR order is raised once all entries are done.
+        Recording is not supported so the test is skipped when recording.
+        """
+        if self.is_har_recording():
+            self.skipTest('The asyncio backend does not support recording')
+        plans = list(test_har.iter_har_plans(
+            test_har.select_har(har, select), self.JSON_MIME_TYPE_RE))
+        dependencies = self.get_har_dependencies(plans)
+
+        semaphore = asyncio.Semaphore(self.har_concurrency)
+        responses = {}
+        errors = {}
+        variables = dict(self.har_variables or {})
+        tasks = []
+
+        async def assert_plan(position, plan):
+            passed = await asyncio.gather(*(
+                tasks[other] for other in dependencies[position]))
+            if not all(passed):
+                return False
+            try:
+                async with semaphore:
+                    responses[position] = await self.assertHAREntry(
+                        plan, writer=writer, variables=variables)
+            except test_har.HAREntryAssertionError as exc:
+                responses[position] = exc.response
+                errors[position] = exc
+                return False
+            return True
+
+        writer = self.open_har_output(output)
+        try:
+            tasks.extend(
+                asyncio.ensure_future(assert_plan(position, plan))
+                for position, plan in enumerate(plans))
+            await asyncio.gather(*tasks)
+        finally:
+            if writer is not None:
+                writer.close()
+
+        if errors:
+            raise errors[min(errors)]
+        if not keep_responses:
+            return []
+        return [responses[index] for index in sorted(responses)]
+
+    async def assertHAREntry(self, plan, writer=None, variables=None):
+        """
+        Send the request in one HAR entry and make assertions on the response.
+        """
+        if not isinstance(plan, test_har.HAREntryPlan):
+            plan = test_har.compile_har_entry(
+                plan, json_mime_type_re=self.JSON_MIME_TYPE_RE)
+        if variables is None:
+            variables = dict(self.har_variables or {})
+
+        response = await self.send_har_entry(plan, variables)
+        if writer is not None:
+            writer.write_entry(self.get_har_entry(plan, response))
+        failures = self.check_har_entry(plan, response)
+        if not failures:
+            self.capture_har_values(plan, response, variables, failures)
+        if failures:
+            raise test_har.HAREntryAssertionError(response, failures)
+
+        return response
+
+    async def send_har_entry(self, plan, variables=None):
+        """
+        Send the request for an entry plan and time it.
+        """
+        request = plan.request_kwargs(variables)
+        started = datetime.datetime.now(datetime.timezone.utc)
+        start = timeit.default_timer()
+        response = await self.request_har(**request)
+        response.har_time = (timeit.default_timer() - start) * 1000
+        response.har_started = started
+        response.har_request = request
+        return response
+
+    async def loadHAR(
+            self, har, iterations=None, duration=None, concurrency=None,
+            assert_sample=0):
+        """
+        Replay the HAR as a load test and report throughput and latency.
+
+        As `HARTestCase.loadHAR()` but a coroutine replaying the HAR on
+        `concurrency` tasks in the test's event loop, `har_concurrency` by
+        default.
+        """
+        if iterations is None and duration is None:
+            iterations = 1
+        if concurrency is None:
+            concurrency = self.har_concurrency
+        if not isinstance(har, test_har.HARPlan):
+            har = test_har.compile_har(har, self.JSON_MIME_TYPE_RE)
+
+        report = test_har.HARLoadReport()
+        remaining = [iterations]
+        start = timeit.default_timer()
+        deadline = duration and start + duration
+
+        async def replay():
+            sample = random.Random()
+            latencies = collections.OrderedDict()
+            failures = []
+            while True:
+                if iterations is not None:
+                    if remaining[0] <= 0:
+                        break
+                    remaining[0] -= 1
+                if deadline and timeit.default_timer() >= deadline:
+                    break
+                variables = dict(self.har_variables or {})
+                for plan in har:
+                    response = await self.send_har_entry(plan, variables)
+                    latencies.setdefault('{0} {1}'.format(
+                        plan.method, plan.entry["request"]["url"]), []).append(
+                            response.har_time / 1000)
+                    if assert_sample and sample.random() < assert_sample:
+                        entry_failures = self.check_har_entry(plan, response)
+                        if entry_failures:
+                            failures.append(test_har.HAREntryAssertionError(
+                                response, entry_failures))
+                    capture_failures = collections.OrderedDict()
+                    self.capture_har_values(
+                        plan, response, variables, capture_failures)
+                    if capture_failures:
+                        # Later entries can't be sent without the variables
+                        failures.append(test_har.HAREntryAssertionError(
+                            response, capture_failures))
+                        break
+            report.add(latencies, failures)
+
+        await asyncio.gather(*(replay() for _ in range(concurrency)))
+        report.elapsed = timeit.default_timer() - start
+        return report
+
+    def get_body_digest(self, response):
+        """
+        Return the digest of the streamed body hashed by `request_har()`.
+        """
+        return response.har_body_digest
+
+
+class HARHTTPXTestCase(HARAsyncTestCase):
+    """
+    Run tests using HTTP Archive (HAR) files through an asyncio HTTP client.
+    """
+
+    # Connection pool options for the `httpx.AsyncClient` used to send entries
+    har_max_connections = 100
+    har_max_keepalive_connections = 20
+    har_timeout = 5.0
+
+    def make_har_client(self):
+        """
+        Return a new connection pooling async client for sending entries.
+        """
+        return httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.har_max_connections,
+                max_keepalive_connections=self.har_max_keepalive_connections),
+            timeout=self.har_timeout)
+
+    async def asyncSetUp(self):
+        """
+        Start the async client for this test.
+        """
+        await super(HARHTTPXTestCase, self).asyncSetUp()
+        self.har_client = self.make_har_client()
+        self.addAsyncCleanup(self.har_client.aclose)
+
+    async def request_har(
+            self, method, url, data=None, headers=None, stream=False):
+        """
+        Send the request using the test's pooled async client.
+
+        Streamed bodies are hashed as they are received and then released.
+        """
+        headers = headers or {}
+        request = self.har_client.build_request(
+            method, url, headers=headers, content=test_har.encode_har_data(
+                data, headers.get('Content-Type'), self.JSON_MIME_TYPE_RE))
+        if not stream:
+            return await self.har_client.send(request)
+
+        response = await self.har_client.send(request, stream=True)
+        try:
+            digest = hashlib.sha256()
+            size = 0
+            async for chunk in response.aiter_bytes(self.har_chunk_size):
+                digest.update(chunk)
+                size += len(chunk)
+        finally:
+            await response.aclose()
+        response.har_body_digest = (size, digest.hexdigest())
+        return response
+
+    def get_reason(self, response):
+        """
+        Lookup the async client response reason phrase.
+        """
+        return response.reason_phrase
+
+    def get_headers(self, req_or_resp):
+        """
+        Lookup the async client headers on a request or response.
+        """
+        return req_or_resp.headers
+
+    def get_json(self, response):
+        """
+        Decode the undecoded response body bytes using the JSON codec.
+        """
+        return test_har.json_codec.loads(response.content)
+
+    def get_request_headers(self, response, request):
+        """
+        Lookup the headers the async client actually sent.
+        """
+        return response.request.headers
+
+    def get_text(self, response):
+        """
+        Lookup the async client response body text.
+        """
+        return response.text
+
+
+HARTestCase = HARHTTPXTestCase
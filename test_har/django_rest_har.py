@@ -1,4 +1,11 @@
-import json
+import os
+import inspect
+import timeit
+import contextlib
+
+from django import db
+from django.db import transaction
+from django.core import serializers
 
 from rest_framework import test
 
@@ -11,24 +18,93 @@ class HARDRFTestCase(test.APITestCase, test_har.HARTestCase):
     Run tests using HTTP Archive (HAR) files through the Django ReST Framework.
     """
 
+    # The test client and test database transaction are bound to the thread
+    har_thread_safe = False
+
+    # Roll back the database changes of each entry once it has been sent so
+    # that every entry sees the same test data
+    har_entry_rollback = False
+
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Create the test data for the example HAR once for the whole class.
+
+        The `_fixtures` of the example HAR are loaded and then
+        `setUpHARTestData()` is called.  Each test's changes are rolled back
+        to this test data by its transaction instead of it being rebuilt.
+        """
+        super(HARDRFTestCase, cls).setUpTestData()
+        if cls.example_har is None:
+            return
+        example = cls.har_cache.load(os.path.join(
+            os.path.dirname(inspect.getfile(cls)), cls.example_har))
+        cls.load_har_fixtures(example)
+        cls.setUpHARTestData(example)
+
+    @classmethod
+    def load_har_fixtures(cls, har):
+        """
+        Save the objects in the `_fixtures` HAR extension field of the log.
+
+        The objects are in the Django `python` serialization format, the
+        same as JSON fixtures, such as from `manage.py dumpdata`.
+        """
+        for obj in serializers.deserialize(
+                'python', har["log"].get("_fixtures", [])):
+            obj.save()
+
+    @classmethod
+    def setUpHARTestData(cls, example):
+        """
+        Override to create any other test data the example HAR needs.
+        """
+
+    def send_har_entry(self, plan, variables=None, **kwargs):
+        """
+        Roll back the entry's database changes if `har_entry_rollback` is set.
+        """
+        if not self.har_entry_rollback:
+            return super(HARDRFTestCase, self).send_har_entry(
+                plan, variables, **kwargs)
+        # Roll back a savepoint in each of the test case's databases
+        aliases = [
+            alias for alias in db.connections if alias in self.databases and
+            not db.connections[alias].settings_dict["TEST"]["MIRROR"]]
+        with contextlib.ExitStack() as stack:
+            for alias in aliases:
+                stack.enter_context(transaction.atomic(using=alias))
+                stack.callback(transaction.set_rollback, True, using=alias)
+            return super(HARDRFTestCase, self).send_har_entry(
+                plan, variables, **kwargs)
+
     def request_har(self, method, url, data=None, **kwargs):
         """
         Send the request using the Django ReST Framework.
         """
-        headers = kwargs.pop('headers', {})
+        # Leave the caller's headers as sent for the output HAR
+        headers = dict(kwargs.pop('headers', None) or {})
+        # The test client returns streaming responses as is
+        kwargs.pop('stream', None)
 
         content_type = headers.pop('Content-Type', None)
         if content_type is not None:
             kwargs['content_type'] = content_type
             if self.JSON_MIME_TYPE_RE.match(content_type) is not None:
-                data = json.dumps(data)
+                data = test_har.json_codec.dumps(data)
 
         kwargs.update(
             ('HTTP_{0}'.format(key.upper()), value)
             for key, value in headers.items())
 
         request_method = getattr(self.client, method.lower())
-        response = request_method(url, data=data, **kwargs)
+        recorder = HARQueryRecorder()
+        with contextlib.ExitStack() as stack:
+            for connection in db.connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = request_method(url, data=data, **kwargs)
+        response.har_queries = recorder.queries
+        response.har_db_time = sum(time for _, time in recorder.queries)
         return response
 
     def get_reason(self, response):
@@ -49,5 +125,36 @@ class HARDRFTestCase(test.APITestCase, test_har.HARTestCase):
         """
         return response.content.decode()
 
+    def iter_content(self, response):
+        """
+        Iterate over the Django response body bytes, streamed if supported.
+        """
+        if response.streaming:
+            return response.streaming_content
+        return [response.content]
+
+
+class HARQueryRecorder(object):
+    """
+    A database execute wrapper recording each query and its time.
+    """
+
+    def __init__(self):
+        """
+        Start with no queries recorded.
+        """
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        """
+        Execute the query and record its SQL and time in milliseconds.
+        """
+        start = timeit.default_timer()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(
+                (sql, (timeit.default_timer() - start) * 1000))
+
 
 HARTestCase = HARDRFTestCase
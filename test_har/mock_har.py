@@ -0,0 +1,289 @@
+"""
+Serve the responses recorded in a HAR as a mock of the backend.
+
+The entries are indexed by method and URL, and optionally by request body, so
+that each request is answered with one dictionary lookup.  Use
+`requests_har.HARMockAdapter` as a `requests` transport adapter or
+`HARMockServer` as a local HTTP server for any other client::
+
+  with mock_har.HARMockServer('fixtures/users.har.json') as server:
+      client = UsersClient(server.url)
+"""
+
+import os
+import re
+import json
+import base64
+import threading
+import collections
+
+try:
+    from http import server
+    import socketserver
+except ImportError:  # pragma: no cover
+    # BBB Python 2 compat
+    import BaseHTTPServer as server  # noqa
+    import SocketServer as socketserver  # noqa
+
+try:
+    from urllib import parse as urllib_parse
+except ImportError:  # pragma: no cover
+    # BBB Python 2 compat
+    import urlparse as urllib_parse  # noqa
+
+import test_har
+
+CHARSET_RE = re.compile(r'charset=["\']?([^;"\'\s]+)', re.IGNORECASE)
+
+# Response headers that describe the recorded transfer rather than the body
+# served by the mock
+SKIPPED_HEADERS = frozenset((
+    'content-encoding', 'content-length', 'transfer-encoding', 'connection',
+    'keep-alive'))
+
+
+class HARMockNotFound(LookupError):
+    """
+    No HAR entry matches the request.
+    """
+
+
+class HARMockResponse(object):
+    """
+    A response recorded in a HAR entry, decoded once when first served.
+    """
+
+    def __init__(self, response, base_dir):
+        """
+        Keep the HAR response until its body is first needed.
+        """
+        self.status = response["status"]
+        self.reason = response.get("statusText", '')
+        self.response = response
+        self.base_dir = base_dir
+        self._body = None
+
+        content = response.get("content", {})
+        self.headers = [
+            (header["name"], header["value"])
+            for header in response.get("headers", [])
+            if header["name"].lower() not in SKIPPED_HEADERS]
+        if content.get("mimeType") and 'content-type' not in {
+                name.lower() for name, _ in self.headers}:
+            self.headers.append(('Content-Type', content["mimeType"]))
+
+    @property
+    def body(self):
+        """
+        Return the response body bytes from the HAR content.
+
+        Base64 encoded text is decoded, `_file` bodies are read relative to
+        the HAR's directory and JSON values are encoded with the JSON codec.
+        Bodies only recorded by `_sha256` digest can't be served.
+        """
+        if self._body is not None:
+            return self._body
+        content = self.response.get("content", {})
+        if content.get("_file"):
+            with open(os.path.join(
+                    self.base_dir, content["_file"]), 'rb') as body_file:
+                body = body_file.read()
+        elif "text" not in content:
+            if content.get("_sha256"):
+                raise ValueError(
+                    'Cannot serve a HAR body recorded only by digest')
+            body = b''
+        elif content.get("encoding") == 'base64':
+            body = base64.b64decode(content["text"])
+        else:
+            text = content["text"]
+            match = CHARSET_RE.search(content.get("mimeType", ''))
+            if match and isinstance(text, str):
+                body = text.encode(match.group(1))
+            else:
+                body = test_har.encode_har_data(
+                    text, content.get("mimeType"))
+        self._body = body
+        return body
+
+
+def har_mock_url(url, match_host=True):
+    """
+    Normalize a URL for lookup, ordering the query and lowercasing the host.
+
+    Without `match_host`, only the path and query are kept.
+    """
+    split = urllib_parse.urlsplit(url)
+    query = urllib_parse.urlencode(sorted(
+        urllib_parse.parse_qsl(split.query, keep_blank_values=True)))
+    if not match_host:
+        return urllib_parse.urlunsplit(('', '', split.path or '/', query, ''))
+    return urllib_parse.urlunsplit((
+        split.scheme.lower(), split.netloc.lower(), split.path or '/', query,
+        ''))
+
+
+def har_mock_body(body, content_type=None,
+                  json_mime_type_re=test_har.JSON_MIME_TYPE_RE):
+    """
+    Normalize a request body for lookup.
+
+    JSON bodies are compared by value regardless of whitespace or key order.
+    """
+    if json_mime_type_re.match(content_type or ''):
+        value = body
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        if isinstance(body, str):
+            try:
+                value = test_har.json_codec.loads(body)
+            except ValueError:
+                value = body
+        return json.dumps(value, sort_keys=True, separators=(',', ':'))
+    return test_har.encode_har_data(body, content_type) or b''
+
+
+class HARMock(object):
+    """
+    Look up the responses recorded in a HAR by method, URL and body.
+
+    Repeated requests matching the same key are answered with each recorded
+    response in HAR order and then with the last one again.  Entries without
+    a response are ignored.
+    """
+
+    def __init__(self, har, match_body=False, match_host=True, base_dir=None):
+        """
+        Index the HAR entries by request.
+
+        The HAR may be a path to a HAR file, a parsed HAR or an iterable of
+        entries.  `_file` bodies are resolved relative to `base_dir`, which
+        defaults to the directory of a HAR file path or the current directory.
+        """
+        if isinstance(har, str):
+            if base_dir is None:
+                base_dir = os.path.dirname(os.path.abspath(har))
+            har = test_har.iter_har_entries(har)
+        self.base_dir = base_dir or os.getcwd()
+        self.match_body = match_body
+        self.match_host = match_host
+        self.responses = collections.OrderedDict()
+        self.served = {}
+        self._lock = threading.Lock()
+        for entry in test_har.har_entries(har):
+            if "response" not in entry:
+                continue
+            request = entry["request"]
+            post = request.get("postData") or {}
+            key = self.key(
+                request["method"], request["url"], post.get("text"),
+                post.get("mimeType"))
+            self.responses.setdefault(key, []).append(
+                HARMockResponse(entry["response"], self.base_dir))
+
+    def __len__(self):
+        """
+        Return the number of distinct requests indexed.
+        """
+        return len(self.responses)
+
+    def key(self, method, url, body=None, content_type=None):
+        """
+        Return the lookup key for a request.
+        """
+        key = (method.upper(), har_mock_url(url, self.match_host))
+        if self.match_body:
+            key += (har_mock_body(body, content_type),)
+        return key
+
+    def lookup(self, method, url, body=None, content_type=None):
+        """
+        Return the next recorded response for the request.
+        """
+        key = self.key(method, url, body, content_type)
+        responses = self.responses.get(key)
+        if responses is None:
+            raise HARMockNotFound(
+                'No HAR entry for {0} {1}'.format(method, url))
+        with self._lock:
+            served = self.served.get(key, 0)
+            self.served[key] = served + 1
+        return responses[min(served, len(responses) - 1)]
+
+
+class HARMockServer(socketserver.ThreadingMixIn, server.HTTPServer):
+    """
+    A local HTTP server answering requests with the responses in a HAR.
+
+    Requests are matched on path and query only since they are sent to this
+    server instead of the recorded host.  Unmatched requests are answered
+    with `501 Not Implemented`.  Use as a context manager to serve from a
+    background thread.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, har, match_body=False, base_dir=None,
+                 address=('127.0.0.1', 0)):
+        """
+        Index the HAR and listen on the address, a free local port by default.
+        """
+        self.har_mock = HARMock(
+            har, match_body=match_body, match_host=False, base_dir=base_dir)
+        server.HTTPServer.__init__(self, address, HARMockRequestHandler)
+        self.url = 'http://{0}:{1}'.format(*self.server_address[:2])
+        self.thread = None
+
+    def __enter__(self):
+        """
+        Serve requests from a background thread.
+        """
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        """
+        Stop serving and close the socket.
+        """
+        self.shutdown()
+        self.thread.join()
+        self.server_close()
+
+
+class HARMockRequestHandler(server.BaseHTTPRequestHandler):
+    """
+    Answer each request with the matching HAR response.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        """
+        Keep test output quiet.
+        """
+
+    def handle_har(self):
+        """
+        Look up and send the HAR response for the request.
+        """
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            response = self.server.har_mock.lookup(
+                self.command, self.path, body,
+                self.headers.get('Content-Type'))
+            response_body = response.body
+        except (HARMockNotFound, ValueError) as exc:
+            self.send_error(501, str(exc))
+            return
+        self.send_response(response.status, response.reason)
+        for name, value in response.headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(response_body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(response_body)
+
+    do_GET = do_HEAD = do_POST = do_PUT = do_PATCH = do_DELETE = (
+        do_OPTIONS) = handle_har
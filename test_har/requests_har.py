@@ -1,6 +1,12 @@
+import io
+
 import requests
+from requests import adapters
+from requests import structures
+from requests import utils
 
 import test_har
+from test_har import mock_har
 from test_har import *  # noqa
 
 
@@ -9,12 +15,70 @@ class HARRequestsTestCase(test_har.HARTestCase):
     Run tests using HTTP Archive (HAR) files through the requests library.
     """
 
+    # Connection pool options for the `requests.Session` used to send entries
+    # Increase `har_pool_maxsize` to at least `har_workers` for concurrency
+    har_pool_connections = 10
+    har_pool_maxsize = 10
+    # Either a number of retries or a `urllib3.util.Retry` instance
+    har_max_retries = 0
+    har_keep_alive = True
+    # Share one session across all tests in the class instead of one per test
+    har_session_per_class = False
+
+    @classmethod
+    def make_har_session(cls):
+        """
+        Return a new connection pooling session for sending entries.
+        """
+        session = requests.Session()
+        adapter = adapters.HTTPAdapter(
+            pool_connections=cls.har_pool_connections,
+            pool_maxsize=cls.har_pool_maxsize,
+            max_retries=cls.har_max_retries)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if not cls.har_keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        Start the session shared across the class if so configured.
+        """
+        super(HARRequestsTestCase, cls).setUpClass()
+        if cls.har_session_per_class:
+            cls.har_session = cls.make_har_session()
+
+    @classmethod
+    def tearDownClass(cls):
+        """
+        Close the session shared across the class if so configured.
+        """
+        if cls.har_session_per_class:
+            cls.har_session.close()
+            del cls.har_session
+        super(HARRequestsTestCase, cls).tearDownClass()
+
+    def setUp(self):
+        """
+        Start a session for this test unless shared across the class.
+
+        A shared session's cookies are cleared so that they never carry
+        from one test into the next.
+        """
+        if self.har_session_per_class:
+            self.har_session.cookies.clear()
+        else:
+            self.har_session = self.make_har_session()
+            self.addCleanup(self.har_session.close)
+        super(HARRequestsTestCase, self).setUp()
+
     def request_har(self, method, url, data=None, **kwargs):
         """
-        Send the request using the requests library.
+        Send the request using the test's pooled requests library session.
         """
-        request_method = getattr(requests, method.lower())
-        return request_method(url, data=data, **kwargs)
+        return self.har_session.request(method, url, data=data, **kwargs)
 
     def get_reason(self, response):
         """
@@ -28,11 +92,76 @@ class HARRequestsTestCase(test_har.HARTestCase):
         """
         return req_or_resp.headers
 
+    def get_json(self, response):
+        """
+        Decode the undecoded response body bytes using the JSON codec.
+        """
+        return test_har.json_codec.loads(response.content)
+
+    def get_request_headers(self, response, request):
+        """
+        Lookup the headers the requests library actually sent.
+        """
+        return response.request.headers
+
     def get_text(self, response):
         """
         Lookup the requests library response body text.
         """
         return response.text
 
+    def iter_content(self, response):
+        """
+        Iterate over the streamed requests library response body bytes.
+        """
+        return response.iter_content(self.har_chunk_size)
+
+
+class HARMockAdapter(adapters.BaseAdapter):
+    """
+    A requests library transport adapter answering with HAR responses.
+
+    Mount it on a session for the URL prefixes the HAR was recorded from::
+
+        session.mount('https://api.example.com/', HARMockAdapter(har))
+
+    Unmatched requests raise `mock_har.HARMockNotFound`.  See
+    `mock_har.HARMock` for the other arguments.
+    """
+
+    def __init__(self, har, match_body=False, match_host=True, base_dir=None):
+        """
+        Index the HAR entries by request.
+        """
+        super(HARMockAdapter, self).__init__()
+        self.har_mock = mock_har.HARMock(
+            har, match_body=match_body, match_host=match_host,
+            base_dir=base_dir)
+
+    def send(self, request, stream=False, timeout=None, verify=True,
+             cert=None, proxies=None):
+        """
+        Return the HAR response for the prepared request.
+        """
+        har_response = self.har_mock.lookup(
+            request.method, request.url, request.body,
+            request.headers.get('Content-Type'))
+        response = requests.Response()
+        response.status_code = har_response.status
+        response.reason = har_response.reason
+        response.headers = structures.CaseInsensitiveDict(
+            har_response.headers)
+        response.encoding = utils.get_encoding_from_headers(response.headers)
+        response.raw = io.BytesIO(har_response.body)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        """
+        Nothing to release.
+        """
+
 
 HARTestCase = HARRequestsTestCase
@@ -0,0 +1,282 @@
+"""
+Run a directory of HAR files in parallel processes and report the results.
+
+Each HAR file found is asserted as one test through the chosen backend.  The
+files are sharded across worker processes, balanced by their number of
+entries or by their durations in a previous report::
+
+  $ python -m test_har.runner fixtures/ --backend requests --report run.json
+  $ python -m test_har.runner fixtures/ --timings run.json --report run.json
+
+With the Django ReST Framework backend, each worker process sets up its own
+test databases from the `DJANGO_SETTINGS_MODULE` settings.
+"""
+
+import os
+import sys
+import json
+import heapq
+import fnmatch
+import argparse
+import importlib
+import contextlib
+import multiprocessing
+import timeit
+import unittest
+from concurrent import futures
+
+import test_har
+
+BACKENDS = dict(
+    requests='test_har.requests_har',
+    drf='test_har.django_rest_har',
+)
+
+
+def discover(directory, pattern='*.har.json'):
+    """
+    Return the sorted paths, relative to the directory, of matching HARs.
+    """
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        for name in fnmatch.filter(files, pattern):
+            paths.append(os.path.relpath(os.path.join(root, name), directory))
+    return sorted(paths)
+
+
+def har_file_weights(directory, paths, timings=None):
+    """
+    Return the relative cost of running each HAR file.
+
+    Files in the `timings` of a previous report weigh their duration.  Other
+    files weigh their number of entries times the mean duration per entry of
+    the timed files, or just their number of entries if none are timed.
+    """
+    counts = {
+        path: len(test_har.har_cache.index(os.path.join(directory, path)))
+        for path in paths}
+    timed = {
+        path: timings[path] for path in paths
+        if timings and path in timings}
+    if not timed:
+        return counts
+    per_entry = sum(timed.values()) / max(
+        sum(counts[path] for path in timed), 1)
+    return {
+        path: timed.get(path, counts[path] * per_entry) for path in paths}
+
+
+def shard_har_files(weights, processes):
+    """
+    Balance the weighted HAR files across shards, heaviest first.
+
+    Each file is added to the least loaded shard so far, the longest
+    processing time first heuristic.  Empty shards are dropped.
+    """
+    shards = [[] for _ in range(processes)]
+    loads = [(0, idx) for idx in range(processes)]
+    for path, weight in sorted(
+            weights.items(), key=lambda item: (-item[1], item[0])):
+        load, idx = heapq.heappop(loads)
+        shards[idx].append(path)
+        heapq.heappush(loads, (load + weight, idx))
+    return [shard for shard in shards if shard]
+
+
+def worker_test_databases(databases, worker):
+    """
+    Give each database a test database name unique to the worker.
+
+    In-memory SQLite test databases, the default when no test `NAME` is
+    set, are already private to each process and are left as is.  Others
+    get the worker number appended to their test database name.
+    """
+    for database in databases.values():
+        test = database.setdefault('TEST', {})
+        name = test.get('NAME')
+        if name is None:
+            if database['ENGINE'] == 'django.db.backends.sqlite3':
+                continue
+            name = 'test_' + database['NAME']
+        test['NAME'] = '{0}_{1}'.format(name, worker)
+
+
+def har_file_case(backend, path):
+    """
+    Return a test case asserting all the entries in a HAR file.
+    """
+    module = importlib.import_module(BACKENDS[backend])
+
+    class HARFileTestCase(module.HARTestCase):
+
+        har_base_dir = os.path.dirname(path)
+
+        def runTest(self):
+            """
+            Assert the HAR file entries without keeping them in memory.
+            """
+            self.assertHAR(
+                test_har.iter_har_entries(path), keep_responses=False)
+
+    HARFileTestCase.__name__ = HARFileTestCase.__qualname__ = str(
+        os.path.basename(path))
+    return HARFileTestCase('runTest')
+
+
+def run_har_files(backend, directory, paths):
+    """
+    Run each HAR file as a test and return the result for each.
+    """
+    results = []
+    for path in paths:
+        result = unittest.TestResult()
+        start = timeit.default_timer()
+        unittest.TestSuite([
+            har_file_case(backend, os.path.join(directory, path))]).run(result)
+        status = 'pass'
+        if result.failures:
+            status = 'fail'
+        elif result.errors:
+            status = 'error'
+        results.append(dict(
+            path=path, status=status,
+            duration=timeit.default_timer() - start,
+            messages=[
+                message for _, message in result.failures + result.errors]))
+    return results
+
+
+@contextlib.contextmanager
+def worker_databases(worker, aliases=None):
+    """
+    Set up test databases unique to the worker and tear them down after.
+
+    Sets up the databases with the `aliases` given or all databases.
+    """
+    from django.db import connections
+    from django.test import utils
+    worker_test_databases({
+        alias: connections.settings[alias]
+        for alias in aliases or connections.settings}, worker)
+    databases = utils.setup_databases(
+        verbosity=0, interactive=False, aliases=aliases)
+    try:
+        yield databases
+    finally:
+        utils.teardown_databases(databases, verbosity=0)
+
+
+def run_shard(backend, directory, paths, worker):  # pragma: no cover
+    """
+    Run a shard of HAR files in a worker process.
+
+    Only the process entry point, which coverage doesn't measure, see
+    `worker_databases()` and `run_har_files()` for the tested logic.
+    """
+    if backend != 'drf':
+        return run_har_files(backend, directory, paths)
+
+    import django
+    from django.test import utils
+    django.setup()
+    utils.setup_test_environment()
+    try:
+        with worker_databases(worker):
+            return run_har_files(backend, directory, paths)
+    finally:
+        utils.teardown_test_environment()
+
+
+def run(directory, backend='requests', processes=None, timings=None,
+        pattern='*.har.json'):
+    """
+    Run the HAR files in the directory across processes and return a report.
+    """
+    processes = processes or multiprocessing.cpu_count()
+    paths = discover(directory, pattern)
+    shards = shard_har_files(
+        har_file_weights(directory, paths, timings), processes)
+
+    start = timeit.default_timer()
+    results = []
+    if shards:
+        # Don't share database connections or other state with workers
+        with futures.ProcessPoolExecutor(
+                len(shards),
+                mp_context=multiprocessing.get_context('spawn')) as executor:
+            for shard_results in executor.map(
+                    run_shard, [backend] * len(shards),
+                    [directory] * len(shards), shards, range(len(shards))):
+                results.extend(shard_results)
+    results.sort(key=lambda result: result["path"])
+
+    totals = dict(
+        files=len(results), duration=timeit.default_timer() - start)
+    for status in ('pass', 'fail', 'error'):
+        totals[status] = sum(
+            1 for result in results if result["status"] == status)
+    return dict(
+        backend=backend, processes=len(shards), totals=totals,
+        files=results)
+
+
+def load_timings(report_path):
+    """
+    Return the duration of each HAR file in a previous report.
+    """
+    with open(report_path) as report_file:
+        report = json.load(report_file)
+    return {result["path"]: result["duration"] for result in report["files"]}
+
+
+parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+parser.add_argument(
+    'directory', help='The directory to search for HAR files')
+parser.add_argument(
+    '--pattern', default='*.har.json',
+    help='The file name pattern of the HAR files')
+parser.add_argument(
+    '--backend', choices=sorted(BACKENDS), default='requests',
+    help='The backend used to send the HAR requests')
+parser.add_argument(
+    '--processes', type=int,
+    help='Number of worker processes, defaults to the number of CPUs')
+parser.add_argument(
+    '--timings',
+    help='Balance the files by their durations in this previous report')
+parser.add_argument(
+    '--report', help='Write the merged JSON report to this file')
+parser.add_argument(
+    '--settings',
+    help='The Django settings module for the Django ReST Framework backend')
+
+
+def main(args=None):
+    """
+    Run the HAR files, print and write the report, return the exit status.
+    """
+    args = parser.parse_args(args)
+    if args.settings:
+        os.environ['DJANGO_SETTINGS_MODULE'] = args.settings
+    report = run(
+        args.directory, backend=args.backend, processes=args.processes,
+        timings=args.timings and load_timings(args.timings),
+        pattern=args.pattern)
+
+    for result in report["files"]:
+        sys.stdout.write('{status:>5} {duration:8.3f}s {path}\n'.format(
+            **result))
+        for message in result["messages"]:
+            sys.stdout.write(message + '\n')
+    sys.stdout.write(
+        '{files} HAR files in {duration:.3f}s: {pass} passed, {fail} failed, '
+        '{error} errors\n'.format(**report["totals"]))
+
+    if args.report:
+        with open(args.report, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+    return int(bool(report["totals"]["fail"] or report["totals"]["error"]))
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main())
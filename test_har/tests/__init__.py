@@ -4,7 +4,22 @@ Test using HAR files in Python tests.
 
 from __future__ import unicode_literals
 
+import os
 import copy
+import base64
+import hashlib
+import datetime
+import json
+import shutil
+import tempfile
+import pstats
+import tracemalloc
+
+try:
+    from unittest import mock
+except ImportError:  # pragma: no cover
+    # BBB Python 2 compat
+    import mock
 
 import test_har
 
@@ -21,6 +36,9 @@ class HARDogfoodTestCase(object):
     # Subclasses must define
     # RESPONSE_TYPE = ...
 
+    DOWNLOAD_URL = 'mock://example.com/download/'
+    DOWNLOAD_CONTENT = bytes(bytearray(range(256))) * 64 * 64
+
     def test_success(self):
         """
         Test when the response matches all HAR values.
@@ -51,6 +69,123 @@ class HARDogfoodTestCase(object):
             'email', response.json(),
             'Response JSON missing ignored key')
 
+    def test_stream(self):
+        """
+        Assert HAR entries from a file without parsing the whole file.
+        """
+        responses = self.assertHAR(
+            self.iterHAR(self.example_har, chunk_size=16),
+            keep_responses=False)
+        self.assertEqual(responses, [], 'Streamed responses retained')
+
+    def test_compiled(self):
+        """
+        Assert a compiled HAR plan many times.
+        """
+        plan = self.compileHAR(self.example_har)
+        hits = self.har_cache.hits
+        self.assertIs(
+            self.compileHAR(self.example_har), plan,
+            'Compiled HAR plan not cached')
+        self.assertEqual(
+            self.har_cache.hits, hits + 1, 'Compiled HAR plan not a cache hit')
+        self.assertIn(
+            'index=0', repr(plan[0]), 'Wrong entry plan representation')
+        with self.assertRaises(AttributeError):
+            plan[0].url = 'foo'
+
+        request = plan[0].request_kwargs()
+        request['headers']['Accept'] = 'text/html'
+        response = self.assertHAR(plan)[0]
+        self.assertEqual(
+            self.get_headers(response)['Content-Type'],
+            self.entry["response"]["content"]["mimeType"],
+            'Compiled HAR plan modified')
+
+    def test_entry(self):
+        """
+        Assert a single HAR entry.
+        """
+        response = self.assertHAREntry(self.entry)
+        self.assertEqual(
+            response.status_code, self.entry["response"]["status"],
+            'Wrong single entry response status')
+
+    def test_timings(self):
+        """
+        The time taken is measured and asserted against latency budgets.
+        """
+        self.entry["_maxTime"] = 60 * 1000
+        self.entry["time"] = 60 * 1000
+        self.har_time_factor = 2
+        response = self.assertHAR(self.example)[0]
+        self.assertGreater(response.har_time, 0, 'Missing response time')
+        self.assertLess(response.har_time, 60 * 1000, 'Wrong response time')
+
+    def test_timings_max_time(self):
+        """
+        Fail when the response is slower than the absolute budget.
+        """
+        self.entry["_maxTime"] = 0
+        with self.assertRaises(test_har.HAREntryAssertionError) as failure:
+            self.assertHAR(self.example)
+        self.assertEqual(
+            list(failure.exception.failures), ['timings'],
+            'Wrong latency budget failures')
+        self.assertIn(
+            '_maxTime', str(failure.exception.failures['timings']),
+            'Wrong latency budget failure')
+
+    def test_timings_factor(self):
+        """
+        Fail when the response is slower than the recorded time budget.
+        """
+        self.entry["time"] = 0
+        self.har_time_factor = 2
+        with self.assertRaises(test_har.HAREntryAssertionError) as failure:
+            self.assertHAR(self.example)
+        self.assertIn(
+            'time * 2', str(failure.exception.failures['timings']),
+            'Wrong recorded latency budget failure')
+
+    def test_output(self):
+        """
+        Write the actual requests and responses as a HAR.
+        """
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.har_output = os.path.join(tmp, 'output.har.json')
+        self.entry["response"]["status"] = 599
+        with self.assertRaises(AssertionError):
+            self.assertHAR(self.example)
+
+        with open(self.har_output) as output_file:
+            output = json.load(output_file)
+        self.assertEqual(output["log"]["version"], "1.2", 'Wrong HAR version')
+        entry = output["log"]["entries"][0]
+        self.assertEqual(
+            entry["request"]["url"], self.entry["request"]["url"],
+            'Wrong output request URL')
+        self.assertEqual(
+            test_har.array_to_dict(entry["request"]["headers"])['Accept'],
+            'application/json', 'Wrong output request header')
+        self.assertEqual(
+            json.loads(entry["request"]["postData"]["text"]),
+            self.entry["request"]["postData"]["text"],
+            'Wrong output request body')
+        self.assertEqual(
+            entry["response"]["status"], 201, 'Wrong output response status')
+        self.assertEqual(
+            json.loads(entry["response"]["content"]["text"])["username"],
+            'foo_username', 'Wrong output response body')
+        self.assertEqual(
+            entry["timings"]["wait"], entry["time"],
+            'Wrong output response timings')
+        self.assertEqual(
+            datetime.datetime.fromisoformat(
+                entry["startedDateTime"]).utcoffset(),
+            datetime.timedelta(0), 'Output start time not in UTC')
+
     def test_failure(self):
         """
         Test when the response fails to match.
@@ -76,6 +211,10 @@ class HARDogfoodTestCase(object):
         with self.assertRaises(AssertionError) as har_failures:
             self.assertHAR(self.example)
 
+        self.assertIn(
+            "HAR failure at 'status'", str(har_failures.exception),
+            'Wrong rendered failure message')
+
         self.assertIn(
             'response', dir(har_failures.exception),
             'Failure missing reference to the response')
@@ -232,3 +371,293 @@ class HARDogfoodTestCase(object):
             response.content.decode(),
             self.entry["response"]["content"]["text"],
             'Wrong non-JSON response body')
+
+    def test_load(self):
+        """
+        Replay the HAR as a load test.
+        """
+        report = self.loadHAR(self.example, iterations=3)
+        key = '{method} {url}'.format(**self.entry["request"])
+        self.assertEqual(report.requests, 3, 'Wrong number of load requests')
+        self.assertEqual(
+            list(report.stats()), [key], 'Wrong load report entries')
+        stats = report.stats()[key]
+        self.assertLessEqual(
+            stats['min'], stats['p50'], 'Wrong load latency percentiles')
+        self.assertLessEqual(
+            stats['p50'], stats['p99'], 'Wrong load latency percentiles')
+        self.assertGreater(
+            report.requests_per_second, 0, 'Wrong load throughput')
+        self.assertEqual(
+            report.as_dict()['requests'], 3, 'Wrong load report data')
+        self.assertIn(key, str(report), 'Wrong load report text')
+
+    def test_binary(self):
+        """
+        Assert large binary bodies by size and digest as they are streamed.
+        """
+        entry = dict(
+            request=dict(method='GET', url=self.DOWNLOAD_URL, headers=[]),
+            response=dict(
+                status=200, statusText='OK', headers=[],
+                content=dict(
+                    mimeType='application/octet-stream',
+                    size=len(self.DOWNLOAD_CONTENT), encoding='base64',
+                    text=base64.b64encode(
+                        self.DOWNLOAD_CONTENT).decode('ascii'))))
+        plan = test_har.compile_har_entry(entry)
+        self.assertTrue(plan.stream, 'Binary entry not streamed')
+        self.assertTrue(
+            plan.request_kwargs()['stream'], 'Binary request not streamed')
+        self.assertHAREntry(plan)
+
+        # Declared digest
+        content = entry["response"]["content"]
+        del content["text"]
+        del content["encoding"]
+        content["_sha256"] = hashlib.sha256(
+            self.DOWNLOAD_CONTENT).hexdigest().upper()
+        self.assertHAREntry(entry)
+
+        # External body file
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        content["_file"] = os.path.join(tmp, 'download.bin')
+        with open(content["_file"], 'wb') as body_file:
+            body_file.write(self.DOWNLOAD_CONTENT)
+        del content["_sha256"]
+        del content["size"]
+        self.assertHAREntry(entry)
+        self.assertHAREntry(entry)
+
+        with open(content["_file"], 'wb') as body_file:
+            body_file.write(self.DOWNLOAD_CONTENT[:-1] + b'x')
+        content["size"] = 1
+        output = os.path.join(tmp, 'output.har.json')
+        with self.assertRaises(test_har.HAREntryAssertionError) as failure:
+            self.assertHAR(dict(log=dict(entries=[entry])), output=output)
+        self.assertEqual(
+            list(failure.exception.failures),
+            ['content/size', 'content/_sha256'],
+            'Wrong binary content failures')
+        self.assertIn(
+            'Wrong response content size',
+            str(failure.exception.failures['content/size']),
+            'Wrong binary content size failure')
+        with open(output) as output_file:
+            written = json.load(output_file)
+        self.assertEqual(
+            written["log"]["entries"][0]["response"]["content"]["size"], -1,
+            'Streamed binary body recorded')
+
+        # Empty external body file
+        with open(content["_file"], 'wb') as body_file:
+            pass
+        self.assertEqual(
+            test_har.file_digest(content["_file"]),
+            (0, hashlib.sha256().hexdigest()), 'Wrong empty file digest')
+
+    def test_select(self):
+        """
+        Replay only the entries selected through a HAR file index.
+        """
+        index = self.indexHAR(self.example_har)
+        self.assertIs(
+            self.indexHAR(self.example_har), index, 'HAR index not cached')
+        self.assertEqual(
+            self.assertHAR(index, select=dict(method='GET')), [],
+            'Unselected entries replayed')
+        responses = self.assertHAR(
+            index, select=test_har.HARSelector(path='/users/'))
+        self.assertEqual(
+            len(responses), 1, 'Wrong number of selected entries replayed')
+
+    def test_profile(self):
+        """
+        Profile each entry's request and rank them in a summary.
+        """
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        with mock.patch.dict(os.environ, {test_har.PROFILE_ENV: ''}):
+            self.assertIsNone(self.get_har_profile_dir(), 'Wrong profile dir')
+        with mock.patch.dict(os.environ, {test_har.PROFILE_ENV: tmp}):
+            profile_dir = self.get_har_profile_dir()
+        self.assertEqual(
+            profile_dir, os.path.join(tmp, self.id()), 'Wrong profile dir')
+        self.har_profile_dir = tmp
+
+        self.assertHAR(self.example)
+        download = test_har.compile_har_entry(dict(
+            request=dict(method='GET', url=self.DOWNLOAD_URL, headers=[])))
+        self.har_profile_cpu = False
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+        self.send_har_entry(download)
+        self.assertTrue(tracemalloc.is_tracing(), 'Memory tracing stopped')
+        self.har_profile_cpu = True
+        self.har_profile_memory = False
+        self.send_har_entry(download)
+
+        self.write_har_profile_summary(profile_dir)
+        with open(os.path.join(profile_dir, 'summary.json')) as summary_file:
+            summary = json.load(summary_file)
+        self.assertEqual(
+            sorted(profile["index"] for profile in summary["cpuTime"]),
+            [0, 2], 'Wrong CPU profiles')
+        self.assertEqual(
+            sorted(profile["index"] for profile in summary["allocated"]),
+            [0, 1], 'Wrong memory profiles')
+        self.assertEqual(
+            [profile["cpuTime"] for profile in summary["cpuTime"]],
+            sorted((profile["cpuTime"] for profile in summary["cpuTime"]),
+                   reverse=True), 'Profiles not ranked')
+        first = self.har_profiles[0]
+        self.assertEqual(
+            first["profile"], '0000-POST-users.prof', 'Wrong profile name')
+        self.assertGreater(first["allocated"], 0, 'Wrong allocated bytes')
+        pstats.Stats(os.path.join(profile_dir, first["profile"]))
+        tracemalloc.Snapshot.load(
+            os.path.join(profile_dir, first["snapshot"]))
+
+    def test_record(self):
+        """
+        Record the actual responses into a HAR and replay it.
+        """
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        output = os.path.join(tmp, 'recorded.har.json')
+        self.har_record = True
+        self.har_record_inline_max = 1024
+        self.har_scrub_patterns = ((r'foo@example\.com', 'user@example.com'),)
+        self.entry["request"]["headers"].append(
+            dict(name='Authorization', value='Token secret'))
+        self.entry["_orderingGroup"] = 'users'
+        del self.entry["response"]
+        self.example["log"]["comment"] = 'Recorded users'
+        self.example["log"]["pages"] = [dict(id='page', title='Users')]
+        self.example["log"]["_fixtures"] = []
+        # Body files are named from the rendered URL
+        self.har_variables = dict(path='download')
+        self.example["log"]["entries"].append(dict(request=dict(
+            method='GET', url=self.DOWNLOAD_URL.replace(
+                '/download/', '/{{path}}/'), headers=[])))
+
+        responses = self.assertHAR(self.example, output=output)
+        self.assertEqual(
+            [response.status_code for response in responses], [201, 200],
+            'Wrong recorded responses')
+        with open(output) as output_file:
+            log = json.load(output_file)["log"]
+        created, download = log["entries"]
+        self.assertEqual(
+            [log.get(key) for key in ('comment', 'pages', '_fixtures')],
+            ['Recorded users', [dict(id='page', title='Users')], []],
+            'HAR log fields not recorded')
+        self.assertFalse(
+            os.path.exists(output + '.tmp'), 'Temporary HAR not replaced')
+
+        self.assertEqual(
+            created["_orderingGroup"], 'users', 'HAR extension not recorded')
+        self.assertEqual(
+            created["request"]["comment"], 'Test validation errors',
+            'Request comment not recorded')
+        self.assertEqual(
+            test_har.array_to_dict(created["request"]["headers"])[
+                'Authorization'], 'SCRUBBED', 'Request header not scrubbed')
+        self.assertEqual(
+            created["request"]["postData"]["text"]["email"],
+            'user@example.com', 'Request body not scrubbed')
+        self.assertEqual(
+            created["response"]["status"], 201, 'Wrong recorded status')
+        self.assertEqual(
+            created["response"]["content"]["text"]["username"],
+            'foo_username', 'Wrong recorded JSON content')
+        self.assertNotIn(
+            'Content-Type', test_har.array_to_dict(
+                created["response"]["headers"]),
+            'Ignored response header recorded')
+        self.assertIn('time', created, 'Response time not recorded')
+
+        content = download["response"]["content"]
+        self.assertNotIn('text', content, 'Large body recorded inline')
+        self.assertEqual(
+            content["size"], len(self.DOWNLOAD_CONTENT),
+            'Wrong recorded body size')
+        self.assertEqual(
+            content["_sha256"],
+            hashlib.sha256(self.DOWNLOAD_CONTENT).hexdigest(),
+            'Wrong recorded body digest')
+        # Relative to the recorded HAR file
+        self.assertEqual(
+            content["_file"],
+            os.path.join('recorded.bodies', '0001-GET-download.bin'),
+            'Wrong recorded body file path')
+        with open(os.path.join(tmp, content["_file"]), 'rb') as body_file:
+            self.assertEqual(
+                body_file.read(), self.DOWNLOAD_CONTENT,
+                'Wrong recorded body file')
+
+        # Replay the recorded HAR, digesting the recorded body file
+        self.har_record = False
+        del content["_sha256"]
+        self.assertHAR(test_har.compile_har(
+            dict(log=dict(entries=[download])), base_dir=tmp))
+        self.assertHAR(test_har.compile_har(
+            dict(log=dict(entries=[download])),
+            base_dir=os.path.relpath(tmp)))
+        self.assertEqual(
+            self.get_har_base_dir(), os.path.dirname(self.har_path(
+                self.example_har)), 'Wrong example HAR base directory')
+        self.har_base_dir = tmp
+        self.assertHAR(
+            dict(log=dict(entries=[download])), select=dict(method='GET'))
+
+        with mock.patch.dict(os.environ, {test_har.RECORD_ENV: '1'}):
+            self.har_record = None
+            self.assertTrue(
+                self.is_har_recording(), 'Record environment variable ignored')
+            with self.assertRaises(ValueError):
+                self.assertHAR(self.example, select=dict(method='GET'))
+            self.example_har = None
+            with self.assertRaises(ValueError):
+                self.assertHAR(self.example)
+        with mock.patch.dict(os.environ, {test_har.RECORD_ENV: 'false'}):
+            self.assertFalse(
+                self.is_har_recording(), 'Record environment variable ignored')
+        self.har_base_dir = None
+        self.assertEqual(
+            self.get_har_base_dir(), os.path.dirname(__file__),
+            'Wrong test module base directory')
+
+    def test_chained(self):
+        """
+        Values captured from responses are substituted into later entries.
+        """
+        self.har_variables = dict(email='foo@example.com')
+        self.entry["request"]["postData"]["text"]["email"] = '{{email}}'
+        self.entry["_captures"] = dict(username='$.username', user='')
+        self.example["log"]["entries"].append(dict(
+            request=dict(
+                method='GET', url=self.DOWNLOAD_URL + '?user={{username}}',
+                headers=[dict(name='X-User', value='{{ username }}')]),
+            response=dict(
+                status=200, statusText='OK', headers=[],
+                content=dict(
+                    mimeType='application/octet-stream',
+                    _sha256=hashlib.sha256(
+                        self.DOWNLOAD_CONTENT).hexdigest()))))
+
+        created, downloaded = self.assertHAR(self.example)
+        self.assertEqual(
+            created.har_request["data"]["email"], 'foo@example.com',
+            'Initial variable not substituted')
+        self.assertEqual(
+            downloaded.har_request["url"],
+            self.DOWNLOAD_URL + '?user=foo_username',
+            'Captured variable not substituted in URL')
+        self.assertEqual(
+            downloaded.har_request["headers"]["X-User"], 'foo_username',
+            'Captured variable not substituted in header')
+        self.assertEqual(
+            self.entry["request"]["postData"]["text"]["email"], '{{email}}',
+            'HAR entry template modified')
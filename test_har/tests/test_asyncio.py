@@ -0,0 +1,281 @@
+"""
+Test using HAR files in Python tests against an asyncio HTTP client.
+"""
+
+import os
+import json
+import hashlib
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from http import server
+
+from test_har import asyncio_har as test_har
+
+
+class HARTestServer(server.ThreadingHTTPServer):
+    """
+    A local HTTP server returning canned responses by method and path.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        """
+        Listen on a free local port and track the requests in flight.
+        """
+        server.ThreadingHTTPServer.__init__(
+            self, ('127.0.0.1', 0), HARTestRequestHandler)
+        self.url = 'http://127.0.0.1:{0}'.format(self.server_address[1])
+        self.responses = {}
+        self.delay = 0
+        self.lock = threading.Lock()
+        self.in_flight = self.max_in_flight = 0
+
+
+class HARTestRequestHandler(server.BaseHTTPRequestHandler):
+    """
+    Return the canned response for the request method and path.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        """
+        Keep test output quiet.
+        """
+
+    def handle_request(self):
+        """
+        Send the canned response after the server's delay.
+        """
+        with self.server.lock:
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(
+                self.server.max_in_flight, self.server.in_flight)
+        try:
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            time.sleep(self.server.delay)
+            status, reason, headers, body = self.server.responses[
+                (self.command, self.path)]
+            self.send_response(status, reason)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+    do_GET = do_POST = handle_request
+
+
+class HARDogfoodAsyncTests(test_har.HARTestCase):
+    """
+    Test using HAR files in Python tests against an asyncio HTTP client.
+    """
+
+    example_har = 'example.har.json'
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        Start the local test server.
+        """
+        super(HARDogfoodAsyncTests, cls).setUpClass()
+        cls.server = HARTestServer()
+        thread = threading.Thread(target=cls.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        """
+        Stop the local test server.
+        """
+        cls.server.shutdown()
+        cls.server.server_close()
+        super(HARDogfoodAsyncTests, cls).tearDownClass()
+
+    def setUp(self):
+        """
+        Point the example HAR at the local server and serve its response.
+        """
+        super(HARDogfoodAsyncTests, self).setUp()
+        self.server.delay = 0
+        self.server.max_in_flight = 0
+        self.entry["request"]["url"] = self.server.url + '/users/'
+        response = self.entry["response"]
+        headers = test_har.array_to_dict(response["headers"])
+        headers['Content-Type'] = response["content"]["mimeType"]
+        self.server.responses[('POST', '/users/')] = (
+            response["status"], response["statusText"], headers,
+            json.dumps(dict(
+                response["content"]["text"],
+                email='foo@example.com')).encode())
+
+    def make_entries(self, count, **extension):
+        """
+        Return GET entries for the local server, each with its own response.
+        """
+        entries = []
+        for idx in range(count):
+            path = '/items/{0}/'.format(idx)
+            self.server.responses[('GET', path)] = (
+                200, 'OK', {'Content-Type': 'text/plain'}, path.encode())
+            entries.append(dict(
+                extension,
+                request=dict(
+                    method='GET', url=self.server.url + path, headers=[]),
+                response=dict(
+                    status=200, statusText='OK', headers=[],
+                    content=dict(mimeType='text/plain', text=path))))
+        return entries
+
+    async def test_success(self):
+        """
+        Await the assertions on the HAR responses.
+        """
+        response = (await self.assertHAR(self.example))[0]
+        self.assertEqual(
+            self.get_reason(response), 'Created', 'Wrong response reason')
+        self.assertEqual(
+            response.json()["email"], 'foo@example.com',
+            'Response JSON missing ignored key')
+        self.assertEqual(
+            json.loads(response.request.content),
+            self.entry["request"]["postData"]["text"],
+            'Wrong JSON request body')
+
+        response = await self.assertHAREntry(self.entry)
+        self.assertGreater(response.har_time, 0, 'Missing response time')
+
+    async def test_failure(self):
+        """
+        Fail when the response doesn't match the HAR.
+        """
+        self.entry["response"]["status"] = 299
+        self.entry["response"]["content"]["text"]["username"] = 'bar'
+        with self.assertRaises(test_har.HAREntryAssertionError) as failure:
+            await self.assertHAR(self.example)
+        self.assertEqual(
+            list(failure.exception.failures), ['status', 'content/username'],
+            'Wrong async failures')
+
+    async def test_concurrency(self):
+        """
+        Independent entries are sent concurrently up to the limit.
+        """
+        self.server.delay = 0.05
+        self.har_concurrency = 3
+        entries = self.make_entries(9, _independent=True)
+        responses = await self.assertHAR(dict(log=dict(entries=entries)))
+        self.assertEqual(
+            [response.text for response in responses],
+            [entry["response"]["content"]["text"] for entry in entries],
+            'Responses not in HAR order')
+        self.assertEqual(
+            self.server.max_in_flight, 3, 'Wrong number of requests in flight')
+
+        self.server.max_in_flight = 0
+        self.assertEqual(
+            await self.assertHAR(
+                dict(log=dict(entries=self.make_entries(3))),
+                keep_responses=False),
+            [], 'Responses retained')
+        self.assertEqual(
+            self.server.max_in_flight, 1, 'Ordered entries sent concurrently')
+
+    async def test_concurrency_failure(self):
+        """
+        The failure of the first failing entry in HAR order is raised.
+        """
+        self.har_concurrency = 4
+        entries = self.make_entries(5, _independent=True)
+        entries[1]["response"]["status"] = 299
+        entries[1]["_id"] = 'failing'
+        entries[3]["response"]["status"] = 299
+        entries[4]["_dependsOn"] = 'failing'
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        output = os.path.join(tmp, 'output.har.json')
+        with self.assertRaises(test_har.HAREntryAssertionError) as failure:
+            await self.assertHAR(
+                dict(log=dict(entries=entries)), output=output)
+        self.assertEqual(
+            str(failure.exception.response.url), entries[1]["request"]["url"],
+            'Wrong concurrent failure raised')
+        with open(output) as output_file:
+            self.assertEqual(
+                len(json.load(output_file)["log"]["entries"]), 4,
+                'Dependent of a failing entry sent')
+
+    async def test_binary(self):
+        """
+        Streamed binary bodies are hashed as they are received.
+        """
+        body = bytes(bytearray(range(256))) * 1024
+        self.server.responses[('GET', '/download/')] = (
+            200, 'OK', {'Content-Type': 'application/octet-stream'}, body)
+        entry = dict(
+            request=dict(
+                method='GET', url=self.server.url + '/download/',
+                headers=[]),
+            response=dict(
+                status=200, statusText='OK', headers=[],
+                content=dict(
+                    mimeType='application/octet-stream', size=len(body),
+                    _sha256=hashlib.sha256(body).hexdigest())))
+        response = await self.assertHAREntry(entry)
+        self.assertEqual(
+            response.har_body_digest[0], len(body),
+            'Wrong streamed body size')
+
+    async def test_entries_test(self):
+        """
+        Tests generated per entry are coroutines.
+        """
+        test = self.make_har_entries_test(test_har.HARPlan([
+            test_har.compile_har_entry(self.entry)]))
+        await test(self)
+
+    async def test_record(self):
+        """
+        Tests are skipped when recording since it isn't supported.
+        """
+        self.har_record = True
+        with self.assertRaises(unittest.SkipTest):
+            await self.assertHAR(self.example)
+
+    async def test_load(self):
+        """
+        Replay the HAR as a load test on concurrent tasks.
+        """
+        self.server.delay = 0.05
+        self.har_concurrency = 3
+        entries = self.make_entries(1)
+        report = await self.loadHAR(
+            dict(log=dict(entries=entries)), iterations=6)
+        key = 'GET {0}'.format(entries[0]["request"]["url"])
+        self.assertEqual(report.requests, 6, 'Wrong number of load requests')
+        self.assertEqual(
+            list(report.stats()), [key], 'Wrong load report entries')
+        self.assertEqual(
+            self.server.max_in_flight, 3, 'Load tasks not concurrent')
+        report = await self.loadHAR(
+            test_har.compile_har(dict(log=dict(entries=entries))))
+        self.assertEqual(
+            report.requests, 1, 'Wrong default number of load iterations')
+
+        entries[0]["response"]["status"] = 299
+        entries[0]["_captures"] = dict(missing='/missing')
+        report = await self.loadHAR(
+            dict(log=dict(entries=entries)), duration=0.05, concurrency=1,
+            assert_sample=1)
+        self.assertGreater(report.requests, 0, 'No load requests sent')
+        self.assertEqual(
+            len(report.failures), report.requests * 2,
+            'Wrong number of sampled load failures')
@@ -0,0 +1,819 @@
+"""
+Test the backend independent HAR support.
+"""
+
+import os
+import io
+import re
+import collections
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import test_har
+
+
+class HARCacheTests(unittest.TestCase):
+    """
+    Test the process-wide cache of parsed HAR files.
+    """
+
+    def setUp(self):
+        """
+        Write some HAR files to a temporary directory.
+        """
+        super(HARCacheTests, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.cache = test_har.HARCache(max_entries=2)
+        self.paths = []
+        for idx in range(3):
+            path = os.path.join(self.tmp, '{0}.har.json'.format(idx))
+            with open(path, 'w') as har_file:
+                json.dump(dict(log=dict(entries=[dict(idx=idx)])), har_file)
+            self.paths.append(path)
+
+    def test_hits_and_isolation(self):
+        """
+        Repeated loads are cache hits that return isolated copies.
+        """
+        first = self.cache.load(self.paths[0])
+        first["log"]["entries"][0]["idx"] = 'foo'
+        # Hits load the cached serialization without parsing the JSON again
+        with mock.patch.object(
+                test_har.json_codec, 'loads', side_effect=AssertionError):
+            second = self.cache.load(self.paths[0])
+        self.assertEqual(
+            second["log"]["entries"][0]["idx"], 0,
+            'Modification of a loaded HAR leaked into the cache')
+        self.assertEqual(self.cache.misses, 1, 'Wrong cache miss count')
+        self.assertEqual(self.cache.hits, 1, 'Wrong cache hit count')
+
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0, 'Cache not cleared')
+        self.assertEqual(self.cache.hits, 0, 'Cache counters not reset')
+
+    def test_invalidation(self):
+        """
+        A modified HAR file is parsed again.
+        """
+        self.cache.load(self.paths[0])
+        with open(self.paths[0], 'w') as har_file:
+            json.dump(dict(log=dict(entries=[dict(idx='bar')])), har_file)
+        os.utime(self.paths[0], (0, 0))
+        reloaded = self.cache.load(self.paths[0])
+        self.assertEqual(
+            reloaded["log"]["entries"][0]["idx"], 'bar',
+            'Stale cached HAR returned')
+        self.assertEqual(self.cache.misses, 2, 'Wrong cache miss count')
+        self.assertEqual(
+            self.cache.size, os.path.getsize(self.paths[0]),
+            'Wrong cached size after invalidation')
+
+    def test_eviction(self):
+        """
+        The least recently used HAR files are evicted.
+        """
+        self.cache.load(self.paths[0])
+        self.cache.load(self.paths[1])
+        self.cache.load(self.paths[0])
+        self.cache.load(self.paths[2])
+        self.assertEqual(len(self.cache), 2, 'Wrong number of cached HARs')
+        self.cache.load(self.paths[0])
+        self.assertEqual(self.cache.hits, 2, 'Recently used HAR evicted')
+        self.cache.load(self.paths[1])
+        self.assertEqual(self.cache.misses, 4, 'Least recent HAR not evicted')
+
+        self.cache.max_bytes = 1
+        self.cache.clear()
+        self.cache.load(self.paths[0])
+        self.assertEqual(len(self.cache), 0, 'Oversized HAR cached')
+
+
+class HARStreamTests(unittest.TestCase):
+    """
+    Test iterating over HAR entries without parsing the whole file.
+    """
+
+    def setUp(self):
+        """
+        Write a HAR file with values around the entries.
+        """
+        super(HARStreamTests, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = os.path.join(self.tmp, 'stream.har.json')
+        self.har = dict(
+            foo=[1, {"bar": None}],
+            log=collections.OrderedDict([
+                ("version", "1.2"),
+                ("creator", dict(name="qux", version=123456789)),
+                ("pages", []),
+                ("entries", [
+                    dict(idx=idx, time=12345.678, text='\u2603' * idx * 10)
+                    for idx in range(5)]),
+                ("comment", "corge"),
+            ]),
+            baz=12345)
+
+    def write(self, har, **kwargs):
+        """
+        Write the HAR to the test file.
+        """
+        with io.open(self.path, 'w', encoding='utf-8') as har_file:
+            har_file.write(json.dumps(har, ensure_ascii=False, **kwargs))
+
+    def test_iter_har_entries(self):
+        """
+        Entries are decoded across many small chunks.
+        """
+        for indent in (None, 2):
+            self.write(self.har, indent=indent)
+            for chunk_size in (1, 7, 64 * 1024):
+                self.assertEqual(
+                    list(test_har.iter_har_entries(
+                        self.path, chunk_size=chunk_size)),
+                    self.har["log"]["entries"],
+                    'Wrong streamed HAR entries')
+
+    def test_split_numbers(self):
+        """
+        Numbers split at any chunk boundary are decoded whole.
+        """
+        for number in ('0.25', '1e5', '-2.5e10', '12345'):
+            prefix = '{"log": {"_elapsed": '
+            har = prefix + number + ', "entries": [{"time": ' + number + '}]}}'
+            for chunk_size in range(
+                    len(prefix) + 1, len(prefix) + len(number) + 1):
+                self.assertEqual(
+                    list(test_har.HARStreamDecoder(
+                        io.StringIO(har), chunk_size).iter_entries()),
+                    [dict(time=json.loads(number))],
+                    'Wrong entries for {0!r} split after {1} characters'
+                    .format(number, chunk_size - len(prefix)))
+
+    def test_empty(self):
+        """
+        Empty objects and entries are supported.
+        """
+        for har in (dict(log=dict(entries=[], pages={})), dict(log={})):
+            self.write(har)
+            self.assertEqual(
+                list(test_har.iter_har_entries(self.path, chunk_size=3)), [],
+                'Wrong streamed empty HAR entries')
+
+    def test_invalid(self):
+        """
+        Malformed HAR files raise errors.
+        """
+        with open(self.path, 'w') as har_file:
+            har_file.write('{"log": {"entries": [{"foo": 1}')
+        with self.assertRaises(ValueError):
+            list(test_har.iter_har_entries(self.path, chunk_size=3))
+
+        with open(self.path, 'w') as har_file:
+            har_file.write('{"log": {"entries": [{"foo": 1')
+        with self.assertRaises(ValueError):
+            list(test_har.iter_har_entries(self.path, chunk_size=3))
+
+        with open(self.path, 'w') as har_file:
+            har_file.write('{"log": {"entries": [{"foo": 1}]] ')
+        with self.assertRaises(ValueError):
+            list(test_har.iter_har_entries(self.path, chunk_size=3))
+
+
+class HARIndexTests(unittest.TestCase):
+    """
+    Test selecting entries from a HAR file through an index.
+    """
+
+    def setUp(self):
+        """
+        Write a HAR file with multi-byte characters before the entries.
+        """
+        super(HARIndexTests, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.path = os.path.join(self.tmp, 'index.har.json')
+        self.entries = [
+            dict(
+                request=dict(
+                    method=method,
+                    url='https://example.com/{0}/{1}/?q=\u2603'.format(
+                        kind, idx)),
+                comment='\u2603 {0}'.format(idx), _tags=[kind, 'all'])
+            for idx, (method, kind) in enumerate([
+                ('GET', 'users'), ('POST', 'users'), ('GET', 'groups'),
+                ('DELETE', 'users')])]
+        del self.entries[2]["comment"]
+        with io.open(self.path, 'w', encoding='utf-8') as har_file:
+            har_file.write(json.dumps(
+                dict(log=dict(creator=dict(name='\u2603' * 100),
+                              entries=self.entries)),
+                ensure_ascii=False, indent=2))
+
+    def test_select(self):
+        """
+        Entries are selected by key and read from their byte offsets.
+        """
+        index = test_har.HARIndex.build(self.path, chunk_size=7)
+        self.assertEqual(len(index), 4, 'Wrong number of indexed entries')
+        self.assertEqual(list(index), self.entries, 'Wrong indexed entries')
+        self.assertEqual(
+            index.select(dict(method='GET')), [0, 2],
+            'Wrong entries selected by method')
+        self.assertEqual(
+            index.select(dict(tag='users', method='GET')), [0],
+            'Wrong entries selected by multiple keys')
+        self.assertEqual(
+            index.select(dict(path=re.compile('^/users/'))), [0, 1, 3],
+            'Wrong entries selected by URL path pattern')
+        self.assertEqual(
+            index.select(dict(comment='\u2603 3')), [3],
+            'Wrong entries selected by comment')
+        self.assertEqual(
+            index.select(dict(url='foo')), [], 'Wrong unmatched selection')
+        self.assertEqual(
+            index.select({}), [0, 1, 2, 3], 'Wrong empty selection')
+
+        selector = test_har.HARSelector(method='POST')
+        self.assertEqual(
+            list(selector.select(index)), [self.entries[1]],
+            'Wrong entries read from index')
+        self.assertEqual(
+            list(selector.select(dict(log=dict(entries=self.entries)))),
+            [self.entries[1]], 'Wrong entries selected from parsed HAR')
+        plan = test_har.compile_har(dict(log=dict(entries=[
+            dict(entry, response=dict(
+                status=200, statusText='OK', content=dict(text='')))
+            for entry in self.entries])))
+        selected = test_har.select_har(plan, dict(method='DELETE'))
+        self.assertIsInstance(
+            selected, test_har.HARPlan, 'Wrong selected plan type')
+        self.assertEqual(
+            [entry_plan.index for entry_plan in selected], [3],
+            'Wrong entry plans selected')
+        self.assertIs(
+            test_har.select_har(plan), plan, 'HAR changed without selector')
+        self.assertIn("'POST'", repr(selector), 'Wrong selector repr')
+        with self.assertRaises(TypeError):
+            test_har.HARSelector(foo='bar')
+
+    def test_sidecar(self):
+        """
+        The index is written next to the HAR file and reused while current.
+        """
+        cache = test_har.HARCache()
+        index = cache.index(self.path, sidecar=True)
+        self.assertIs(
+            cache.index(self.path, sidecar=True), index,
+            'Index not cached in memory')
+        sidecar = self.path + test_har.HARIndex.SIDECAR_SUFFIX
+        self.assertTrue(os.path.exists(sidecar), 'Index sidecar not written')
+
+        loaded = test_har.HARIndex.load(self.path, sidecar=True)
+        self.assertIsNot(loaded, index, 'Index sidecar not loaded')
+        self.assertEqual(
+            list(loaded.read(loaded.select(dict(tag='groups')))),
+            [self.entries[2]], 'Wrong entries from index sidecar')
+
+        with io.open(self.path, 'a', encoding='utf-8') as har_file:
+            har_file.write('\n')
+        rebuilt = test_har.HARIndex.load(self.path, sidecar=True)
+        self.assertEqual(
+            len(rebuilt), 4, 'Wrong index after HAR file modified')
+        with open(sidecar) as sidecar_file:
+            self.assertEqual(
+                json.load(sidecar_file)["size"],
+                os.path.getsize(self.path), 'Stale index sidecar not updated')
+
+
+class HARLoadReportTests(unittest.TestCase):
+    """
+    Test the load test report.
+    """
+
+    def test_percentile(self):
+        """
+        Percentiles use the nearest rank.
+        """
+        ordered = list(range(1, 101))
+        self.assertEqual(
+            test_har.percentile(ordered, 50), 50, 'Wrong median')
+        self.assertEqual(
+            test_har.percentile(ordered, 99), 99, 'Wrong 99th percentile')
+        self.assertEqual(
+            test_har.percentile(ordered, 100), 100, 'Wrong maximum')
+        self.assertEqual(
+            test_har.percentile([1], 0), 1, 'Wrong minimum')
+        self.assertIsNone(
+            test_har.percentile([], 50), 'Wrong empty percentile')
+
+    def test_empty(self):
+        """
+        An empty report has no throughput.
+        """
+        report = test_har.HARLoadReport()
+        self.assertIsNone(
+            report.requests_per_second, 'Wrong empty report throughput')
+        self.assertIn('0 requests', str(report), 'Wrong empty report text')
+
+
+class HARWriterTests(unittest.TestCase):
+    """
+    Test streaming HAR entries to a file.
+    """
+
+    def test_write_entries(self):
+        """
+        Entries are written to an open file as a valid HAR.
+        """
+        output = io.StringIO()
+        with test_har.HARWriter(output) as writer:
+            writer.write_entry(dict(idx=0))
+            writer.write_entry(dict(idx=1))
+        har = json.loads(output.getvalue())
+        self.assertEqual(
+            har["log"]["entries"], [dict(idx=0), dict(idx=1)],
+            'Wrong written HAR entries')
+        self.assertEqual(
+            har["log"]["creator"]["name"], 'test-har',
+            'Wrong written HAR creator')
+        self.assertFalse(output.closed, 'Output file closed')
+
+    def test_log_fields(self):
+        """
+        The other fields of a source HAR log are written before the entries.
+        """
+        output = io.StringIO()
+        creator = dict(name='foo', version='1')
+        with test_har.HARWriter(output, log=collections.OrderedDict([
+                ("creator", creator), ("pages", [dict(id='page')]),
+                ("entries", [dict(idx=0)]), ("_fixtures", [])])) as writer:
+            writer.write_entry(dict(idx=1))
+        self.assertEqual(
+            json.loads(output.getvalue()), dict(log=dict(
+                version='1.2', creator=creator, pages=[dict(id='page')],
+                _fixtures=[], entries=[dict(idx=1)])),
+            'Wrong written HAR log fields')
+
+
+class JSONCodecTests(unittest.TestCase):
+    """
+    Test selecting and falling back between JSON implementations.
+    """
+
+    def test_fallback(self):
+        """
+        Fall back to the standard library when a codec fails.
+        """
+        def fail_loads(text):
+            raise ValueError('Unsupported JSON')
+
+        def fail_dumps(value):
+            raise TypeError('Unsupported value')
+
+        codec = test_har.JSONCodec('fail', fail_loads, fail_dumps)
+        self.assertEqual(
+            codec.loads('{"foo": 1}'), dict(foo=1), 'Wrong fallback decode')
+        self.assertEqual(
+            codec.dumps(dict(foo=1)), '{"foo": 1}', 'Wrong fallback encode')
+        self.assertIn('fail', repr(codec), 'Wrong codec representation')
+
+        stdlib = test_har.JSON_CODECS['json']
+        with self.assertRaises(ValueError):
+            stdlib.loads('{')
+        with self.assertRaises(TypeError):
+            stdlib.dumps(object())
+
+    def test_select(self):
+        """
+        Select a codec by name and benchmark all codecs.
+        """
+        previous = test_har.set_json_codec('json')
+        try:
+            self.assertIs(
+                test_har.json_codec, test_har.JSON_CODECS['json'],
+                'Wrong selected codec')
+            self.assertEqual(
+                test_har.HARCache().load(os.path.join(
+                    os.path.dirname(__file__), 'example.har.json'))[
+                        "log"]["version"], '1.2',
+                'Wrong HAR loaded with selected codec')
+        finally:
+            test_har.set_json_codec(previous.name)
+
+        results = test_har.benchmark_json_codecs(dict(foo=[1, 2]), number=2)
+        self.assertEqual(
+            list(results), list(test_har.JSON_CODECS),
+            'Wrong benchmarked codecs')
+        self.assertGreater(
+            results['json']['loads'], 0, 'Wrong codec benchmark time')
+
+    def test_default(self):
+        """
+        The default codec is the most preferred installed, not the last.
+        """
+        codecs = collections.OrderedDict(
+            (name, test_har.JSONCodec(name, json.loads, json.dumps))
+            for name in ('json', 'orjson', 'ujson', 'other'))
+        previous = test_har.json_codec
+        self.addCleanup(test_har.set_json_codec, previous.name)
+        with mock.patch.dict(test_har.JSON_CODECS, codecs, clear=True):
+            self.assertIs(
+                test_har.set_json_codec(), previous,
+                'Wrong previous codec')
+            self.assertIs(
+                test_har.json_codec, codecs['orjson'],
+                'Wrong preferred codec')
+            del test_har.JSON_CODECS['orjson']
+            test_har.set_json_codec()
+            self.assertIs(
+                test_har.json_codec, codecs['ujson'],
+                'Wrong fallback preferred codec')
+
+
+class EncodeHARDataTests(unittest.TestCase):
+    """
+    Test encoding HAR request data to send.
+    """
+
+    def test_encode(self):
+        """
+        Text, JSON and form data are encoded to bytes.
+        """
+        self.assertIsNone(test_har.encode_har_data(None), 'Wrong no data')
+        self.assertEqual(
+            test_har.encode_har_data(b'\xe9'), b'\xe9', 'Wrong bytes data')
+        self.assertEqual(
+            test_har.encode_har_data('\xe9'), b'\xc3\xa9', 'Wrong text data')
+        self.assertEqual(
+            json.loads(test_har.encode_har_data(
+                dict(foo=1), 'application/vnd.foo+json').decode()),
+            dict(foo=1), 'Wrong JSON data')
+        self.assertEqual(
+            test_har.encode_har_data(dict(foo='bar baz'), 'text/plain'),
+            b'foo=bar+baz', 'Wrong form data')
+
+
+class DiffJSONTests(unittest.TestCase):
+    """
+    Test the structural JSON diff engine.
+    """
+
+    def test_nested(self):
+        """
+        Nested objects match partially and arrays pairwise.
+        """
+        actual = dict(
+            foo=dict(bar=1, ignored=2),
+            items=[dict(name='a', extra=True), dict(name='b')],
+            short=[1, 2, 3],
+            kind=[1])
+        expected = dict(
+            foo=dict(bar=1, qux=3),
+            items=[dict(name='a'), dict(name='c')],
+            short=[1, 2],
+            kind=dict(a=1))
+        expected['a/b~c'] = None
+        differences = list(test_har.diff_json(actual, expected))
+        self.assertEqual(
+            [(difference.pointer, difference.kind)
+             for difference in differences],
+            [('/foo/qux', 'missing'), ('/items/1/name', 'value'),
+             ('/short', 'length'), ('/kind', 'value'),
+             ('/a~1b~0c', 'missing')],
+            'Wrong JSON differences')
+        self.assertEqual(
+            differences[0].key, 'qux', 'Wrong missing key difference')
+        self.assertIs(
+            differences[0].actual, actual['foo'],
+            'Wrong missing key difference object')
+        self.assertIn(
+            "'/items/1/name'", repr(differences[1]),
+            'Wrong difference representation')
+
+        self.assertEqual(
+            list(test_har.diff_json(actual, actual)), [],
+            'Differences for equal JSON')
+        self.assertEqual(
+            len(list(test_har.diff_json(actual, expected, limit=2))), 2,
+            'JSON differences not limited')
+
+
+class HARFailureTests(unittest.TestCase):
+    """
+    Test lazily formatted HAR failures.
+    """
+
+    def test_lazy(self):
+        """
+        Failure messages are only formatted when rendered.
+        """
+        calls = []
+
+        def assertion(*args):
+            calls.append(args)
+            raise AssertionError('Foo failure')
+
+        failure = test_har.HARFailure(
+            'status', 'value', 200, 400, assertion, 400, 200)
+        self.assertEqual(calls, [], 'Failure message formatted eagerly')
+        self.assertEqual(
+            failure.args, ('Foo failure', ), 'Wrong failure message')
+        self.assertEqual(str(failure), 'Foo failure', 'Wrong failure text')
+        failure.args
+        self.assertEqual(calls, [(400, 200)], 'Failure message not cached')
+        self.assertIn("'status'", repr(failure), 'Wrong failure repr')
+
+        failure.args = ('Bar failure', )
+        self.assertEqual(str(failure), 'Bar failure', 'Failure args not set')
+
+        passing = test_har.HARFailure(
+            'status', 'value', 200, 400, lambda *args: None)
+        self.assertEqual(
+            str(passing), '400 != 200', 'Wrong fallback failure message')
+
+    def test_truncated(self):
+        """
+        Entry failures are rendered lazily with truncation limits.
+        """
+        failures = collections.OrderedDict(
+            ('headers/X-Foo-{0}'.format(idx), AssertionError('x' * 100))
+            for idx in range(5))
+        error = test_har.HAREntryAssertionError(None, failures)
+        error.max_failures = 2
+        error.max_message_length = 10
+        rendered = str(error)
+        self.assertEqual(
+            rendered.count('HAR failure at'), 2,
+            'Wrong number of rendered failures')
+        self.assertIn(
+            '[90 characters truncated]', rendered,
+            'Failure message not truncated')
+        self.assertIn(
+            '3 more HAR failures', rendered, 'Wrong omitted failures count')
+
+    def test_args(self):
+        """
+        The rendered failures are the first of the error's arguments.
+        """
+        failures = collections.OrderedDict(
+            status=AssertionError('Wrong response status code'))
+        error = test_har.HAREntryAssertionError(None, failures, 'Extra')
+        self.assertEqual(
+            error.args, (
+                "HAR failure at 'status':\n\nWrong response status code",
+                'Extra'), 'Wrong error arguments')
+        self.assertEqual(
+            str(error), '\n\n\n'.join(error.args), 'Wrong error message')
+        error.args = ('Replaced', )
+        self.assertEqual(str(error), 'Replaced', 'Error args not set')
+
+
+class HAREntryTestsTests(unittest.TestCase):
+    """
+    Test generating one test method per HAR entry.
+    """
+
+    def test_generate(self):
+        """
+        Tests are generated per entry or group from one parse of the HAR.
+        """
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, 'generate.har.json')
+        entries = [
+            dict(
+                request=dict(
+                    method='GET',
+                    url='https://example.com/users/{0}/'.format(idx)),
+                response=dict(
+                    status=200, statusText='OK', content=dict(text='')))
+            for idx in range(12)]
+        entries[3]["comment"] = 'Foo entry'
+        entries[5]["_orderingGroup"] = entries[7]["_orderingGroup"] = 'foo'
+        # Linked entries are also asserted by one test
+        entries[8]["_captures"] = dict(id='/id')
+        entries[10]["request"]["url"] = 'https://example.com/users/{{id}}/'
+        entries[2]["_id"] = 'two'
+        entries[11]["_dependsOn"] = 'two'
+        with open(path, 'w') as har_file:
+            json.dump(dict(log=dict(entries=entries)), har_file)
+
+        cache = test_har.HARCache()
+
+        @test_har.har_entry_tests(path)
+        class GeneratedTests(test_har.HARTestCase):
+            har_cache = cache
+            asserted = []
+
+            def assertHAR(self, har):
+                self.asserted.append([plan.index for plan in har])
+
+        names = unittest.TestLoader().getTestCaseNames(GeneratedTests)
+        self.assertEqual(len(names), 9, 'Wrong number of generated tests')
+        self.assertEqual(
+            names[:2], ['test_har_00_GET_users_0', 'test_har_01_GET_users_1'],
+            'Wrong generated test names')
+        self.assertEqual(cache.misses, 1, 'HAR parsed more than once')
+        self.assertEqual(
+            GeneratedTests.test_har_03_GET_users_3.__doc__, 'Foo entry',
+            'Wrong generated test docstring')
+        self.assertIn(
+            'and 1 more HAR entries',
+            GeneratedTests.test_har_05_GET_users_5.__doc__,
+            'Wrong generated group test docstring')
+
+        GeneratedTests('test_har_05_GET_users_5').test_har_05_GET_users_5()
+        GeneratedTests('test_har_08_GET_users_8').test_har_08_GET_users_8()
+        GeneratedTests('test_har_02_GET_users_2').test_har_02_GET_users_2()
+        self.assertEqual(
+            GeneratedTests.asserted, [[5, 7], [8, 10], [2, 11]],
+            'Wrong generated group entries')
+
+
+class HARTemplateTests(unittest.TestCase):
+    """
+    Test compiling entry templates and captures.
+    """
+
+    def test_template(self):
+        """
+        Only values using variables are compiled into templates.
+        """
+        self.assertEqual(
+            test_har.compile_har_template('/users/'), '/users/',
+            'Literal string compiled')
+        template = test_har.compile_har_template('/users/{{ id }}/{{id}}')
+        self.assertEqual(
+            template.render(dict(id=1)), '/users/1/1',
+            'Wrong rendered string template')
+        self.assertEqual(
+            test_har.compile_har_template(dict(id='{{id}}')), dict(
+                id='{{id}}'), 'Nested strings compiled without `json`')
+
+        value = dict(
+            id='{{id}}', name='Foo {{id}}', literal=dict(a=[1]),
+            tags=['foo', '{{tag}}'])
+        template = test_har.compile_har_template(value, json=True)
+        self.assertEqual(
+            template.names, frozenset(['id', 'tag']),
+            'Wrong template variable names')
+        self.assertIs(
+            template.render(dict(id=1, tag='bar'))['literal'],
+            value['literal'], 'Literal JSON copied')
+        self.assertEqual(
+            template.render(dict(id=1, tag='bar')),
+            dict(id=1, name='Foo 1', literal=dict(a=[1]), tags=['foo', 'bar']),
+            'Wrong rendered JSON template')
+        literal = [dict(a=1)]
+        self.assertIs(
+            test_har.compile_har_template(literal, json=True), literal,
+            'Literal JSON compiled')
+
+        with self.assertRaises(ValueError):
+            template.render(dict(id=1))
+        # Templates are literal until variables are in use
+        self.assertEqual(
+            test_har.render_har_template(test_har.compile_har_template(
+                '{{id}}')), '{{id}}', 'Template rendered without variables')
+        self.assertIs(
+            test_har.render_har_template(template, {}), value,
+            'JSON template rendered without variables')
+
+    def test_capture(self):
+        """
+        Captures are JSON pointers or simple JSONPaths.
+        """
+        value = {'results': [{'id': 1, 'a/b': 2, '~': 3}]}
+        for expression, expected in (
+                ('', value),
+                ('/results/0/id', 1),
+                ('/results/0/a~1b', 2),
+                ('/results/0/~0', 3),
+                ('$', value),
+                ('$.results[0].id', 1),
+                ("$.results[0]['a/b']", 2),
+                ('$.results.0["~"]', 3)):
+            self.assertEqual(
+                test_har.compile_har_capture('foo', expression).extract(
+                    value),
+                expected, 'Wrong value captured at {0!r}'.format(expression))
+        for expression in ('results', '$results', '$.results[x]'):
+            with self.assertRaises(ValueError):
+                test_har.compile_har_capture('foo', expression)
+
+
+class HARDependenciesTests(unittest.TestCase):
+    """
+    Test scheduling entries by their dependencies.
+    """
+
+    def setUp(self):
+        """
+        Compile entries with each kind of dependency.
+        """
+        super(HARDependenciesTests, self).setUp()
+        self.case = test_har.HARTestCase()
+        self.entries = [
+            dict(request=dict(method='POST', url='/a/'), _id='a',
+                 _captures=dict(a='/id')),
+            dict(request=dict(method='GET', url='/b/'), _independent=True),
+            dict(request=dict(method='GET', url='/c/'), pageref='page',
+                 _orderingGroup='c'),
+            dict(request=dict(method='GET', url='/{{a}}/'),
+                 _orderingGroup='c'),
+            dict(request=dict(method='GET', url='/d/')),
+            dict(request=dict(method='GET', url='/e/'), pageref='page',
+                 _dependsOn='a', _independent=True),
+            dict(request=dict(method='delete', url='/a/')),
+            dict(request=dict(method='GET', url='/f/'), _dependsOn=['a']),
+        ]
+        self.plans = test_har.compile_har(dict(log=dict(entries=self.entries)))
+
+    def test_dependencies(self):
+        """
+        Entries depend on ids, groups, pages, variables and barriers.
+        """
+        self.assertEqual(
+            self.case.get_har_dependencies(self.plans), [
+                set(), set(), set(), {0, 2}, {0}, {0, 2}, {4}, {0, 6}],
+            'Wrong dependencies')
+        self.case.har_unsafe_barriers = True
+        self.assertEqual(
+            self.case.get_har_dependencies(self.plans), [
+                set(), set(), {0}, {0, 2}, {0}, {0, 2}, {0, 2, 3, 4},
+                {0, 6}],
+            'Wrong barrier dependencies')
+
+        self.entries[7]["_dependsOn"] = 'f'
+        with self.assertRaises(ValueError):
+            self.case.get_har_dependencies(test_har.compile_har(
+                dict(log=dict(entries=self.entries))))
+
+    def test_schedule(self):
+        """
+        The longest paths run first and dependents of failures don't run.
+        """
+        self.case.har_workers = 1
+        self.entries[1]["time"] = 100
+        started = []
+
+        def assert_entry(plan):
+            started.append(plan.index)
+            if plan.index == 3:
+                raise test_har.HAREntryAssertionError(plan.index, {})
+            return plan.index
+
+        responses, errors = self.case.schedule_har_plans(
+            self.plans, assert_entry)
+        self.assertEqual(
+            started, [1, 0, 4, 2, 6, 3, 5, 7], 'Wrong schedule order')
+        self.assertEqual(list(errors), [3], 'Wrong schedule errors')
+        self.assertEqual(
+            responses, {index: index for index in range(8)},
+            'Wrong schedule responses')
+
+        started[:] = []
+        self.case.har_workers = 2
+        self.entries[3]["_id"] = 'c'
+        self.entries[4]["_dependsOn"] = 'c'
+        responses, errors = self.case.schedule_har_plans(
+            test_har.compile_har(dict(log=dict(entries=self.entries))),
+            assert_entry)
+        self.assertEqual(
+            sorted(started), [0, 1, 2, 3, 5], 'Dependents of a failure run')
+
+    def test_schedule_window(self):
+        """
+        Streamed plans are scheduled a bounded window at a time.
+        """
+        self.case.har_workers = 2
+        self.case.har_schedule_window = 3
+        started = []
+
+        def assert_entry(plan):
+            started.append(plan.index)
+            if plan.index == self.failing:
+                raise test_har.HAREntryAssertionError(plan.index, {})
+
+        self.failing = None
+        responses, errors = self.case.schedule_har_plans(
+            iter(self.plans), assert_entry)
+        self.assertEqual(
+            [sorted(started[:3]), sorted(started[3:6]), sorted(started[6:])],
+            [[0, 1, 2], [3, 4, 5], [6, 7]], 'Wrong schedule windows')
+        self.assertEqual(
+            (responses, errors), ({}, {}), 'Wrong window results')
+
+        started[:] = []
+        self.failing = 4
+        responses, errors = self.case.schedule_har_plans(
+            iter(self.plans), assert_entry)
+        self.assertEqual(
+            sorted(started), [0, 1, 2, 3, 4, 5],
+            'Window run after a failure')
+        self.assertEqual(list(errors), [4], 'Wrong window errors')
@@ -2,7 +2,11 @@
 Test using HAR files in Python tests against the Django ReST framework.
 """
 
+import io
+import json
+
 from django import http
+from django.contrib.auth import models
 
 from rest_framework import response
 
@@ -22,3 +26,94 @@ class HARDogfoodDRFTests(tests.HARDogfoodTestCase, test_har.HARTestCase):
         Ensure tests are running.
         """
         self.assertTrue(True)
+
+    def test_load_concurrent(self):
+        """
+        The test client doesn't support concurrent load.
+        """
+        with self.assertRaises(ValueError):
+            self.loadHAR(self.example, concurrency=2)
+        self.har_workers = 2
+        with self.assertRaises(ValueError):
+            self.assertHAR(self.example)
+
+    def test_query_budgets(self):
+        """
+        The database queries for each entry are captured and budgeted.
+        """
+        self.entry["_maxQueries"] = 100
+        self.entry["_maxDbTime"] = 60 * 1000
+        output = io.StringIO()
+        response = self.assertHAR(self.example, output=output)[0]
+        self.assertTrue(response.har_queries, 'Database queries not captured')
+        self.assertEqual(
+            response.har_db_time,
+            sum(time for _, time in response.har_queries),
+            'Wrong database time')
+        entry = json.loads(output.getvalue())["log"]["entries"][0]
+        self.assertEqual(
+            entry["_queries"], len(response.har_queries),
+            'Wrong output query count')
+        self.assertEqual(
+            entry["_dbTime"], response.har_db_time, 'Wrong output DB time')
+
+    def test_query_budgets_exceeded(self):
+        """
+        Fail when an entry makes too many or too slow database queries.
+        """
+        self.entry["_maxQueries"] = 0
+        self.entry["_maxDbTime"] = 0
+        with self.assertRaises(test_har.HAREntryAssertionError) as failure:
+            self.assertHAR(self.example)
+        self.assertEqual(
+            list(failure.exception.failures), ['_maxQueries', '_maxDbTime'],
+            'Wrong query budget failures')
+        self.assertIn(
+            'repeated 1 times', str(failure.exception.failures['_maxQueries']),
+            'Wrong query budget failure')
+
+    def test_iter_content(self):
+        """
+        Non-streaming response bodies are iterated as one chunk.
+        """
+        self.assertEqual(
+            list(self.iter_content(http.HttpResponse(b'foo'))), [b'foo'],
+            'Wrong non-streaming response body chunks')
+
+
+@test_har.har_entry_tests('example.har.json')
+class HARDogfoodDRFEntryTests(test_har.HARTestCase):
+    """
+    Generate one test per example HAR entry for the Django ReST framework.
+    """
+
+
+class HARDogfoodDRFFixtureTests(test_har.HARTestCase):
+    """
+    Create the test data for a HAR once and roll back each entry.
+    """
+
+    example_har = 'fixtures.har.json'
+    har_entry_rollback = True
+
+    @classmethod
+    def setUpHARTestData(cls, example):
+        """
+        Create test data in Python as well as from the HAR `_fixtures`.
+        """
+        models.User.objects.create(
+            username='hook_username', email='hook@example.com')
+
+    def test_fixtures(self):
+        """
+        Each entry sees only the test data for the class.
+        """
+        self.assertEqual(
+            models.User.objects.get(pk=1000).username, 'fixture_username',
+            'HAR fixtures not loaded')
+        self.assertHAR(self.example)
+        # The same user can be created again since it was rolled back
+        self.assertHAR(self.example)
+        self.assertFalse(
+            models.User.objects.filter(username='bar_username').exists(),
+            'Entry changes not rolled back')
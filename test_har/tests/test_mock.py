@@ -0,0 +1,190 @@
+"""
+Test serving the responses recorded in a HAR as a mock of the backend.
+"""
+
+import os
+import json
+import base64
+import shutil
+import tempfile
+
+import requests
+
+from test_har import mock_har
+from test_har import requests_har as test_har
+
+
+class HARMockTests(test_har.HARTestCase):
+    """
+    Test serving the responses recorded in a HAR as a mock of the backend.
+    """
+
+    example_har = 'example.har.json'
+
+    def setUp(self):
+        """
+        Mount the example HAR as the transport for its host.
+        """
+        super(HARMockTests, self).setUp()
+        self.adapter = test_har.HARMockAdapter(
+            self.har_path(self.example_har))
+        self.har_session.mount('mock://', self.adapter)
+
+    def make_entry(self, url, content, method='GET', post=None):
+        """
+        Return an entry for the URL with the response content.
+        """
+        request = dict(method=method, url=url, headers=[])
+        if post is not None:
+            request["postData"] = dict(
+                mimeType='application/json', text=post)
+        return dict(
+            request=request, response=dict(
+                status=200, statusText='OK',
+                headers=[dict(name='Content-Length', value='1')],
+                content=content))
+
+    def test_adapter(self):
+        """
+        Replay a HAR against itself through the transport adapter.
+        """
+        self.assertEqual(len(self.adapter.har_mock), 1, 'Wrong mock index')
+        response = self.assertHAR(self.example)[0]
+        self.assertEqual(
+            response.json(), self.entry["response"]["content"]["text"],
+            'Wrong mocked response body')
+        self.assertNotIn(
+            'Content-Length', response.headers, 'Transfer header served')
+
+        with self.assertRaises(mock_har.HARMockNotFound):
+            self.har_session.get('mock://example.com/users/')
+
+    def test_lookup(self):
+        """
+        Requests are matched by normalized URL and optionally body.
+        """
+        entries = [
+            self.make_entry(
+                'HTTP://Example.com/items/?b=2&a=1',
+                dict(mimeType='text/plain; charset=latin-1', text='caf\xe9')),
+            self.make_entry(
+                'http://example.com/items/?a=1&b=2',
+                dict(mimeType='application/json', text=['second'])),
+            self.make_entry(
+                'http://example.com/items/', dict(
+                    mimeType='application/json', text=dict(a=1)),
+                method='POST', post=dict(a=1, b=2)),
+            self.make_entry(
+                'http://example.com/items/', dict(
+                    mimeType='application/json', text=dict(b=2)),
+                method='POST', post='{"b": 2}'),
+            dict(request=dict(
+                method='GET', url='http://example.com/unrecorded/')),
+        ]
+        mock = mock_har.HARMock(entries)
+        self.assertEqual(len(mock), 2, 'Wrong number of indexed requests')
+        first = mock.lookup('get', 'http://example.com/items/?a=1&b=2')
+        self.assertEqual(first.body, 'caf\xe9'.encode('latin-1'))
+        self.assertIs(first.body, first.body, 'Body not decoded once')
+        self.assertEqual(
+            first.headers, [('Content-Type', 'text/plain; charset=latin-1')],
+            'Wrong mocked headers')
+        for _ in range(2):
+            self.assertEqual(
+                mock.lookup('GET', 'http://example.com/items/?b=2&a=1').body,
+                b'["second"]', 'Repeated request not served in order')
+        self.assertEqual(
+            mock.lookup('POST', 'http://example.com/items/').body,
+            b'{"a":1}', 'Bodies matched by default')
+
+        mock = mock_har.HARMock(entries, match_body=True, match_host=False)
+        self.assertEqual(len(mock), 3, 'Wrong number of indexed bodies')
+        self.assertEqual(
+            mock.lookup(
+                'POST', '/items/', b'{"b": 2, "a": 1}',
+                'application/json').body,
+            b'{"a":1}', 'Wrong body matched')
+        self.assertEqual(
+            mock.lookup(
+                'POST', '/items/', b'{"b":2}', 'application/json').body,
+            b'{"b":2}', 'Wrong body matched')
+        with self.assertRaises(mock_har.HARMockNotFound):
+            mock.lookup('POST', '/items/', b'{', 'application/json')
+        self.assertEqual(
+            mock_har.har_mock_body(
+                dict(a=1), 'application/x-www-form-urlencoded'),
+            b'a=1', 'Wrong form body key')
+
+    def test_server(self):
+        """
+        Serve a HAR from a local HTTP server.
+        """
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        with open(os.path.join(tmp, 'download.bin'), 'wb') as body_file:
+            body_file.write(b'\x00\x01')
+        har_path = os.path.join(tmp, 'mock.har.json')
+        with open(har_path, 'w') as har_file:
+            json.dump(dict(log=dict(entries=[
+                self.make_entry(
+                    'https://example.com/download/',
+                    dict(mimeType='application/octet-stream',
+                         _file='download.bin')),
+                self.make_entry(
+                    'https://example.com/base64/',
+                    dict(mimeType='application/octet-stream',
+                         encoding='base64',
+                         text=base64.b64encode(b'\xff').decode('ascii'))),
+                self.make_entry(
+                    'https://example.com/digest/',
+                    dict(mimeType='application/octet-stream', _sha256='0')),
+                self.make_entry(
+                    'https://example.com/empty/', dict(mimeType='')),
+            ])), har_file)
+
+        with mock_har.HARMockServer(har_path) as server:
+            self.assertEqual(
+                requests.get(server.url + '/download/').content, b'\x00\x01',
+                'Wrong external file body')
+            self.assertEqual(
+                requests.get(server.url + '/base64/').content, b'\xff',
+                'Wrong base64 body')
+            self.assertEqual(
+                requests.head(server.url + '/base64/').content, b'',
+                'HEAD response body sent')
+            self.assertEqual(
+                requests.get(server.url + '/empty/').content, b'',
+                'Wrong empty body')
+            self.assertEqual(
+                requests.get(server.url + '/digest/').status_code, 501,
+                'Digest only body served')
+            self.assertEqual(
+                requests.post(server.url + '/missing/', data='foo')
+                .status_code, 501, 'Unmatched request served')
+
+    def test_record_round_trip(self):
+        """
+        Serve a HAR recorded with external bodies into a sub-directory.
+        """
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        body = bytes(bytearray(range(256))) * 4
+        source = self.make_entry(
+            'mock://example.com/big/', dict(
+                mimeType='application/octet-stream', encoding='base64',
+                text=base64.b64encode(body).decode('ascii')))
+        self.har_session.mount('mock://', test_har.HARMockAdapter([source]))
+        self.har_record = True
+        self.har_record_inline_max = 16
+        self.har_record_output = os.path.join(
+            tmp, 'fixtures', 'users.har.json')
+        os.makedirs(os.path.dirname(self.har_record_output))
+        self.assertHAR([dict(request=source["request"])])
+
+        self.har_session.mount('mock://', test_har.HARMockAdapter(
+            self.har_record_output))
+        self.assertEqual(
+            self.har_session.get('mock://example.com/big/').content, body,
+            'Wrong recorded external body served')
+        self.har_record = False
+        self.assertHAR(self.compileHAR(self.har_record_output))
@@ -2,7 +2,20 @@
 Test using HAR files in Python tests against the requests library.
 """
 
+import os
+import io
+import copy
 import json
+import shutil
+import tempfile
+import threading
+import time
+
+try:
+    from unittest import mock
+except ImportError:  # pragma: no cover
+    # BBB Python 2 compat
+    import mock
 
 import requests
 import requests_mock
@@ -43,6 +56,10 @@ class HARDogfoodRequestsTests(tests.HARDogfoodTestCase, test_har.HARTestCase):
             reason=self.entry["response"]["statusText"],
             headers=self.headers,
             text=json.dumps(content))
+        self.mocker.get(
+            self.DOWNLOAD_URL, status_code=200, reason='OK',
+            headers={'Content-Type': 'application/octet-stream'},
+            content=self.DOWNLOAD_CONTENT)
 
     def test_non_json(self):
         """
@@ -87,3 +104,349 @@ class HARDogfoodRequestsTests(tests.HARDogfoodTestCase, test_har.HARTestCase):
             har_failures.exception.failures['content/mimeType'].args,
             expected.exception.args,
             'Wrong missing response MIME type failure assertion')
+
+    def mock_entries(self, count, text=None, **extension):
+        """
+        Copy the example entry with different URLs and mock the responses.
+        """
+        entries = []
+        for idx in range(count):
+            entry = copy.deepcopy(self.entry)
+            entry.update(extension)
+            entry["request"]["url"] = 'mock://example.com/users/{0}/'.format(
+                idx)
+            self.mocker.post(
+                entry["request"]["url"],
+                status_code=self.entry["response"]["status"],
+                reason=self.entry["response"]["statusText"],
+                headers=self.headers,
+                text=text or json.dumps(
+                    self.entry["response"]["content"]["text"]))
+            entries.append(entry)
+        return entries
+
+    def test_concurrent(self):
+        """
+        Independent entries are sent concurrently and returned in HAR order.
+        """
+        self.har_workers = 3
+        threads = set()
+
+        def concurrent_text(request, context):
+            threads.add(threading.current_thread())
+            # Hold the request long enough for all workers to be started
+            time.sleep(0.1)
+            return json.dumps(self.entry["response"]["content"]["text"])
+
+        entries = self.mock_entries(3, concurrent_text, _independent=True)
+        output = io.StringIO()
+        responses = self.assertHAR(entries, output=output)
+        self.assertEqual(
+            len(json.loads(output.getvalue())["log"]["entries"]), 3,
+            'Wrong number of concurrent output entries')
+        self.assertEqual(
+            [response.url for response in responses],
+            [entry["request"]["url"] for entry in entries],
+            'Concurrent responses in wrong order')
+        self.assertGreater(
+            len(threads), 1, 'Independent entries not sent concurrently')
+        self.assertNotIn(
+            threading.current_thread(), threads,
+            'Independent entries sent in the test thread')
+        self.assertEqual(
+            self.assertHAR(entries[:1], keep_responses=False), [],
+            'Concurrent responses retained')
+
+        self.har_schedule_window = 2
+        self.assertEqual(
+            [response.url for response in self.assertHAR(iter(entries))],
+            [entry["request"]["url"] for entry in entries],
+            'Streamed concurrent responses in wrong order')
+
+    def test_query_budgets(self):
+        """
+        Database query budgets are ignored when queries aren't captured.
+        """
+        self.entry["_maxQueries"] = 0
+        self.entry["_maxDbTime"] = 0
+        output = io.StringIO()
+        self.assertHAR(self.example, output=output)
+        self.assertNotIn(
+            "_queries", json.loads(output.getvalue())["log"]["entries"][0],
+            'Uncaptured queries written')
+
+    def test_concurrent_failure(self):
+        """
+        Failures are raised in HAR order and stop their ordering group.
+        """
+        self.har_workers = 2
+        entries = self.mock_entries(3, _orderingGroup='foo')
+        entries[1]["response"]["status"] = 400
+        entries[2]["response"]["status"] = 400
+        independent = self.mock_entries(1, _independent=True)[0]
+        independent["response"]["status"] = 500
+
+        with self.assertRaises(test_har.HAREntryAssertionError) as failure:
+            self.assertHAR(entries + [independent])
+        self.assertEqual(
+            failure.exception.response.url, entries[1]["request"]["url"],
+            'Wrong concurrent failure raised')
+        self.assertEqual(
+            [request.url for request in self.mocker.request_history
+             if request.url == entries[2]["request"]["url"]],
+            [], 'Entry sent after failure in its ordering group')
+
+    def test_load_concurrent(self):
+        """
+        Replay concurrently for a duration and sample assertions.
+        """
+        self.entry["response"]["status"] = 400
+        report = self.loadHAR(
+            self.example, duration=0.05, concurrency=2, assert_sample=1)
+        self.assertGreater(report.requests, 0, 'No load requests sent')
+        self.assertEqual(
+            len(report.failures), report.requests,
+            'Wrong number of sampled load failures')
+        self.assertIn(
+            'status', report.failures[0].failures,
+            'Wrong sampled load failure')
+
+    def test_nested_content(self):
+        """
+        Nested JSON content differences are reported at their paths.
+        """
+        self.mocker.post(
+            self.entry["request"]["url"],
+            status_code=self.entry["response"]["status"],
+            reason=self.entry["response"]["statusText"],
+            headers=self.headers,
+            text=json.dumps(dict(
+                items=[dict(name='a', extra=True), dict(name='b')],
+                blob='x' * 5000, kind=[1], short=[1, 2, 3])))
+        self.entry["response"]["content"]["text"] = dict(
+            items=[dict(name='a'), dict(name='c')],
+            blob='y' * 5000, kind=dict(a=1), short=[1, 2])
+
+        with self.assertRaises(test_har.HAREntryAssertionError) as failure:
+            self.assertHAR(self.example)
+        failures = failure.exception.failures
+        self.assertEqual(
+            list(failures), ['content/items/1/name', 'content/blob',
+                             'content/kind', 'content/short'],
+            'Wrong nested content failures')
+        self.assertIn(
+            "'items/1/name'", str(failures['content/items/1/name']),
+            'Wrong nested content failure message')
+        self.assertLess(
+            len(str(failures['content/blob'])), 500,
+            'Large content value failure message not truncated')
+        self.assertIn(
+            "'kind'", str(failures['content/kind']),
+            'Wrong content type failure message')
+        self.assertIn(
+            "'short' length", str(failures['content/short']),
+            'Wrong content length failure message')
+
+    def test_session(self):
+        """
+        Entries are sent through the test's pooled session.
+        """
+        adapter = self.har_session.adapters["https://"]
+        self.assertEqual(
+            adapter._pool_maxsize, self.har_pool_maxsize,
+            'Wrong session connection pool size')
+        with mock.patch.object(
+                self.har_session, 'request',
+                wraps=self.har_session.request) as session_request:
+            self.assertHAR(self.example)
+        self.assertEqual(
+            session_request.call_count, 1, 'Entry not sent through session')
+        self.assertEqual(
+            self.har_session.headers['Connection'],
+            'keep-alive' if self.har_keep_alive else 'close',
+            'Wrong session keep-alive')
+
+    def test_record_inline(self):
+        """
+        Small bodies are recorded inline by type and failures are cleaned up.
+        """
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        output = os.path.join(tmp, 'recorded.har.json')
+        bodies = (
+            ('binary/', 'application/octet-stream', b'\xff\x00'),
+            ('text/', 'text/plain', b'Foo text'),
+            ('invalid/', 'application/json', b'Foo invalid JSON'))
+        entries = []
+        for path, content_type, body in bodies:
+            url = 'mock://example.com/' + path
+            self.mocker.get(
+                url, headers={'Content-Type': content_type}, content=body)
+            entries.append(dict(
+                request=dict(method='GET', url=url, headers=[])))
+        self.har_record = True
+        self.assertEqual(
+            self.assertHAR(entries, keep_responses=False, output=output), [],
+            'Recorded responses retained')
+        with open(output) as output_file:
+            recorded = [
+                entry["response"]["content"]
+                for entry in json.load(output_file)["log"]["entries"]]
+        self.assertEqual(
+            recorded, [
+                dict(
+                    size=2, mimeType='application/octet-stream',
+                    text='/wA=', encoding='base64'),
+                dict(size=8, mimeType='text/plain', text='Foo text'),
+                dict(
+                    size=16, mimeType='application/json',
+                    text='Foo invalid JSON')],
+            'Wrong inline recorded content')
+
+        # Record over the example HAR by default
+        self.example_har = output
+        self.assertHAR(entries[1:])
+        with open(output) as output_file:
+            self.assertEqual(
+                len(json.load(output_file)["log"]["entries"]), 2,
+                'Example HAR not recorded')
+
+        self.mocker.get(
+            entries[0]["request"]["url"], exc=requests.ConnectionError)
+        with self.assertRaises(requests.ConnectionError):
+            self.assertHAR(entries, output=output)
+        self.assertFalse(
+            os.path.exists(output + '.tmp'), 'Temporary HAR not removed')
+        self.assertTrue(os.path.exists(output), 'Recorded HAR removed')
+
+    def test_literal_braces(self):
+        """
+        HARs not using variables replay literal template text unchanged.
+        """
+        url = 'mock://example.com/snippets/?q={{x}}'
+        snippet = 'Hello {{ user.name }}!'
+        self.mocker.post(
+            url, status_code=201, reason='Created',
+            headers={'Content-Type': 'text/plain'}, text=snippet)
+        self.assertHAR([dict(
+            request=dict(
+                method='POST', url=url,
+                headers=[dict(name='X-Template', value='{{x}}')],
+                postData=dict(mimeType='text/plain', text=snippet)),
+            response=dict(
+                status=201, statusText='Created',
+                content=dict(mimeType='text/plain', text=snippet)))])
+        request = self.mocker.last_request
+        self.assertEqual(
+            (requests.utils.unquote(request.url),
+             request.headers['X-Template'], request.text),
+            (url, '{{x}}', snippet),
+            'Literal template text changed')
+
+    def test_chained_failures(self):
+        """
+        Missing captured values fail the entry and stop dependent entries.
+        """
+        json_headers = {'Content-Type': 'application/json'}
+        self.mocker.get(
+            'mock://example.com/items/', reason='OK', headers=json_headers,
+            json=dict(id=1, results=[]))
+        self.mocker.get(
+            'mock://example.com/items/1/', reason='OK', headers=json_headers,
+            json=dict(id=1))
+        entries = [
+            dict(
+                request=dict(
+                    method='GET', url='mock://example.com/items/',
+                    headers=[]),
+                response=dict(
+                    status=200, statusText='OK', headers=[],
+                    content=dict(mimeType='application/json', text={})),
+                _captures=dict(
+                    id='/id', missing="$.results[0]['id']")),
+            dict(
+                request=dict(
+                    method='GET', url='mock://example.com/items/{{id}}/',
+                    headers=[]),
+                response=dict(
+                    status=200, statusText='OK', headers=[],
+                    content=dict(
+                        mimeType='application/json', text=dict(id=1))))]
+        with self.assertRaises(test_har.HAREntryAssertionError) as failure:
+            self.assertHAR(entries)
+        self.assertEqual(
+            list(failure.exception.failures), ['_captures/missing'],
+            'Wrong capture failures')
+        self.assertIn(
+            "Could not capture 'missing'",
+            str(failure.exception.failures['_captures/missing']),
+            'Wrong capture failure message')
+
+        report = self.loadHAR(entries, iterations=2)
+        self.assertEqual(
+            len(report.failures), 2, 'Wrong load capture failures')
+        self.assertEqual(
+            list(report.stats()), ['GET mock://example.com/items/'],
+            'Entry sent without its captured variables')
+
+        self.mocker.get(
+            'mock://example.com/text/', reason='OK',
+            headers={'Content-Type': 'text/plain'}, text='Foo text')
+        entries[0]["request"]["url"] = 'mock://example.com/text/'
+        entries[0]["response"]["content"] = dict(
+            mimeType='text/plain', text='Foo text')
+        with self.assertRaises(test_har.HAREntryAssertionError) as failure:
+            self.assertHAREntry(entries[0])
+        self.assertEqual(
+            list(failure.exception.failures),
+            ['_captures/id', '_captures/missing'],
+            'Wrong non-JSON capture failures')
+
+        # Record the captures and keep the templates
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        output = os.path.join(tmp, 'recorded.har.json')
+        self.har_record = True
+        entries[0]["request"]["url"] = 'mock://example.com/items/'
+        entries[0]["_captures"] = dict(id='/id')
+        self.assertHAR(entries, output=output)
+        with open(output) as output_file:
+            recorded = json.load(output_file)["log"]["entries"]
+        self.assertEqual(
+            recorded[1]["request"]["url"], 'mock://example.com/items/{{id}}/',
+            'Recorded template rendered')
+        self.assertEqual(
+            recorded[1]["response"]["content"]["text"], dict(id=1),
+            'Wrong recorded chained response')
+        entries[0]["_captures"] = dict(missing='/missing')
+        with self.assertRaises(test_har.HAREntryAssertionError):
+            self.assertHAR(entries, output=output)
+
+
+class HARDogfoodRequestsClassSessionTests(HARDogfoodRequestsTests):
+    """
+    Test sharing one session across all tests in the class.
+    """
+
+    har_session_per_class = True
+    har_keep_alive = False
+    har_max_retries = 3
+
+    def test_session(self):
+        """
+        The session is shared across the class.
+        """
+        self.assertIs(
+            self.har_session, type(self).har_session,
+            'Session not shared across the class')
+        super(HARDogfoodRequestsClassSessionTests, self).test_session()
+
+    def test_cookies(self):
+        """
+        Cookies set in one test are not sent by the next.
+        """
+        self.har_session.cookies.set('sessionid', 'abc')
+        test_har.HARTestCase.setUp(type(self)('test_cookies'))
+        self.assertEqual(
+            len(self.har_session.cookies), 0,
+            'Shared session cookies carried into the next test')
@@ -0,0 +1,182 @@
+"""
+Test running directories of HAR files in parallel processes.
+"""
+
+import os
+import io
+import json
+import shutil
+import tempfile
+import unittest
+
+try:
+    from unittest import mock
+except ImportError:  # pragma: no cover
+    # BBB Python 2 compat
+    import mock
+
+import test_har
+from test_har import runner
+
+
+class HARRunnerTests(unittest.TestCase):
+    """
+    Test running directories of HAR files in parallel processes.
+    """
+
+    def setUp(self):
+        """
+        Copy the example HAR to a directory along with a failing HAR.
+        """
+        super(HARRunnerTests, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        example_path = os.path.join(
+            os.path.dirname(__file__), 'example.har.json')
+        with open(example_path) as example_file:
+            self.example = json.load(example_file)
+        os.mkdir(os.path.join(self.tmp, 'sub'))
+        self.write('sub/example.har.json', self.example)
+        failing = json.loads(json.dumps(self.example))
+        failing["log"]["entries"][0]["response"]["status"] = 299
+        failing["log"]["entries"].append(failing["log"]["entries"][0])
+        self.write('failing.har.json', failing)
+        self.write('ignored.json', self.example)
+
+    def write(self, path, har):
+        """
+        Write a HAR to a path in the directory.
+        """
+        with open(os.path.join(self.tmp, path), 'w') as har_file:
+            json.dump(har, har_file)
+
+    def test_shard(self):
+        """
+        HAR files are balanced across shards by entries or timings.
+        """
+        paths = runner.discover(self.tmp)
+        self.assertEqual(
+            paths,
+            ['failing.har.json', os.path.join('sub', 'example.har.json')],
+            'Wrong discovered HAR files')
+        self.assertEqual(
+            runner.har_file_weights(self.tmp, paths),
+            {paths[0]: 2, paths[1]: 1}, 'Wrong HAR entry count weights')
+        self.assertEqual(
+            runner.har_file_weights(self.tmp, paths, {paths[1]: 3.0}),
+            {paths[0]: 6.0, paths[1]: 3.0}, 'Wrong HAR timing weights')
+
+        self.assertEqual(
+            runner.shard_har_files(
+                dict(a=5, b=4, c=3, d=3, e=3), processes=2),
+            [['a', 'd'], ['b', 'c', 'e']], 'Wrong balanced shards')
+        self.assertEqual(
+            runner.shard_har_files(dict(a=1), processes=4), [['a']],
+            'Empty shards not dropped')
+
+    def test_worker_test_databases(self):
+        """
+        Each worker gets its own test database names.
+        """
+        databases = dict(
+            default=dict(ENGINE='django.db.backends.sqlite3', NAME='foo'),
+            sqlite=dict(
+                ENGINE='django.db.backends.sqlite3', NAME='bar',
+                TEST=dict(NAME='test_bar.sqlite3')),
+            postgres=dict(
+                ENGINE='django.db.backends.postgresql', NAME='qux'))
+        runner.worker_test_databases(databases, 2)
+        self.assertEqual(
+            databases["default"]["TEST"], {},
+            'In-memory test database renamed')
+        self.assertEqual(
+            databases["sqlite"]["TEST"]["NAME"], 'test_bar.sqlite3_2',
+            'Wrong worker test database file')
+        self.assertEqual(
+            databases["postgres"]["TEST"]["NAME"], 'test_qux_2',
+            'Wrong worker test database name')
+
+    def test_worker_databases(self):
+        """
+        Set up and tear down a worker's test databases in-process.
+        """
+        from django import db
+
+        name = os.path.join(self.tmp, 'worker.sqlite3')
+        test_name = os.path.join(self.tmp, 'test_worker.sqlite3')
+        databases = db.connections.configure_settings(dict(
+            default=dict(db.connections.settings['default']),
+            worker=dict(
+                ENGINE='django.db.backends.sqlite3', NAME=name,
+                TEST=dict(NAME=test_name, DEPENDENCIES=[]))))
+        self.addCleanup(db.connections.__delitem__, 'worker')
+        with mock.patch.dict(
+                db.connections.settings, worker=databases['worker']):
+            with runner.worker_databases(3, aliases={'worker'}):
+                connection = db.connections['worker']
+                self.assertEqual(
+                    connection.settings_dict['NAME'], test_name + '_3',
+                    'Wrong worker test database')
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT COUNT(*) FROM auth_user')
+                    self.assertEqual(
+                        cursor.fetchone(), (0, ),
+                        'Worker test database not migrated')
+        self.assertFalse(
+            os.path.exists(test_name + '_3'),
+            'Worker test database not destroyed')
+        self.assertEqual(
+            connection.settings_dict['NAME'], name,
+            'Worker database name not restored')
+
+    def test_run_har_files(self):
+        """
+        Each HAR file is run as one test in the current process.
+        """
+        results = runner.run_har_files(
+            'drf', self.tmp, runner.discover(self.tmp))
+        self.assertEqual(
+            [result["status"] for result in results], ['fail', 'pass'],
+            'Wrong HAR file results')
+        self.assertIn(
+            'Wrong response status code', results[0]["messages"][0],
+            'Wrong HAR file failure message')
+
+        with mock.patch.object(
+                test_har, 'iter_har_entries', side_effect=ValueError('Foo')):
+            results = runner.run_har_files(
+                'requests', self.tmp, ['failing.har.json'])
+        self.assertEqual(
+            results[0]["status"], 'error', 'Wrong HAR file error result')
+
+    def test_main(self):
+        """
+        Run the HAR files across worker processes with their own databases.
+        """
+        report_path = os.path.join(self.tmp, 'report.json')
+        stdout = io.StringIO()
+        with mock.patch('sys.stdout', stdout):
+            status = runner.main([
+                self.tmp, '--backend', 'drf', '--processes', '2',
+                '--report', report_path,
+                '--settings', os.environ['DJANGO_SETTINGS_MODULE']])
+        self.assertEqual(status, 1, 'Wrong runner exit status')
+        self.assertIn(
+            '2 HAR files', stdout.getvalue(), 'Wrong runner summary')
+        with open(report_path) as report_file:
+            report = json.load(report_file)
+        self.assertEqual(report["processes"], 2, 'Wrong number of workers')
+        self.assertEqual(
+            [result["status"] for result in report["files"]],
+            ['fail', 'pass'], 'Wrong runner results')
+
+        os.remove(os.path.join(self.tmp, 'failing.har.json'))
+        with mock.patch('sys.stdout', stdout):
+            status = runner.main([
+                self.tmp, '--backend', 'drf', '--processes', '1',
+                '--timings', report_path])
+        self.assertEqual(status, 0, 'Wrong runner success exit status')
+
+        self.assertEqual(
+            runner.run(self.tmp, pattern='*.foo')["totals"]["files"], 0,
+            'Wrong empty runner report')
@@ -0,0 +1,229 @@
+"""
+Test using HAR files in Python tests against in-process WSGI and ASGI apps.
+"""
+
+import json
+import hashlib
+
+from django import test
+from django.core import signals
+from django.db import close_old_connections
+
+from test_har import wsgi_har as test_har
+from test_har import tests
+
+
+class HARDogfoodWSGITests(
+        tests.HARDogfoodTestCase, test_har.HARTestCase, test.TestCase):
+    """
+    Test using HAR files against the `test_har_drf` WSGI application.
+    """
+
+    RESPONSE_TYPE = test_har.HARAppResponse
+
+    har_app = 'test_har_drf.wsgi.application'
+
+    # The test database transaction is bound to the thread
+    har_thread_safe = False
+
+    def setUp(self):
+        """
+        Accept the HAR hosts and keep the test database connection open.
+        """
+        super(HARDogfoodWSGITests, self).setUp()
+        settings = self.settings(ALLOWED_HOSTS=['*'])
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # As the Django test client does
+        signals.request_finished.disconnect(close_old_connections)
+        self.addCleanup(
+            signals.request_finished.connect, close_old_connections)
+
+    def test_environ(self):
+        """
+        The WSGI environ is built from the HAR request.
+        """
+        environ = self.make_wsgi_environ(
+            'get', 'https://example.com:8443/foo%20bar/?baz=qux',
+            {'Content-Type': 'text/plain', 'X-Foo': 'bar'}, b'body')
+        self.assertEqual(
+            (environ['REQUEST_METHOD'], environ['PATH_INFO'],
+             environ['QUERY_STRING'], environ['SERVER_PORT'],
+             environ['wsgi.url_scheme']),
+            ('GET', '/foo bar/', 'baz=qux', '8443', 'https'),
+            'Wrong WSGI environ request')
+        self.assertEqual(
+            (environ['CONTENT_TYPE'], environ['HTTP_X_FOO'],
+             environ['CONTENT_LENGTH'], environ['wsgi.input'].read()),
+            ('text/plain', 'bar', '4', b'body'), 'Wrong WSGI environ body')
+
+    def test_app(self):
+        """
+        Streamed and written bodies from simple WSGI applications.
+        """
+        def app(environ, start_response):
+            write = start_response(
+                '200 OK', [('Content-Type', 'text/plain; charset=latin-1')])
+            write(b'caf')
+            yield environ['wsgi.input'].read()
+
+        self.har_app = staticmethod(app)
+        response = self.request_har(
+            'POST', '/', data=dict(foo='\xe9'),
+            headers={'Content-Type': 'application/x-www-form-urlencoded'})
+        self.assertEqual(
+            response.text, 'caffoo=%C3%A9', 'Wrong written WSGI body')
+
+        response = self.request_har('POST', '/', data=b'\xe9', stream=True)
+        self.assertEqual(
+            list(response.iter_content()), [b'caf', b'\xe9'],
+            'Wrong streamed WSGI body')
+        self.assertEqual(response.text, '', 'Streamed WSGI body buffered')
+        response = test_har.HARAppResponse(200, 'OK', [], b'foo')
+        self.assertEqual(
+            list(response.iter_content()), [b'foo'],
+            'Wrong buffered WSGI body chunks')
+
+        self.har_app = staticmethod(
+            lambda environ, start_response: (
+                start_response('204 No Content', []), [])[1])
+        response = self.request_har('GET', '/', stream=True)
+        self.assertEqual(
+            list(response.iter_content()), [], 'Wrong empty WSGI body')
+
+
+async def asgi_app(scope, receive, send):
+    """
+    Echo the request as JSON and stream a binary download.
+    """
+    request = await receive()
+    if scope['path'] == '/download/':
+        await send(dict(
+            type='http.response.start', status=200,
+            headers=[(b'content-type', b'application/octet-stream')]))
+        for _ in range(4):
+            await send(dict(
+                type='http.response.body', body=b'\x00' * 1024,
+                more_body=True))
+        await send(dict(type='http.response.body', body=b''))
+        assert (await receive())['type'] == 'http.disconnect'
+        return
+
+    await send(dict(
+        type='http.response.start', status=scope['query_string'] and int(
+            scope['query_string']) or 201,
+        headers=[(b'content-type', b'application/json')]))
+    await send(dict(type='http.response.body', body=json.dumps(dict(
+        method=scope['method'], path=scope['path'],
+        host=dict(scope['headers'])[b'host'].decode(),
+        body=request['body'].decode())).encode()))
+
+
+class HARDogfoodASGITests(test_har.HARASGITestCase):
+    """
+    Test using HAR files against an in-process ASGI application.
+    """
+
+    har_app = staticmethod(asgi_app)
+
+    def make_entry(self, url, status=201, **content):
+        """
+        Return a POST entry expecting the echoed request.
+        """
+        return dict(
+            request=dict(
+                method='POST', url=url, headers=[],
+                postData=dict(mimeType='application/json', text=dict(a=1))),
+            response=dict(
+                status=status, statusText='Created', headers=[],
+                content=dict(mimeType='application/json', **content)))
+
+    async def test_success(self):
+        """
+        Await the assertions on responses from the ASGI application.
+        """
+        response = await self.assertHAREntry(self.make_entry(
+            'mock://example.com/foo%20bar/',
+            text=dict(method='POST', path='/foo bar/', host='example.com',
+                      body=test_har.json_codec.dumps(dict(a=1)))))
+        self.assertEqual(
+            self.get_reason(response), 'Created', 'Wrong ASGI reason')
+
+    async def test_failure(self):
+        """
+        Fail when the ASGI response doesn't match the HAR.
+        """
+        with self.assertRaises(test_har.HAREntryAssertionError) as failure:
+            await self.assertHAREntry(self.make_entry(
+                'https://example.com/?299', text=dict(path='/bar/')))
+        self.assertEqual(
+            list(failure.exception.failures),
+            ['status', 'statusText', 'content/path'],
+            'Wrong ASGI failures')
+        self.assertEqual(
+            failure.exception.response.reason, '',
+            'Wrong unknown status reason')
+
+    async def test_binary(self):
+        """
+        Streamed binary ASGI bodies are hashed as they are sent.
+        """
+        body = b'\x00' * 4096
+        await self.assertHAREntry(dict(
+            request=dict(
+                method='GET', url='http://localhost:8000/download/',
+                headers=[]),
+            response=dict(
+                status=200, statusText='OK', headers=[],
+                content=dict(
+                    mimeType='application/octet-stream', size=len(body),
+                    _sha256=hashlib.sha256(body).hexdigest()))))
+
+
+class HARDogfoodDjangoASGITests(test_har.HARASGITestCase):
+    """
+    Test using HAR files against the `test_har_drf` ASGI application.
+    """
+
+    har_app = 'test_har_drf.asgi.application'
+
+    def setUp(self):
+        """
+        Accept the HAR hosts.
+        """
+        super(HARDogfoodDjangoASGITests, self).setUp()
+        settings = test.override_settings(ALLOWED_HOSTS=['*'])
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    async def test_django(self):
+        """
+        Await the assertions on responses from the Django application.
+        """
+        body = bytes(bytearray(range(256))) * 64 * 64
+        responses = await self.assertHAR(dict(log=dict(entries=[
+            dict(
+                request=dict(
+                    method='POST', url='http://example.com/users/',
+                    headers=[dict(name='Accept', value='text/html')],
+                    postData=dict(
+                        mimeType='application/json',
+                        text=dict(username='foo_username'))),
+                response=dict(
+                    status=201, statusText='Created', headers=[],
+                    content=dict(
+                        mimeType='text/html',
+                        text='<html><body>Foo HTML body</body></html>'))),
+            dict(
+                request=dict(
+                    method='GET', url='http://example.com/download/',
+                    headers=[]),
+                response=dict(
+                    status=200, statusText='OK', headers=[],
+                    content=dict(
+                        mimeType='application/octet-stream', size=len(body),
+                        _sha256=hashlib.sha256(body).hexdigest()))),
+        ])))
+        self.assertEqual(
+            responses[1].har_body_digest[0], len(body),
+            'Wrong streamed Django ASGI body size')
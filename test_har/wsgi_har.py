@@ -0,0 +1,325 @@
+import io
+import re
+import sys
+import asyncio
+import importlib
+import hashlib
+from http import HTTPStatus
+from wsgiref import headers as wsgiref_headers
+
+try:
+    from urllib import parse as urllib_parse
+except ImportError:  # pragma: no cover
+    # BBB Python 2 compat
+    import urlparse as urllib_parse  # noqa
+
+import test_har
+from test_har import asyncio_har
+from test_har import *  # noqa
+
+CHARSET_RE = re.compile(r'charset=["\']?([^;"\'\s]+)', re.IGNORECASE)
+
+
+class HARAppResponse(object):
+    """
+    A response from calling an application in-process.
+    """
+
+    def __init__(self, status_code, reason, headers, content=b''):
+        """
+        Wrap the headers to be looked up case-insensitively.
+        """
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = wsgiref_headers.Headers(list(headers))
+        self.content = content
+        self.app_iter = None
+
+    @property
+    def text(self):
+        """
+        Decode the body using the charset of the content type or UTF-8.
+        """
+        match = CHARSET_RE.search(self.headers.get('Content-Type', ''))
+        return self.content.decode(
+            match.group(1) if match else 'utf-8', 'replace')
+
+    def json(self):
+        """
+        Decode the body using the JSON codec.
+        """
+        return test_har.json_codec.loads(self.content)
+
+    def iter_content(self):
+        """
+        Iterate over a streamed body and close the application iterable.
+        """
+        if self.app_iter is None:
+            yield self.content
+            return
+        try:
+            for chunk in self.app_iter:
+                yield chunk
+        finally:
+            self.app_iter.close()
+
+
+class HARAppTestCase(object):
+    """
+    Lookup the application and its responses for in-process backends.
+    """
+
+    # The application or its dotted import path, such as
+    # 'test_har_drf.wsgi.application', wrap functions in `staticmethod()`
+    har_app = None
+
+    def get_har_app(self):
+        """
+        Return the application, importing it if given as a dotted path.
+        """
+        app = self.har_app
+        if isinstance(app, str):
+            module, _, name = app.rpartition('.')
+            app = getattr(importlib.import_module(module), name)
+        return app
+
+    def get_reason(self, response):
+        """
+        Lookup the in-process response reason phrase.
+        """
+        return response.reason
+
+    def get_headers(self, req_or_resp):
+        """
+        Lookup the in-process response headers.
+        """
+        return req_or_resp.headers
+
+    def get_json(self, response):
+        """
+        Decode the response body bytes using the JSON codec.
+        """
+        return response.json()
+
+    def get_text(self, response):
+        """
+        Lookup the in-process response body text.
+        """
+        return response.text
+
+
+class HARWSGITestCase(HARAppTestCase, test_har.HARTestCase):
+    """
+    Run tests using HTTP Archive (HAR) files by calling a WSGI application.
+
+    The WSGI environ is built from the HAR request and the application is
+    called directly without sockets or HTTP parsing.
+    """
+
+    def make_wsgi_environ(self, method, url, headers, body):
+        """
+        Return the WSGI environ for the HAR request.
+        """
+        split = urllib_parse.urlsplit(url)
+        scheme = split.scheme if split.scheme in ('http', 'https') else 'http'
+        environ = {
+            'REQUEST_METHOD': method.upper(),
+            'SCRIPT_NAME': '',
+            'PATH_INFO': urllib_parse.unquote_to_bytes(
+                split.path or '/').decode('latin-1'),
+            'QUERY_STRING': split.query,
+            'SERVER_NAME': split.hostname or 'localhost',
+            'SERVER_PORT': str(
+                split.port or (443 if scheme == 'https' else 80)),
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': '127.0.0.1',
+            'HTTP_HOST': split.netloc or 'localhost',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scheme,
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': self.har_thread_safe,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in headers.items():
+            key = name.upper().replace('-', '_')
+            if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = 'HTTP_' + key
+            environ[key] = value
+        return environ
+
+    def request_har(self, method, url, data=None, headers=None, stream=False):
+        """
+        Call the WSGI application with the HAR request.
+
+        Streamed bodies are left in the application iterable to be consumed
+        by the assertions.
+        """
+        headers = headers or {}
+        body = test_har.encode_har_data(
+            data, headers.get('Content-Type'), self.JSON_MIME_TYPE_RE)
+        environ = self.make_wsgi_environ(method, url, headers, body or b'')
+
+        started = []
+        written = []
+
+        def start_response(status, response_headers, exc_info=None):
+            # Nothing has been sent so the response may always be replaced
+            started[:] = [status, response_headers]
+            return written.append
+
+        app_iter = self.get_har_app()(environ, start_response)
+        chunks = iter(app_iter)
+        if stream:
+            # The application may only start the response once iterated
+            while not started:
+                written.append(next(chunks))
+        else:
+            try:
+                written.extend(chunks)
+            finally:
+                close = getattr(app_iter, 'close', None)
+                if close is not None:
+                    close()
+
+        status, response_headers = started
+        code, _, reason = status.partition(' ')
+        response = HARAppResponse(int(code), reason, response_headers)
+        if stream:
+            response.app_iter = WSGIBody(written, chunks, app_iter)
+        else:
+            response.content = b''.join(written)
+        return response
+
+    def iter_content(self, response):
+        """
+        Iterate over the streamed WSGI response body bytes.
+        """
+        return response.iter_content()
+
+
+class WSGIBody(object):
+    """
+    The rest of a WSGI application iterable after the response started.
+    """
+
+    def __init__(self, written, chunks, app_iter):
+        """
+        Chain the chunks already written to those remaining.
+        """
+        self.written = written
+        self.chunks = chunks
+        self.app_iter = app_iter
+
+    def __iter__(self):
+        """
+        Iterate over the written and then remaining chunks.
+        """
+        for chunk in self.written:
+            yield chunk
+        for chunk in self.chunks:
+            yield chunk
+
+    def close(self):
+        """
+        Close the application iterable if it supports it.
+        """
+        close = getattr(self.app_iter, 'close', None)
+        if close is not None:
+            close()
+
+
+class HARASGITestCase(HARAppTestCase, asyncio_har.HARAsyncTestCase):
+    """
+    Run tests using HTTP Archive (HAR) files by calling an ASGI application.
+
+    The ASGI scope is built from the HAR request and the application is
+    awaited directly without sockets or HTTP parsing.
+    """
+
+    def make_asgi_scope(self, method, url, headers):
+        """
+        Return the ASGI HTTP connection scope for the HAR request.
+        """
+        split = urllib_parse.urlsplit(url)
+        scheme = split.scheme if split.scheme in ('http', 'https') else 'http'
+        headers = dict(headers)
+        headers.setdefault('Host', split.netloc or 'localhost')
+        return {
+            'type': 'http',
+            'asgi': {'version': '3.0', 'spec_version': '2.3'},
+            'http_version': '1.1',
+            'method': method.upper(),
+            'scheme': scheme,
+            'path': urllib_parse.unquote(split.path or '/'),
+            'raw_path': (split.path or '/').encode('latin-1'),
+            'query_string': split.query.encode('latin-1'),
+            'root_path': '',
+            'headers': [
+                (name.lower().encode('latin-1'), value.encode('latin-1'))
+                for name, value in headers.items()],
+            'client': ('127.0.0.1', 0),
+            'server': (
+                split.hostname or 'localhost',
+                split.port or (443 if scheme == 'https' else 80)),
+        }
+
+    async def request_har(
+            self, method, url, data=None, headers=None, stream=False):
+        """
+        Await the ASGI application with the HAR request.
+
+        Streamed bodies are hashed as they are sent and then released.
+        """
+        headers = headers or {}
+        body = test_har.encode_har_data(
+            data, headers.get('Content-Type'), self.JSON_MIME_TYPE_RE)
+        scope = self.make_asgi_scope(method, url, headers)
+        received = []
+        done = asyncio.Event()
+        started = []
+        chunks = []
+        digest = hashlib.sha256()
+        size = [0]
+
+        async def receive():
+            if not received:
+                received.append(True)
+                return dict(
+                    type='http.request', body=body or b'', more_body=False)
+            # Don't disconnect until the response is complete
+            await done.wait()
+            return dict(type='http.disconnect')
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                started.append(message)
+                return
+            chunk = message.get('body', b'')
+            if stream:
+                digest.update(chunk)
+                size[0] += len(chunk)
+            else:
+                chunks.append(chunk)
+            if not message.get('more_body', False):
+                done.set()
+
+        await self.get_har_app()(scope, receive, send)
+
+        status = started[0]['status']
+        try:
+            reason = HTTPStatus(status).phrase
+        except ValueError:
+            reason = ''
+        response = HARAppResponse(status, reason, [
+            (name.decode('latin-1'), value.decode('latin-1'))
+            for name, value in started[0].get('headers', [])],
+            b''.join(chunks))
+        if stream:
+            response.har_body_digest = (size[0], digest.hexdigest())
+        return response
+
+
+HARTestCase = HARWSGITestCase
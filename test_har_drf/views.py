@@ -26,3 +26,12 @@ class UserViewSet(viewsets.ModelViewSet):
                 content_type='text/html')
 
         return super(UserViewSet, self).create(request, *args, **kwargs)
+
+
+def download(request):
+    """
+    Stream a large binary file download.
+    """
+    return http.StreamingHttpResponse(
+        (bytes(bytearray(range(256))) * 64 for _ in range(64)),
+        content_type='application/octet-stream')